@@ -10,10 +10,23 @@ import praw
 import pandas as pd
 from datetime import datetime
 from collections import Counter
-import re
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from collection import (CollectionWindow, DedupIndex, RateLimitScheduler,
+                        fetch_listings, refresh_engagement, shard_path)
+from comment_tree import CommentBudget, collect_comments
+from corpus_io import COMMENTS_CORPUS, THEMED_CORPUS, CorpusWriter, read_corpus, write_corpus
+from keyword_matcher import keyword_regex
+from post_store import PostStore, merged_posts
+from post_stream import JsonlPostLog, StreamSummary, batched, iter_jsonl, rank_by_engagement
+from reddit_replay import client_options
+from report_writer import write_excel
+from run_manifest import RunRecorder
+from term_frequency import TermCounts, TermFrequencyEngine
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -21,8 +34,76 @@ CLIENT_ID = os.getenv('REDDIT_CLIENT_ID')
 CLIENT_SECRET = os.getenv('REDDIT_CLIENT_SECRET')
 USER_AGENT = os.getenv('REDDIT_USER_AGENT')
 
-# Verify credentials are loaded
-if not CLIENT_ID or not CLIENT_SECRET:
+# The Parquet corpus is the handoff to the analysis scripts; set
+# EXPORT_THEMED_EXCEL=1 to also write the old Excel copy for manual reading
+EXPORT_THEMED_EXCEL = os.getenv('EXPORT_THEMED_EXCEL', '0') == '1'
+
+# Incremental collection: every post seen is kept in a local SQLite index.
+# Later runs only page 'new' until they reach stored posts, re-crawl the
+# 'top' listings every FULL_CRAWL_DAYS, and refresh score/comments for posts
+# younger than REFRESH_WINDOW_DAYS. Each subreddit has its own store
+# ('{source}' in POST_STORE is replaced by the subreddit name).
+POST_STORE = os.getenv('POST_STORE', '{source}_posts.sqlite')
+FULL_CRAWL_DAYS = int(os.getenv('FULL_CRAWL_DAYS', '30'))
+REFRESH_WINDOW_DAYS = int(os.getenv('REFRESH_WINDOW_DAYS', '7'))
+
+# Communities to collect, comma-separated. Each subreddit is collected as an
+# independent shard (own store, checkpoints and SHARD_REQUESTS_PER_MINUTE
+# budget within the client's overall limit), up to SHARD_WORKERS at a time.
+# The shards are merged by submission id, the first listed subreddit winning,
+# and every output keeps a 'source' column. Names are case-insensitive, so a
+# subreddit listed twice in any spelling is one shard (the first spelling).
+SUBREDDITS = []
+for name in os.getenv('SUBREDDITS', 'CNA').split(','):
+    name = name.strip()
+    if name and name.lower() not in {known.lower() for known in SUBREDDITS}:
+        SUBREDDITS.append(name)
+SHARD_REQUESTS_PER_MINUTE = int(os.getenv('SHARD_REQUESTS_PER_MINUTE', '100'))
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '8'))
+
+# Collection window [start, end) as ISO dates; leave the end empty for "now".
+# Paging 'new' stops as soon as it passes the start date.
+COLLECTION_START = os.getenv('COLLECTION_START', '2022-01-01')
+COLLECTION_END = os.getenv('COLLECTION_END', '')
+
+# Streaming mode: set STREAM_LOG to a .jsonl path to append posts to disk as
+# they are fetched and build every export in one bounded-memory pass. All
+# substantive posts then go to Parquet instead of Excel.
+STREAM_LOG = os.getenv('STREAM_LOG', '')
+SUBSTANTIVE_CORPUS = 'all_cna_posts_substantive.parquet'
+
+# MATCH_MODE=token selects themed posts by whole words only ('app' no longer
+# matches "happy"), the same boundaries the analysis scripts use in token mode
+MATCH_MODE = os.getenv('MATCH_MODE', 'substring')
+
+# Comment collection (off by default): COLLECT_COMMENTS=themed fetches the
+# comment trees of the theme-relevant posts, COLLECT_COMMENTS=top those of
+# the COMMENT_TOP_N most-engaged posts. Each tree is expanded up to
+# COMMENT_MAX_DEPTH levels, COMMENT_MAX_PER_POST comments and
+# COMMENT_MAX_MORE extra requests, by COMMENT_WORKERS concurrent workers.
+COLLECT_COMMENTS = os.getenv('COLLECT_COMMENTS', '').lower()
+COMMENT_TOP_N = int(os.getenv('COMMENT_TOP_N', '150'))
+COMMENT_MAX_DEPTH = int(os.getenv('COMMENT_MAX_DEPTH', '8'))
+COMMENT_MAX_PER_POST = int(os.getenv('COMMENT_MAX_PER_POST', '500'))
+COMMENT_MAX_MORE = int(os.getenv('COMMENT_MAX_MORE', '10'))
+COMMENT_WORKERS = int(os.getenv('COMMENT_WORKERS', '4'))
+
+# Offline runs: REDDIT_RECORD=dir saves every raw API response fetched through
+# PRAW; REDDIT_REPLAY=dir serves a recording back with no network and no
+# credentials. In replay, REPLAY_LATENCY adds seconds per request and
+# REPLAY_RATE_LIMIT simulates Reddit's rate-limit headers for that many
+# requests per 10-minute window.
+REDDIT_RECORD = os.getenv('REDDIT_RECORD', '')
+REDDIT_REPLAY = os.getenv('REDDIT_REPLAY', '')
+REPLAY_LATENCY = float(os.getenv('REPLAY_LATENCY', '0'))
+REPLAY_RATE_LIMIT = int(os.getenv('REPLAY_RATE_LIMIT', '0'))
+
+# Verify credentials are loaded (a replay needs none)
+if REDDIT_REPLAY:
+    print(f"OK - Replaying recorded Reddit responses from {REDDIT_REPLAY}")
+    CLIENT_ID, CLIENT_SECRET = CLIENT_ID or 'replay', CLIENT_SECRET or 'replay'
+    USER_AGENT = USER_AGENT or 'care-worker-study replay'
+elif not CLIENT_ID or not CLIENT_SECRET:
     print("ERROR: Reddit API credentials not found!")
     print("Make sure you have a .env file in the repo root with:")
     print("  REDDIT_CLIENT_ID=your_id")
@@ -30,91 +111,167 @@ if not CLIENT_ID or not CLIENT_SECRET:
     print("  REDDIT_USER_AGENT=your_user_agent")
     print("\nSee .env.example for template")
     exit(1)
-
-print("OK - Credentials loaded from environment")
+else:
+    print("OK - Credentials loaded from environment")
+
+# Wall/CPU time and peak memory per phase go to a run manifest at the end
+run = RunRecorder(__file__, settings={
+    'SUBREDDITS': SUBREDDITS, 'POST_STORE': POST_STORE, 'STREAM_LOG': STREAM_LOG,
+    'SHARD_REQUESTS_PER_MINUTE': SHARD_REQUESTS_PER_MINUTE, 'MATCH_MODE': MATCH_MODE,
+    'COLLECTION_START': COLLECTION_START, 'COLLECTION_END': COLLECTION_END,
+    'FULL_CRAWL_DAYS': FULL_CRAWL_DAYS, 'REFRESH_WINDOW_DAYS': REFRESH_WINDOW_DAYS,
+    'COLLECT_COMMENTS': COLLECT_COMMENTS, 'REDDIT_RECORD': REDDIT_RECORD,
+    'REDDIT_REPLAY': REDDIT_REPLAY, 'REPLAY_LATENCY': REPLAY_LATENCY,
+    'REPLAY_RATE_LIMIT': REPLAY_RATE_LIMIT})
+
+if COLLECT_COMMENTS not in ('', 'themed', 'top'):
+    print(f"ERROR: COLLECT_COMMENTS must be 'themed' or 'top', not {COLLECT_COMMENTS!r}")
+    exit(1)
+if COMMENT_TOP_N < 1:
+    print(f"ERROR: COMMENT_TOP_N must be at least 1, not {COMMENT_TOP_N}")
+    exit(1)
 
 # Initialize Reddit connection
 print("Connecting to Reddit...")
-reddit = praw.Reddit(
-    client_id=CLIENT_ID,
-    client_secret=CLIENT_SECRET,
-    user_agent=USER_AGENT
-)
 
-# DATA COLLECTION
-
-print("Collecting posts from r/CNA...")
-subreddit = reddit.subreddit('CNA')
-posts_data = []
-
-# Collect posts from multiple time filters to maximize coverage
-time_filters = ['all', 'year']
-collected_ids = set()
-
-for time_filter in time_filters:
-    print(f"  Fetching {time_filter} posts...")
-    for post in subreddit.top(time_filter=time_filter, limit=1000):
-        # Avoid duplicates
-        if post.id in collected_ids:
-            continue
-        
-        collected_ids.add(post.id)
-        post_date = datetime.fromtimestamp(post.created_utc)
-        
-        # Filter for 2022-2024 (adjust as needed)
-        if post_date.year >= 2022:
-            posts_data.append({
-                'id': post.id,
-                'title': post.title,
-                'text': post.selftext,
-                'score': post.score,
-                'num_comments': post.num_comments,
-                'created_date': post_date,
-                'year': post_date.year,
-                'url': f"https://reddit.com{post.permalink}"
-            })
-
-# Also get recent posts
-print("  Fetching new posts...")
-for post in subreddit.new(limit=500):
-    if post.id not in collected_ids:
-        collected_ids.add(post.id)
-        post_date = datetime.fromtimestamp(post.created_utc)
-        
-        if post_date.year >= 2022:
-            posts_data.append({
-                'id': post.id,
-                'title': post.title,
-                'text': post.selftext,
-                'score': post.score,
-                'num_comments': post.num_comments,
-                'created_date': post_date,
-                'year': post_date.year,
-                'url': f"https://reddit.com{post.permalink}"
-            })
-
-# Create DataFrame
-df = pd.DataFrame(posts_data)
-df = df.sort_values('created_date', ascending=False)
-
-print(f"\nOK - Collected {len(df)} posts")
-print(f"  Date range: {df['created_date'].min().date()} to {df['created_date'].max().date()}")
-print(f"  Breakdown by year:")
-print(df['year'].value_counts().sort_index())
+# All clients share one recording (or replay source)
+reddit_options, cassette = client_options(record_dir=REDDIT_RECORD, replay_dir=REDDIT_REPLAY,
+                                          latency=REPLAY_LATENCY, rate_limit=REPLAY_RATE_LIMIT)
 
+def make_reddit():
+    """Create a Reddit client (one per listing worker)"""
+    return praw.Reddit(
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        user_agent=USER_AGENT,
+        **reddit_options
+    )
 
-# WORD FREQUENCY ANALYSIS
-
-print("\n" + "="*50)
-print("WORD FREQUENCY ANALYSIS")
-print("="*50)
+# DATA COLLECTION
 
-# Combine all text
-all_text = ' '.join(
-    df['title'].fillna('') + ' ' + df['text'].fillna('')
-).lower()
+print(f"Collecting posts from {', '.join('r/' + source for source in SUBREDDITS)}...")
+run.phase("1. Collecting posts")
 
-# Define target terms
+# Filter for 2022-2024 (adjust COLLECTION_START / COLLECTION_END as needed)
+window = CollectionWindow(
+    start=datetime.fromisoformat(COLLECTION_START) if COLLECTION_START else None,
+    end=datetime.fromisoformat(COLLECTION_END) if COLLECTION_END else None
+)
+print(f"  Collection window: {window}")
+
+def to_record(post):
+    """Convert a submission inside the collection window to a row"""
+    post_date = datetime.fromtimestamp(post.created_utc)
+    return {
+        'id': post.id,
+        'title': post.title,
+        'text': post.selftext,
+        'score': post.score,
+        'num_comments': post.num_comments,
+        'created_date': post_date,
+        'year': post_date.year,
+        'url': f"https://reddit.com{post.permalink}"
+    }
+
+# Collect posts from multiple listings to maximize coverage. The listings are
+# fetched concurrently; all workers share one rate-limit budget and one set of
+# collected ids, so a post found by several listings is only kept once.
+# Each subreddit is a shard with its own store, checkpoints and budget, and
+# the shards are crawled at the same time.
+scheduler = RateLimitScheduler()  # the client's overall budget
+
+def collect_source(source):
+    """Collect one subreddit into its own store; returns (kept, report lines)"""
+    report = []
+    store_path = shard_path(POST_STORE, source, SUBREDDITS)
+    stream_log = shard_path(STREAM_LOG, source, SUBREDDITS) if STREAM_LOG else ''
+    store = PostStore(store_path)
+    if stream_log and os.path.exists(stream_log):
+        # Any log tail a crashed run did not get into the store yet is synced
+        # first, so recovered posts are deduplicated and stop 'new' like any
+        # other stored post (a log with no checkpoint is synced whole)
+        synced, _ = store.get_checkpoint('stream_log')
+        synced = int(synced) if synced is not None else 0
+        if os.path.getsize(stream_log) > synced:
+            for batch in batched(iter_jsonl(stream_log, synced), 5000):
+                store.upsert(batch)
+            store.set_checkpoint('stream_log', os.path.getsize(stream_log))
+            report.append(f"Recovered unsynced posts from {stream_log}")
+    known_ids = store.known_ids()
+    incremental = len(known_ids) > 0
+    if incremental:
+        report.append(f"Resuming from {store_path} ({len(known_ids)} stored posts)")
+
+    def listing_is_due(name):
+        """Top listings are re-crawled only when their checkpoint is stale"""
+        _, updated = store.get_checkpoint(name)
+        return updated is None or time.time() - updated > FULL_CRAWL_DAYS * 86400
+
+    listing_jobs = [
+        ('top/all', make_reddit(), lambda r: r.subreddit(source).top(time_filter='all', limit=1000)),
+        ('top/year', make_reddit(), lambda r: r.subreddit(source).top(time_filter='year', limit=1000)),
+        ('new', make_reddit(), lambda r: r.subreddit(source).new(limit=500)),
+    ]
+    listing_jobs = [job for job in listing_jobs if job[0] == 'new' or listing_is_due(job[0])]
+    collected_ids = DedupIndex(known_ids)
+    shard_scheduler = RateLimitScheduler(SHARD_REQUESTS_PER_MINUTE, parent=scheduler)
+
+    if stream_log:
+        # Streaming mode: workers append each accepted post to an on-disk log
+        # instead of holding listings in memory
+        post_log = JsonlPostLog(stream_log)
+        on_record = post_log.write
+    else:
+        on_record = None
+
+    def save_listing(name, records):
+        """Persist each listing as soon as it finishes so a crash loses little"""
+        store.upsert(records)
+        store.set_checkpoint(name, len(records))
+
+    _, listing_stats = fetch_listings(listing_jobs, to_record, collected_ids, shard_scheduler,
+                                      stop_at={'new': known_ids},
+                                      on_listing_done=save_listing, window=window,
+                                      on_record=on_record)
+    for name, stats in listing_stats.items():
+        stopped = " (stopped early)" if stats['stopped_early'] else ""
+        report.append(f"{name}: fetched {stats['fetched']}, kept {stats['kept']} new posts, "
+                      f"{stats['discarded']} outside window{stopped}")
+
+    if stream_log:
+        post_log.close()
+        for batch in batched(iter_jsonl(stream_log, post_log.start_offset), 5000):
+            store.upsert(batch)
+        store.set_checkpoint('stream_log', os.path.getsize(stream_log))
+        report.append(f"Streamed {post_log.written} posts to {stream_log}")
+
+    # Refresh engagement for stored posts that can still gain votes/comments
+    if incremental:
+        window_start = time.time() - REFRESH_WINDOW_DAYS * 86400
+        refresh_ids = [i for i in store.ids_created_since(window_start) if i in known_ids]
+        updates = refresh_engagement(make_reddit(), refresh_ids, shard_scheduler)
+        store.update_engagement(updates)
+        report.append(f"Refreshed engagement for {len(updates)} posts from the last "
+                      f"{REFRESH_WINDOW_DAYS} days")
+    report.append(f"API requests: {shard_scheduler.requests} "
+                  f"(waited {shard_scheduler.waited:.1f}s for the shard budget)")
+    store.close()
+    return sum(stats['kept'] for stats in listing_stats.values()), report
+
+with ThreadPoolExecutor(max_workers=min(len(SUBREDDITS), SHARD_WORKERS)) as pool:
+    shard_results = list(pool.map(collect_source, SUBREDDITS))
+
+run.rows(sum(kept for kept, _ in shard_results))
+for source, (_, report) in zip(SUBREDDITS, shard_results):
+    print(f"  r/{source}:")
+    for line in report:
+        print(f"    {line}")
+print(f"  API requests: {scheduler.requests} (waited {scheduler.waited:.1f}s for rate limit)")
+if cassette is not None:
+    print(f"  Responses recorded: {cassette.recorded}, replayed: {cassette.replayed}")
+
+
+# Define target terms for the word frequency analysis
 terms_categories = {
     'Technology General': ['app', 'apps', 'phone', 'smartphone', 'software', 'digital', 'online', 'website', 'tech'],
     'Wellness Apps': ['calm', 'headspace', 'meditation', 'mindfulness', 'betterhelp', 'talkspace', 'therapy app'],
@@ -124,23 +281,93 @@ terms_categories = {
     'Quit/Leave': ['quit', 'quitting', 'leave', 'leaving', 'resign', 'walk out']
 }
 
-def count_term(text, term):
-    """Count occurrences of a term (handles multi-word phrases)"""
-    if ' ' in term:
-        # Multi-word phrase
-        return text.count(term)
-    else:
-        # Single word - use word boundaries
-        pattern = r'\b' + re.escape(term) + r'\b'
-        return len(re.findall(pattern, text))
+term_engine = TermFrequencyEngine(terms_categories)
+
+def count_terms(frame):
+    """Term totals and document frequencies over a frame of posts"""
+    # Each post is tokenized once; words and phrases are resolved together
+    texts = frame['title'].fillna('') + ' ' + frame['text'].fillna('')
+    return term_engine.count_texts(texts)
+
+def select_substantive(frame):
+    """Posts with substance (not just title), with engagement added"""
+    substantive = frame[frame['text'].str.len() > 50].copy()
+    substantive['engagement'] = substantive['score'] + substantive['num_comments']
+    return substantive
+
+# Create a filtered set for specific themes
+keywords = ['app', 'stress', 'burnout', 'quit', 'wage', 'indeed', 'schedule', 'tired', 'overwhelmed']
+pattern = keyword_regex(keywords, MATCH_MODE)
+
+def select_themed(substantive):
+    """Substantive posts mentioning any of the theme keywords"""
+    return substantive[
+        substantive['title'].str.contains(pattern, case=False, na=False) |
+        substantive['text'].str.contains(pattern, case=False, na=False)
+    ]
+
+run.phase("2. Summarizing stored posts")
+# The heap also holds the COMMENT_TOP_N posts whose comments are collected
+summary = StreamSummary(top_n=max(150, COMMENT_TOP_N if COLLECT_COMMENTS == 'top' else 0))
+term_counts = TermCounts()
+
+# The per-subreddit stores are merged on the fly: a submission already read
+# from an earlier subreddit is skipped, and every row gets its 'source'.
+# Stored posts outside the collection window (e.g. from runs with another
+# COLLECTION_START) are left out of every export
+stores = [(source, PostStore(shard_path(POST_STORE, source, SUBREDDITS)))
+          for source in SUBREDDITS]
+merge_stats = {}
+window_bounds = {'start_utc': window.start_utc, 'end_utc': window.end_utc}
+
+if STREAM_LOG:
+    # One chunked pass over the store feeds every statistic and output, so
+    # the full corpus is never loaded at once. Posts are read most engaged
+    # first, so the corpora are in the same order as the in-memory exports
+    # (02 and 03 draw their quotes from the first posts)
+    with CorpusWriter(SUBSTANTIVE_CORPUS) as substantive_writer, \
+         CorpusWriter(THEMED_CORPUS) as themed_writer:
+        for chunk in merged_posts(stores, stats=merge_stats, by_engagement=True,
+                                  **window_bounds):
+            summary.add_frame(chunk)
+            term_counts.merge(count_terms(chunk))
+            substantive = select_substantive(chunk)
+            substantive_writer.write(substantive)
+            themed_writer.write(select_themed(substantive))
+else:
+    # Create DataFrame
+    df = pd.concat(list(merged_posts(stores, stats=merge_stats, **window_bounds)), ignore_index=True)
+    df = df.sort_values('created_date', ascending=False)
+    summary.add_frame(df)
+    term_counts = count_terms(df)
+for _, store in stores:
+    store.close()
+
+run.rows(summary.count)
+
+print(f"\nOK - Collected {summary.count} posts")
+if len(SUBREDDITS) > 1:
+    print(f"  Merged {len(SUBREDDITS)} subreddits, dropped {merge_stats.get('duplicates', 0)} "
+          f"posts already collected from an earlier one")
+if summary.count:
+    print(f"  Date range: {summary.first_date.date()} to {summary.last_date.date()}")
+print(f"  Breakdown by year:")
+print(pd.Series(summary.year_counts, name='count').rename_axis('year').sort_index())
+
+
+# WORD FREQUENCY ANALYSIS
+
+print("\n" + "="*50)
+print("WORD FREQUENCY ANALYSIS")
+print("="*50)
 
 # Count all terms
 for category, terms in terms_categories.items():
     print(f"\n{category}:")
     for term in terms:
-        count = count_term(all_text, term)
+        count = term_counts.totals[term]
         if count > 0:
-            print(f"  '{term}': {count}")
+            print(f"  '{term}': {count} (in {term_counts.doc_freq[term]} posts)")
 
 
 # IDENTIFY HIGH-ENGAGEMENT POSTS FOR MANUAL REVIEW
@@ -148,34 +375,100 @@ for category, terms in terms_categories.items():
 print("\n" + "="*50)
 print("PREPARING FOR MANUAL ANALYSIS")
 print("="*50)
-
-# Filter for posts with substance (not just title)
-substantive = df[df['text'].str.len() > 50].copy()
-
-# Sort by engagement (score + comments)
-substantive['engagement'] = substantive['score'] + substantive['num_comments']
-substantive = substantive.sort_values('engagement', ascending=False)
-
-# Save different cuts for analysis
-# Top 150 most engaging posts
-top_posts = substantive.head(150)
-top_posts.to_excel('top_150_cna_posts.xlsx', index=False)
-print(f"OK - Saved top 150 most-engaged posts to 'top_150_cna_posts.xlsx'")
-
-# All substantive posts
-substantive.to_excel('all_cna_posts_substantive.xlsx', index=False)
-print(f"OK - Saved {len(substantive)} substantive posts to 'all_cna_posts_substantive.xlsx'")
-
-# Create a filtered set for specific themes
-keywords = ['app', 'stress', 'burnout', 'quit', 'wage', 'indeed', 'schedule', 'tired', 'overwhelmed']
-pattern = '|'.join(keywords)
-
-themed = substantive[
-    substantive['title'].str.contains(pattern, case=False, na=False) |
-    substantive['text'].str.contains(pattern, case=False, na=False)
-]
-themed.to_excel('themed_posts_for_analysis.xlsx', index=False)
-print(f"OK - Saved {len(themed)} theme-relevant posts to 'themed_posts_for_analysis.xlsx'")
+run.phase("3. Exporting review files")
+
+if STREAM_LOG:
+    # Top 150 most engaging posts, kept in a heap during the stream
+    ranked = pd.DataFrame(summary.top_records())
+    top_posts = ranked.head(150)
+    write_excel(top_posts, 'top_150_cna_posts.xlsx')
+    print(f"OK - Saved top 150 most-engaged posts to 'top_150_cna_posts.xlsx'")
+    print(f"OK - Saved {substantive_writer.rows} substantive posts to '{SUBSTANTIVE_CORPUS}'")
+    print(f"OK - Saved {themed_writer.rows} theme-relevant posts to '{THEMED_CORPUS}'")
+    if EXPORT_THEMED_EXCEL:
+        write_excel(read_corpus(THEMED_CORPUS), 'themed_posts_for_analysis.xlsx')
+        print(f"OK - Also exported 'themed_posts_for_analysis.xlsx' for manual review")
+else:
+    # Sort by engagement (score + comments)
+    substantive = select_substantive(df)
+    # Ties newest first, then by id: the order of the stream export and its top-N heap
+    substantive = rank_by_engagement(substantive)
+
+    # Save different cuts for analysis
+    # Top 150 most engaging posts
+    ranked = substantive
+    top_posts = ranked.head(150)
+    write_excel(top_posts, 'top_150_cna_posts.xlsx')
+    print(f"OK - Saved top 150 most-engaged posts to 'top_150_cna_posts.xlsx'")
+
+    # All substantive posts
+    write_excel(substantive, 'all_cna_posts_substantive.xlsx')
+    print(f"OK - Saved {len(substantive)} substantive posts to 'all_cna_posts_substantive.xlsx'")
+
+    themed = select_themed(substantive)
+    write_corpus(themed, THEMED_CORPUS)
+    print(f"OK - Saved {len(themed)} theme-relevant posts to '{THEMED_CORPUS}'")
+    if EXPORT_THEMED_EXCEL:
+        write_excel(themed, 'themed_posts_for_analysis.xlsx')
+        print(f"OK - Also exported 'themed_posts_for_analysis.xlsx' for manual review")
+run.output('top_150_cna_posts.xlsx',
+           SUBSTANTIVE_CORPUS if STREAM_LOG else 'all_cna_posts_substantive.xlsx',
+           THEMED_CORPUS, *(['themed_posts_for_analysis.xlsx'] if EXPORT_THEMED_EXCEL else []))
+
+
+
+# COMMENT TREES
+
+if COLLECT_COMMENTS:
+    print("\n" + "="*50)
+    print("COLLECTING COMMENTS")
+    print("="*50)
+    run.phase("4. Collecting comments")
+
+    if COLLECT_COMMENTS == 'top':
+        selected = ranked.head(COMMENT_TOP_N)[['id', 'num_comments', 'source']]
+    else:
+        selected = read_corpus(THEMED_CORPUS, columns=['id', 'num_comments', 'source'])
+    comment_counts = dict(zip(selected['id'], selected['num_comments']))
+    post_sources = dict(zip(selected['id'], selected['source']))
+
+    # Comments are kept in the store of their post's subreddit. Posts without
+    # comments cost nothing; posts whose comment count has not changed since
+    # their last fetch are not fetched again
+    stores = {source: PostStore(shard_path(POST_STORE, source, SUBREDDITS))
+              for source in SUBREDDITS}
+    seen = {}
+    for store in stores.values():
+        seen.update(store.comment_counts_seen())
+    due = [post_id for post_id, count in comment_counts.items()
+           if count > 0 and seen.get(post_id) != count]
+    print(f"  {len(due)} of {len(selected)} selected posts need their comments fetched")
+
+    def save_comments(post_id, records):
+        """Store each post's comments as soon as its tree is done"""
+        store = stores[post_sources[post_id]]
+        store.upsert_comments(records)
+        store.set_checkpoint(f"comments/{post_id}", comment_counts[post_id])
+
+    budget = CommentBudget(max_depth=COMMENT_MAX_DEPTH, max_comments=COMMENT_MAX_PER_POST,
+                           max_more_requests=COMMENT_MAX_MORE)
+    _, comment_stats = collect_comments(due, make_reddit, scheduler, budget=budget,
+                                        workers=COMMENT_WORKERS, on_post_done=save_comments)
+    comments = pd.concat([store.load_comments(selected['id']) for store in stores.values()],
+                         ignore_index=True)
+    comments['source'] = comments['post_id'].map(post_sources)
+    for store in stores.values():
+        store.close()
+
+    write_corpus(comments, COMMENTS_CORPUS)
+    run.rows(len(comments))
+    run.output(COMMENTS_CORPUS)
+    print(f"  Fetched {comment_stats['comments']} comments with {comment_stats['requests']} requests "
+          f"({comment_stats['skipped_stubs']} 'more comments' stubs left by the budget)")
+    if comment_stats['failed']:
+        print(f"  {len(comment_stats['failed'])} posts failed and will be retried next run")
+    print(f"OK - Saved {len(comments)} comments from {comments['post_id'].nunique()} posts "
+          f"to '{COMMENTS_CORPUS}'")
 
 print("\n" + "="*50)
 print("COLLECTION COMPLETE!")
@@ -185,4 +478,6 @@ print("1. Open 'top_150_cna_posts.xlsx' in Excel/Google Sheets")
 print("2. Read through posts and look for patterns")
 print("3. Copy interesting quotes (will anonymize later)")
 print("4. Note recurring themes")
-print("\nRecommended: Read at least 100-120 posts for thematic analysis")
\ No newline at end of file
+print("\nRecommended: Read at least 100-120 posts for thematic analysis")
+
+run.finish()
@@ -20,76 +20,105 @@ from collections import Counter
 import openpyxl
 from openpyxl.styles import PatternFill, Font
 from datetime import datetime
+import os
+
+from codebook import load_codebook
+from cooccurrence import group_counts, pair_table, theme_matrix
+from corpus_io import THEMED_CORPUS, corpus_columns
+from parallel_coding import ParallelCoder
+from quote_extraction import sentence_candidates, sentence_frame, sentence_pairs
+from quote_ranking import rank_quotes
+from report_writer import ExcelReport, write_excel
+from run_manifest import RunRecorder
+from sentence_index import PostSentences
+from stage_cache import (StageCache, coded_flags, compact_corpus, corpus_key, near_duplicate_table,
+                         sentence_table, subset_key)
+
+# Set CODING_WORKERS > 1 to code corpus chunks in parallel worker processes
+CODING_WORKERS = int(os.getenv('CODING_WORKERS', '1'))
+
+# MATCH_MODE=token matches whole words only (default: the codebook's mode)
+MATCH_MODE = os.getenv('MATCH_MODE') or None
+
+# NEAR_DUPLICATES=mark finds reposts and copy-pasted posts (MinHash/LSH, see
+# near_duplicates) and adds each post's cluster to the export; =collapse also
+# counts every cluster once, keeping only its canonical (earliest) post
+NEAR_DUPLICATES = os.getenv('NEAR_DUPLICATES', '').lower() or None
+
+# QUOTE_RANKING=representative orders quote candidates by similarity to their
+# theme (TF-IDF centroid) with near-repeats pushed down, instead of by
+# engagement (see quote_ranking)
+QUOTE_RANKING = os.getenv('QUOTE_RANKING', 'engagement').lower()
 
 print("="*60)
 print("THEMATIC CODING ANALYSIS")
 print("="*60)
 
+# Wall/CPU time and peak memory per phase go to a run manifest at the end
+run = RunRecorder(__file__, settings={'CODING_WORKERS': CODING_WORKERS, 'MATCH_MODE': MATCH_MODE,
+                                      'NEAR_DUPLICATES': NEAR_DUPLICATES,
+                                      'QUOTE_RANKING': QUOTE_RANKING,
+                                      'CODEBOOK': os.getenv('CODEBOOK', 'care_work_themes')})
+
+if QUOTE_RANKING not in ('engagement', 'representative'):
+    print(f"ERROR: QUOTE_RANKING must be 'engagement' or 'representative', not {QUOTE_RANKING!r}")
+    exit(1)
+
 # LOAD DATA
 
 print("\n1. Loading data...")
-df = pd.read_excel('themed_posts_for_analysis.xlsx')
-print(f"   Loaded {len(df)} themed posts")
-
-# Combine title and text for analysis
-df['full_text'] = df['title'].fillna('') + ' ' + df['text'].fillna('')
-df['full_text_lower'] = df['full_text'].str.lower()
+run.phase("1. Loading data")
+# Title and text are joined and lowercased into one text buffer per corpus;
+# normalization, coding and sentence splitting are cached by content hash.
+# Strings stay in Arrow buffers and category flags are packed into a bitset
+# (see compact_corpus); DataFrames are built only for the rows a step needs
+stage_cache = StageCache()
+corpus = corpus_key(THEMED_CORPUS)
+# Corpora collected from several subreddits carry a 'source' column
+source_columns = [c for c in ['source'] if c in corpus_columns(THEMED_CORPUS)]
+posts = compact_corpus(THEMED_CORPUS, columns=['id', 'title', 'text', 'score', 'num_comments',
+                                               'created_date', 'engagement'] + source_columns,
+                       cache=stage_cache)
+print(f"   Loaded {len(posts)} themed posts")
+
+duplicate_columns = []
+if NEAR_DUPLICATES:
+    if NEAR_DUPLICATES not in ('mark', 'collapse'):
+        print(f"ERROR: NEAR_DUPLICATES must be 'mark' or 'collapse', not {NEAR_DUPLICATES!r}")
+        exit(1)
+    clusters = near_duplicate_table(posts, corpus, cache=stage_cache)
+    canonical = clusters['dup_canonical']
+    print(f"   Near-duplicates: {int((~canonical).sum())} posts repeat one of "
+          f"{int((canonical & (clusters['dup_cluster_size'] > 1)).sum())} earlier posts")
+    duplicate_columns = ['dup_canonical_id', 'dup_cluster_size']
+    posts.frame[duplicate_columns] = clusters[duplicate_columns]
+    if NEAR_DUPLICATES == 'collapse':
+        # Coding and sentence caches are keyed by the canonical subset
+        posts = posts.take(canonical)
+        corpus = subset_key(corpus, canonical)
+        print(f"   Counting each cluster once: {len(posts)} posts")
+run.rows(len(posts))
 
 
 # DEFINE CODING CATEGORIES
-# Define coding categories based on preliminary observations and research questions
-# Each category represents a distinct theme in care worker discourse
-
-categories = {
-    'wellness_app_mentioned': {
-        'keywords': ['calm', 'headspace', 'meditation app', 'betterhelp', 'talkspace', 
-                     'mindfulness', 'wellness app', 'self-care app', 'therapy app',
-                     'insight timer', 'gratitude journal', 'mental health app'],
-        'description': 'Mentions wellness/mental health apps'
-    },
-    'wellness_app_abandoned': {
-        'keywords': ['never use', 'never open', 'don\'t use', 'downloaded but', 
-                     'sitting on my phone', 'never log in', 'forgot about',
-                     'too tired to use', 'no time to use', 'haven\'t opened'],
-        'description': 'Discusses not using wellness apps',
-        'requires': 'wellness_app_mentioned'  # Only flag if app is mentioned
-    },
-    'job_search_tech': {
-        'keywords': ['indeed', 'job search', 'looking for another job', 'applying',
-                     'job application', 'resume', 'interview', 'better paying',
-                     'new job', 'quit', 'leaving this job'],
-        'description': 'Technology use for job searching'
-    },
-    'scheduling_issues': {
-        'keywords': ['schedule', 'scheduling', 'shift', 'overtime', 'mandatory',
-                     'call in', 'call out', 'short staffed', 'understaffed',
-                     'double shift', 'no break', 'can\'t take break'],
-        'description': 'Work schedule and time issues'
-    },
-    'pay_financial_stress': {
-        'keywords': ['pay', 'wage', 'salary', 'money', 'afford', 'bills', 'rent',
-                     'broke', 'underpaid', 'minimum wage', 'low pay', 'poor',
-                     'financial', 'second job', 'side gig'],
-        'description': 'Financial stress and low wages'
-    },
-    'burnout_exhaustion': {
-        'keywords': ['burnout', 'burned out', 'exhausted', 'tired', 'drained',
-                     'can\'t do this', 'overwhelming', 'too much', 'breaking down',
-                     'mental health', 'depressed', 'anxiety', 'stressed'],
-        'description': 'Expressions of burnout and exhaustion'
-    },
-    'peer_support_seeking': {
-        'keywords': ['does anyone else', 'am i the only', 'how do you', 'anyone have',
-                     'need advice', 'what should i do', 'help', 'is this normal'],
-        'description': 'Seeking support from community'
-    },
-    'employer_program': {
-        'keywords': ['eap', 'employee assistance', 'wellness program', 
-                     'company offered', 'employer provided', 'work program',
-                     'benefits', 'mental health benefit'],
-        'description': 'Mentions employer wellness programs'
-    }
-}
+# Coding categories are based on preliminary observations and research questions
+# Each category represents a distinct theme in care worker discourse. They are
+# kept in a versioned codebook file (code/codebooks/care_work_themes.yaml);
+# set CODEBOOK to a name or path to code the corpus with another variant.
+
+codebook = load_codebook(os.getenv('CODEBOOK', 'care_work_themes'))
+categories = codebook.categories
+
+# The patterns, review lists and quote passes below are written for these
+# categories, so a codebook variant has to keep them
+REPORT_CATEGORIES = ['wellness_app_mentioned', 'wellness_app_abandoned', 'job_search_tech',
+                     'scheduling_issues', 'pay_financial_stress', 'burnout_exhaustion',
+                     'peer_support_seeking', 'employer_program']
+missing_categories = codebook.missing(REPORT_CATEGORIES)
+if missing_categories:
+    print(f"ERROR: codebook {codebook} lacks categories this script reports on: "
+          f"{', '.join(missing_categories)}")
+    exit(1)
 
 
 # AUTOMATED CATEGORIZATION
@@ -98,59 +127,78 @@ categories = {
 # This is intentionally conservative - flags posts for manual review rather than final classification
 
 print("\n2. Categorizing posts...")
-
-for category_name, category_info in categories.items():
-    df[category_name] = False
-    
-    for keyword in category_info['keywords']:
-        # Case-insensitive search
-        mask = df['full_text_lower'].str.contains(keyword, na=False, regex=False)
-        df.loc[mask, category_name] = True
-    
-    # Check for dependency
-    if 'requires' in category_info:
-        required_category = category_info['requires']
-        # Only mark as True if the required category is also True
-        df.loc[~df[required_category], category_name] = False
-    
-    count = df[category_name].sum()
-    percentage = (count / len(df)) * 100
+run.phase("2. Categorizing posts", rows=len(posts))
+
+# One scan per post for all categories (case-insensitive via the lowercased text);
+# the compiled matcher is cached on disk by codebook hash
+matcher = codebook.matcher(mode=MATCH_MODE)
+print(f"   Codebook: {codebook}, {matcher.mode} matching")
+coder = ParallelCoder(matcher, workers=CODING_WORKERS) if CODING_WORKERS > 1 else None
+# Dependency rules ('requires') are resolved for all categories at once
+posts.add_flags(coded_flags(codebook, matcher, posts.lower, corpus, coder=coder,
+                            cache=stage_cache))
+
+for category_name in categories:
+    count = posts[category_name].sum()
+    percentage = (count / len(posts)) * 100
     print(f"   {category_name}: {count} posts ({percentage:.1f}%)")
 
+# Category rates per community when posts come from several subreddits
+by_source = None
+if source_columns and posts['source'].nunique() > 1:
+    category_names = list(categories.keys())
+    by_source = group_counts(theme_matrix(posts.flags.unpack(category_names)), category_names,
+                             posts['source'])
+    by_source = by_source.rename(columns={'group': 'source', 'theme': 'category'})
+    print("\n   By source (% of that subreddit's posts):")
+    for source, part in by_source.groupby('source'):
+        top = part.nlargest(3, 'count')
+        print(f"   r/{source} ({part['posts'].iloc[0]} posts): " +
+              ", ".join(f"{row.category} {row.percentage:.1f}%" for row in top.itertuples()))
+
 
 # EXTRACT POTENTIAL QUOTES
 
 print("\n3. Extracting potential quotes...")
+run.phase("3. Extracting potential quotes", rows=len(posts))
 
-def extract_sentences(text, max_length=200):
-    """Extract sentences that might be good quotes"""
+def extract_sentence_pairs(text, max_length=200):
+    """Extract (sentence, lowercase sentence) pairs that might be good quotes"""
     if pd.isna(text) or text == '':
         return []
     
-    # Split into sentences (rough)
-    sentences = re.split(r'[.!?]+', text)
-    
-    # Clean and filter
-    good_sentences = []
-    for sent in sentences:
-        sent = sent.strip()
-        # Keep sentences that are 20-200 chars and contain meaningful content
-        if 20 < len(sent) < max_length and not sent.lower().startswith(('http', 'www')):
-            good_sentences.append(sent)
-    
-    return good_sentences
-
-# Extract quotes for posts with wellness app mentions
-df['potential_quotes'] = df['full_text'].apply(extract_sentences)
+    # Split into sentences (rough), then clean and filter
+    return sentence_pairs(PostSentences(text), max_length)
+
+def split_sentences():
+    """All candidate sentences as one frame; the quote passes below are column masks
+
+    Posts are segmented a chunk at a time, so only one chunk's full_text and
+    sentence lists exist at once.
+    """
+    frames = []
+    for chunk in posts.chunks(['id', 'score', 'num_comments', 'full_text']):
+        if coder is not None:
+            pairs = coder.sentence_pairs(chunk['full_text'])
+        else:
+            pairs = [extract_sentence_pairs(text) for text in chunk['full_text']]
+        frames.append(sentence_frame(chunk.assign(potential_quotes=pairs)))
+    return pd.concat(frames, ignore_index=True)
+
+sentences = sentence_table(split_sentences, corpus, cache=stage_cache,
+                           helpers=[extract_sentence_pairs])
+if coder is not None:
+    coder.close()
 
 
 # IDENTIFY KEY PATTERNS
 
 print("\n4. Identifying key patterns...")
+run.phase("4. Identifying key patterns", rows=len(posts))
 
 # Pattern 1: App Adoption-Abandonment
-apps_mentioned = df['wellness_app_mentioned'].sum()
-apps_abandoned = df['wellness_app_abandoned'].sum()
+apps_mentioned = posts['wellness_app_mentioned'].sum()
+apps_abandoned = posts['wellness_app_abandoned'].sum()
 if apps_mentioned > 0:
     abandonment_rate = (apps_abandoned / apps_mentioned) * 100
     print(f"\n   PATTERN 1: App Adoption-Abandonment Gap")
@@ -159,25 +207,25 @@ if apps_mentioned > 0:
     print(f"   - Abandonment rate: {abandonment_rate:.0f}%")
 
 # Pattern 2: Job Search vs Wellness Apps
-job_search = df['job_search_tech'].sum()
+job_search = posts['job_search_tech'].sum()
 print(f"\n   PATTERN 2: Job Search as Active Tech Use")
 print(f"   - Job search mentions: {job_search} posts")
 print(f"   - Ratio (job search / wellness apps): {job_search/apps_mentioned:.1f}x" if apps_mentioned > 0 else "")
 
 # Pattern 3: Peer Support
-peer_support = df['peer_support_seeking'].sum()
+peer_support = posts['peer_support_seeking'].sum()
 print(f"\n   PATTERN 3: Peer Support Seeking")
 print(f"   - Support-seeking posts: {peer_support} posts")
-print(f"   - Percentage of sample: {(peer_support/len(df))*100:.1f}%")
+print(f"   - Percentage of sample: {(peer_support/len(posts))*100:.1f}%")
 
 # Pattern 4: Economic Precarity
-financial = df['pay_financial_stress'].sum()
+financial = posts['pay_financial_stress'].sum()
 print(f"\n   PATTERN 4: Economic Precarity")
 print(f"   - Financial stress mentions: {financial} posts")
 
 # Pattern 5: Time Poverty
-scheduling = df['scheduling_issues'].sum()
-burnout = df['burnout_exhaustion'].sum()
+scheduling = posts['scheduling_issues'].sum()
+burnout = posts['burnout_exhaustion'].sum()
 print(f"\n   PATTERN 5: Time Poverty & Burnout")
 print(f"   - Scheduling issues: {scheduling} posts")
 print(f"   - Burnout/exhaustion: {burnout} posts")
@@ -186,27 +234,33 @@ print(f"   - Burnout/exhaustion: {burnout} posts")
 # CREATE PRIORITY REVIEW LIST
 
 print("\n5. Creating priority review lists...")
+run.phase("5. Creating priority review lists")
 
 # High-priority posts for manual review
 priority_posts = []
+priority_columns = ['id', 'title', 'text', 'score', 'num_comments', 'engagement',
+                    'wellness_app_mentioned', 'wellness_app_abandoned', 'job_search_tech',
+                    'burnout_exhaustion', 'peer_support_seeking']
 
 # Posts with wellness app abandonment (key pattern)
-abandonment_posts = df[df['wellness_app_abandoned']].copy()
+abandonment_posts = posts.select(priority_columns, posts['wellness_app_abandoned'])
 abandonment_posts['priority_reason'] = 'Wellness app abandonment'
 priority_posts.append(abandonment_posts)
 
 # Posts mentioning both job search AND wellness topics
-both_posts = df[df['job_search_tech'] & (df['wellness_app_mentioned'] | df['burnout_exhaustion'])].copy()
+both_posts = posts.select(priority_columns, posts['job_search_tech'] &
+                          (posts['wellness_app_mentioned'] | posts['burnout_exhaustion']))
 both_posts['priority_reason'] = 'Job search + wellness/burnout'
 priority_posts.append(both_posts)
 
 # High-engagement peer support posts
-high_engagement = df[df['peer_support_seeking'] & (df['score'] + df['num_comments'] > 20)].copy()
+high_engagement = posts.select(priority_columns, posts['peer_support_seeking'] &
+                               (posts['score'] + posts['num_comments'] > 20))
 high_engagement['priority_reason'] = 'High-engagement peer support'
 priority_posts.append(high_engagement)
 
 # Posts mentioning employer programs (rare but interesting)
-employer_posts = df[df['employer_program']].copy()
+employer_posts = posts.select(priority_columns, posts['employer_program'])
 employer_posts['priority_reason'] = 'Employer program mentioned'
 priority_posts.append(employer_posts)
 
@@ -216,21 +270,23 @@ priority_df = priority_df.drop_duplicates(subset=['id'])
 priority_df = priority_df.sort_values('engagement', ascending=False)
 
 print(f"   Created priority review list: {len(priority_df)} posts")
+run.rows(len(priority_df))
 
 
 # EXPORT RESULTS
 
 print("\n6. Exporting results...")
+run.phase("6. Exporting results", rows=len(posts))
 
 # Create Excel workbook with multiple sheets
 output_file = 'thematic_coding_results.xlsx'
 
-with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+with ExcelReport(output_file) as report:
     # Sheet 1: Summary Statistics
     summary_data = []
     for cat_name, cat_info in categories.items():
-        count = df[cat_name].sum()
-        percentage = (count / len(df)) * 100
+        count = posts[cat_name].sum()
+        percentage = (count / len(posts)) * 100
         summary_data.append({
             'Category': cat_name,
             'Description': cat_info['description'],
@@ -239,7 +295,7 @@ with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
         })
     
     summary_df = pd.DataFrame(summary_data)
-    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+    report.add_sheet('Summary', summary_df)
     
     # Sheet 2: Pattern Analysis
     patterns_data = [
@@ -252,96 +308,84 @@ with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
          'Vs_Wellness': f"{job_search/apps_mentioned:.1f}x more" if apps_mentioned > 0 else "N/A"},
         {'Pattern': 'Peer Support Seeking',
          'Count': peer_support,
-         'Percentage': f"{(peer_support/len(df))*100:.1f}%"},
+         'Percentage': f"{(peer_support/len(posts))*100:.1f}%"},
         {'Pattern': 'Economic Precarity Focus',
          'Count': financial,
-         'Percentage': f"{(financial/len(df))*100:.1f}%"},
+         'Percentage': f"{(financial/len(posts))*100:.1f}%"},
         {'Pattern': 'Time Poverty & Burnout',
          'Scheduling': scheduling,
          'Burnout': burnout}
     ]
     patterns_df = pd.DataFrame(patterns_data)
-    patterns_df.to_excel(writer, sheet_name='Patterns', index=False)
+    report.add_sheet('Patterns', patterns_df)
     
     # Sheet 3: Priority Posts for Manual Review
     review_columns = ['id', 'title', 'text', 'score', 'num_comments', 'engagement',
                      'priority_reason', 'wellness_app_mentioned', 'wellness_app_abandoned',
                      'job_search_tech', 'burnout_exhaustion', 'peer_support_seeking']
-    priority_df[review_columns].to_excel(writer, sheet_name='Priority_Review', index=False)
+    report.add_sheet('Priority_Review', priority_df[review_columns])
     
     # Sheet 4: Wellness App Posts (for quote extraction)
-    wellness_posts = df[df['wellness_app_mentioned']].copy()
     wellness_columns = ['id', 'title', 'text', 'score', 'num_comments',
                        'wellness_app_abandoned', 'job_search_tech', 'burnout_exhaustion']
-    wellness_posts[wellness_columns].to_excel(writer, sheet_name='Wellness_App_Posts', index=False)
+    wellness_posts = posts.select(wellness_columns, posts['wellness_app_mentioned'])
+    report.add_sheet('Wellness_App_Posts', wellness_posts)
     
     # Sheet 5: Job Search Posts
-    job_posts = df[df['job_search_tech']].copy()
     job_columns = ['id', 'title', 'text', 'score', 'num_comments', 'burnout_exhaustion']
-    job_posts[job_columns].to_excel(writer, sheet_name='Job_Search_Posts', index=False)
+    job_posts = posts.select(job_columns, posts['job_search_tech'])
+    report.add_sheet('Job_Search_Posts', job_posts)
+    
+    # Sheet 6-7: Co-occurrence of every category pair (overall and by year)
+    category_names = list(categories.keys())
+    category_matrix = theme_matrix(posts.flags.unpack(category_names))
+    report.add_sheet('Category_Pairs', pair_table(category_matrix, category_names))
+    pairs_by_year = pair_table(category_matrix, category_names,
+                               groups=posts['created_date'].dt.year)
+    report.add_sheet('Category_Pairs_By_Year', pairs_by_year.rename(columns={'group': 'year'}))
+    if by_source is not None:
+        report.add_sheet('Categories_By_Source', by_source)
     
-    # Sheet 6: All Posts with Categories
-    export_columns = ['id', 'title', 'text', 'score', 'num_comments', 'created_date'] + list(categories.keys())
-    df[export_columns].to_excel(writer, sheet_name='All_Coded_Posts', index=False)
+    # Sheet 8: All Posts with Categories (full text in a sidecar if REPORT_SIDECAR is set)
+    export_columns = (['id'] + source_columns + ['title', 'text', 'score', 'num_comments', 'created_date']
+                      + duplicate_columns + list(categories.keys()))
+    report.add_sheet('All_Coded_Posts', posts.select(export_columns), sidecar_columns=['text'])
 
 print(f"   ✓ Results saved to: {output_file}")
+run.output(output_file, *report.sidecars)
 
 
 # GENERATE QUOTE CANDIDATES
 
 print("\n7. Extracting quote candidates...")
-
-quote_candidates = []
-
-# From wellness app abandonment posts
-for idx, row in df[df['wellness_app_abandoned']].iterrows():
-    sentences = extract_sentences(row['full_text'])
-    for sent in sentences:
-        sent_lower = sent.lower()
-        # Look for sentences that mention both apps and non-use
-        if any(word in sent_lower for word in ['calm', 'headspace', 'app']) and \
-           any(word in sent_lower for word in ['never', 'don\'t', 'haven\'t', 'tired', 'time']):
-            quote_candidates.append({
-                'post_id': row['id'],
-                'category': 'wellness_app_abandoned',
-                'quote': sent,
-                'score': row['score'],
-                'engagement': row['score'] + row['num_comments']
-            })
-
-# From job search posts
-for idx, row in df[df['job_search_tech']].iterrows():
-    sentences = extract_sentences(row['full_text'])
-    for sent in sentences:
-        sent_lower = sent.lower()
-        if 'indeed' in sent_lower or 'job' in sent_lower or 'pay' in sent_lower:
-            quote_candidates.append({
-                'post_id': row['id'],
-                'category': 'job_search',
-                'quote': sent,
-                'score': row['score'],
-                'engagement': row['score'] + row['num_comments']
-            })
-
-# From burnout posts
-for idx, row in df[df['burnout_exhaustion']].head(50).iterrows():
-    sentences = extract_sentences(row['full_text'])
-    for sent in sentences[:2]:  # Just first 2 sentences
-        sent_lower = sent.lower()
-        if any(word in sent_lower for word in ['tired', 'exhausted', 'burnout', 'can\'t']):
-            quote_candidates.append({
-                'post_id': row['id'],
-                'category': 'burnout',
-                'quote': sent,
-                'score': row['score'],
-                'engagement': row['score'] + row['num_comments']
-            })
+run.phase("7. Extracting quote candidates")
+
+quote_candidates = [
+    # From wellness app abandonment posts:
+    # sentences that mention both apps and non-use
+    sentence_candidates(sentences, posts['wellness_app_abandoned'], 'wellness_app_abandoned',
+                        [['calm', 'headspace', 'app'],
+                         ['never', 'don\'t', 'haven\'t', 'tired', 'time']],
+                        mode=matcher.mode),
+    # From job search posts
+    sentence_candidates(sentences, posts['job_search_tech'], 'job_search',
+                        [['indeed', 'job', 'pay']], mode=matcher.mode),
+    # From burnout posts (first 50 posts, just first 2 sentences)
+    sentence_candidates(sentences, posts['burnout_exhaustion'], 'burnout',
+                        [['tired', 'exhausted', 'burnout', 'can\'t']],
+                        first_n_posts=50, first_n_sentences=2, mode=matcher.mode),
+]
 
 # Save quote candidates
-quotes_df = pd.DataFrame(quote_candidates)
+quotes_df = pd.concat(quote_candidates, ignore_index=True)
 quotes_df = quotes_df.sort_values('engagement', ascending=False)
 quotes_df = quotes_df.drop_duplicates(subset=['quote'])
-quotes_df.to_excel('quote_candidates.xlsx', index=False)
+if QUOTE_RANKING == 'representative':
+    # Per category: typical sentences first, each repeat after the first pushed down
+    quotes_df = rank_quotes(quotes_df)
+write_excel(quotes_df, 'quote_candidates.xlsx')
+run.rows(len(quotes_df))
+run.output('quote_candidates.xlsx')
 
 print(f"   ✓ Extracted {len(quotes_df)} quote candidates")
 print(f"   ✓ Saved to: quote_candidates.xlsx")
@@ -352,13 +396,15 @@ print(f"   ✓ Saved to: quote_candidates.xlsx")
 print("\n" + "="*60)
 print("ANALYSIS COMPLETE!")
 print("="*60)
-print(f"\nDataset: {len(df)} posts analyzed")
+print(f"\nDataset: {len(posts)} posts analyzed")
 print(f"\nKey Files Created:")
-print(f"  1. thematic_coding_results.xlsx - Full analysis with 6 sheets")
+print(f"  1. thematic_coding_results.xlsx - Full analysis with {len(report.sheets)} sheets")
 print(f"  2. quote_candidates.xlsx - {len(quotes_df)} potential quotes")
 print(f"\nNext Steps:")
 print(f"  1. Review 'Priority_Review' sheet ({len(priority_df)} posts)")
 print(f"  2. Select best quotes from 'quote_candidates.xlsx'")
 print(f"  3. Read high-engagement posts for context")
 print(f"  4. Document patterns in your preliminary findings")
-print("\n" + "="*60)
\ No newline at end of file
+print("\n" + "="*60)
+
+run.finish()
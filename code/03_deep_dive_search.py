@@ -1,104 +1,122 @@
 import pandas as pd
 import re
 from collections import Counter
+import os
+
+from codebook import load_codebook
+from cooccurrence import cooccurrence_tables, group_counts, pair_table, theme_matrix
+from corpus_io import COMMENTS_CORPUS, THEMED_CORPUS, corpus_columns, read_corpus
+from parallel_coding import ParallelCoder
+from quote_extraction import context_quote, context_quote_candidates
+from quote_ranking import rank_quotes
+from report_writer import ExcelReport
+from run_manifest import RunRecorder
+from sentence_index import SentenceIndex
+from stage_cache import StageCache, coded_flags, compact_corpus, corpus_key, near_duplicate_table, subset_key
+from term_frequency import TermFrequencyEngine, substring_totals
+
+# Set CODING_WORKERS > 1 to code corpus chunks in parallel worker processes
+CODING_WORKERS = int(os.getenv('CODING_WORKERS', '1'))
+
+# MATCH_MODE=token matches whole words only (default: the codebook's mode)
+MATCH_MODE = os.getenv('MATCH_MODE') or None
+
+# NEAR_DUPLICATES=mark finds reposts and copy-pasted posts (MinHash/LSH, see
+# near_duplicates) and adds each post's cluster to the export; =collapse also
+# counts every cluster once, keeping only its canonical (earliest) post
+NEAR_DUPLICATES = os.getenv('NEAR_DUPLICATES', '').lower() or None
+
+# QUOTE_RANKING=representative orders quote candidates by similarity to their
+# theme (TF-IDF centroid) with near-repeats pushed down, instead of by
+# engagement (see quote_ranking)
+QUOTE_RANKING = os.getenv('QUOTE_RANKING', 'engagement').lower()
 
 print("="*60)
 print("DEEP DIVE: STRESS & MENTAL HEALTH DISCOURSE")
 print("="*60)
 
+# Wall/CPU time and peak memory per phase go to a run manifest at the end
+run = RunRecorder(__file__, settings={
+    'CODING_WORKERS': CODING_WORKERS, 'MATCH_MODE': MATCH_MODE, 'NEAR_DUPLICATES': NEAR_DUPLICATES,
+    'QUOTE_RANKING': QUOTE_RANKING,
+    'DEEP_DIVE_CODEBOOK': os.getenv('DEEP_DIVE_CODEBOOK', 'stress_mental_health')})
+
+if QUOTE_RANKING not in ('engagement', 'representative'):
+    print(f"ERROR: QUOTE_RANKING must be 'engagement' or 'representative', not {QUOTE_RANKING!r}")
+    exit(1)
+
 # ============================================
 # LOAD DATA
 # ============================================
 print("\n1. Loading data...")
-df = pd.read_excel('themed_posts_for_analysis.xlsx')
-print(f"   Loaded {len(df)} themed posts")
-
-df['full_text'] = df['title'].fillna('') + ' ' + df['text'].fillna('')
-df['full_text_lower'] = df['full_text'].str.lower()
+run.phase("1. Loading data")
+# Normalized text and coded flags come from the stage cache when the corpus
+# and codebook are unchanged (normalization is shared with 02); the corpus
+# is held in compact form, with pattern flags packed into a bitset
+stage_cache = StageCache()
+corpus = corpus_key(THEMED_CORPUS)
+source_columns = [c for c in ['source'] if c in corpus_columns(THEMED_CORPUS)]
+posts = compact_corpus(THEMED_CORPUS, columns=['id', 'title', 'text', 'score', 'num_comments', 'year',
+                                               'created_date'] + source_columns, cache=stage_cache)
+print(f"   Loaded {len(posts)} themed posts")
+
+duplicate_columns = []
+if NEAR_DUPLICATES:
+    if NEAR_DUPLICATES not in ('mark', 'collapse'):
+        print(f"ERROR: NEAR_DUPLICATES must be 'mark' or 'collapse', not {NEAR_DUPLICATES!r}")
+        exit(1)
+    clusters = near_duplicate_table(posts, corpus, cache=stage_cache)
+    canonical = clusters['dup_canonical']
+    print(f"   Near-duplicates: {int((~canonical).sum())} posts repeat one of "
+          f"{int((canonical & (clusters['dup_cluster_size'] > 1)).sum())} earlier posts")
+    duplicate_columns = ['dup_canonical_id', 'dup_cluster_size']
+    posts.frame[duplicate_columns] = clusters[duplicate_columns]
+    if NEAR_DUPLICATES == 'collapse':
+        # Coding and sentence caches are keyed by the canonical subset
+        posts = posts.take(canonical)
+        corpus = subset_key(corpus, canonical)
+        print(f"   Counting each cluster once: {len(posts)} posts")
+run.rows(len(posts))
 
 # ============================================
 # DEFINE SEARCH PATTERNS
 # ============================================
 
-search_patterns = {
-    'stress_general': {
-        'keywords': ['stress', 'stressed', 'stressful', 'stress out', 'so stressed'],
-        'description': 'General stress mentions'
-    },
-    'mental_health_explicit': {
-        'keywords': ['mental health', 'mental illness', 'therapy', 'therapist', 
-                     'counseling', 'counselor', 'psychiatrist', 'medication',
-                     'antidepressant', 'anxiety medication'],
-        'description': 'Explicit mental health / professional help'
-    },
-    'mental_health_conditions': {
-        'keywords': ['depression', 'depressed', 'anxiety', 'anxious', 'panic attack',
-                     'ptsd', 'trauma', 'suicidal', 'mental breakdown'],
-        'description': 'Mental health conditions mentioned'
-    },
-    'emotional_exhaustion': {
-        'keywords': ['exhausted', 'drained', 'can\'t do this', 'breaking down',
-                     'falling apart', 'losing it', 'at my limit', 'can\'t take it'],
-        'description': 'Emotional/psychological exhaustion'
-    },
-    'physical_symptoms': {
-        'keywords': ['can\'t sleep', 'insomnia', 'nightmares', 'crying',
-                     'panic', 'shaking', 'heart racing', 'nausea'],
-        'description': 'Physical manifestations of stress'
-    },
-    'coping_mentioned': {
-        'keywords': ['cope', 'coping', 'deal with', 'handle', 'manage',
-                     'get through', 'survive', 'make it through'],
-        'description': 'Discussing coping strategies'
-    },
-    'self_care_language': {
-        'keywords': ['self care', 'self-care', 'take care of myself', 
-                     'need to relax', 'need a break', 'time for myself'],
-        'description': 'Self-care language (not app-specific)'
-    },
-    'social_support': {
-        'keywords': ['talk to', 'vent', 'rant', 'need to talk', 'listening',
-                     'support', 'relate', 'same', 'me too', 'you\'re not alone'],
-        'description': 'Social support seeking/giving'
-    },
-    'substance_coping': {
-        'keywords': ['drink', 'drinking', 'alcohol', 'wine', 'beer', 'weed', 
-                     'marijuana', 'smoke', 'vape'],
-        'description': 'Substance use as coping'
-    },
-    'exercise_hobbies': {
-        'keywords': ['exercise', 'workout', 'gym', 'run', 'running', 'walk',
-                     'yoga', 'hobby', 'hobbies', 'netflix', 'music', 'reading'],
-        'description': 'Exercise and hobbies as coping'
-    },
-    'leave_quit': {
-        'keywords': ['quit', 'quitting', 'leave', 'leaving', 'resign',
-                     'last day', 'walked out', 'new job', 'better job'],
-        'description': 'Leaving as stress response'
-    },
-    'no_solution': {
-        'keywords': ['nothing helps', 'tried everything', 'no point',
-                     'what\'s the point', 'hopeless', 'giving up'],
-        'description': 'Expressions of hopelessness'
-    }
-}
+# Patterns are kept in a versioned codebook file
+# (code/codebooks/stress_mental_health.yaml); set DEEP_DIVE_CODEBOOK to a
+# name or path to search with another variant
+codebook = load_codebook(os.getenv('DEEP_DIVE_CODEBOOK', 'stress_mental_health'))
+search_patterns = codebook.categories
+
+# The co-occurrence, coping and quote sections and the summary below are
+# written for these patterns, so a codebook variant has to keep them
+REPORT_PATTERNS = ['stress_general', 'mental_health_explicit', 'mental_health_conditions',
+                   'emotional_exhaustion', 'coping_mentioned', 'social_support',
+                   'substance_coping', 'exercise_hobbies', 'leave_quit', 'no_solution']
+missing_patterns = codebook.missing(REPORT_PATTERNS)
+if missing_patterns:
+    print(f"ERROR: codebook {codebook} lacks patterns this script reports on: "
+          f"{', '.join(missing_patterns)}")
+    exit(1)
 
 # ============================================
 # SEARCH AND CATEGORIZE
 # ============================================
 print("\n2. Searching for stress & mental health patterns...")
+run.phase("2. Searching for patterns", rows=len(posts))
 
 results = {}
 
+# One scan per post for all patterns, with the compiled matcher cached on disk
+matcher = codebook.matcher(mode=MATCH_MODE)
+print(f"   Codebook: {codebook}, {matcher.mode} matching")
+coder = ParallelCoder(matcher, workers=CODING_WORKERS) if CODING_WORKERS > 1 else None
+posts.add_flags(coded_flags(codebook, matcher, posts.lower, corpus, coder=coder,
+                            cache=stage_cache))
+
 for pattern_name, pattern_info in search_patterns.items():
-    df[pattern_name] = False
-    
-    for keyword in pattern_info['keywords']:
-        mask = df['full_text_lower'].str.contains(keyword, na=False, regex=False)
-        df.loc[mask, pattern_name] = True
-    
-    count = df[pattern_name].sum()
-    percentage = (count / len(df)) * 100
+    count = posts[pattern_name].sum()
+    percentage = (count / len(posts)) * 100
     results[pattern_name] = {
         'count': count,
         'percentage': percentage,
@@ -106,12 +124,52 @@ for pattern_name, pattern_info in search_patterns.items():
     }
     print(f"   {pattern_name}: {count} ({percentage:.1f}%)")
 
+# Replies collected by 01 (COLLECT_COMMENTS) are coded with the same matcher
+comments = None
+if os.path.exists(COMMENTS_CORPUS):
+    comments = read_corpus(COMMENTS_CORPUS)
+    comment_flags = codebook.apply_requirements(
+        matcher.flag_frame(comments['text'].fillna('').str.lower()))
+    print(f"\n   In {len(comments)} comments on {comments['post_id'].nunique()} posts:")
+    comment_results = []
+    for pattern_name in search_patterns:
+        comments[pattern_name] = comment_flags[pattern_name]
+        count = comments[pattern_name].sum()
+        percentage = (count / len(comments)) * 100 if len(comments) else 0.0
+        comment_results.append({
+            'Pattern': pattern_name,
+            'Comments': count,
+            'Percentage': f"{percentage:.1f}%",
+            'Posts_With_Matching_Comments': comments.loc[comments[pattern_name], 'post_id'].nunique(),
+        })
+        print(f"   {pattern_name}: {count} ({percentage:.1f}%)")
+
 # ============================================
 # ANALYZE CO-OCCURRENCE
 # ============================================
 print("\n3. Analyzing what stress discourse co-occurs with...")
-
-stress_posts = df[df['stress_general'] == True].copy()
+run.phase("3. Analyzing co-occurrence", rows=len(posts))
+
+# Full theme-by-theme co-occurrence from one sparse matrix product
+pattern_names = list(search_patterns.keys())
+pattern_matrix = theme_matrix(posts.flags.unpack(pattern_names))
+co_tables = cooccurrence_tables(pattern_matrix, pattern_names)
+pairs_df = pair_table(pattern_matrix, pattern_names)
+pairs_by_year_df = pair_table(pattern_matrix, pattern_names, groups=posts['year'])
+
+# Pattern rates per community when posts come from several subreddits
+by_source_df = None
+if source_columns and posts['source'].nunique() > 1:
+    by_source_df = group_counts(pattern_matrix, pattern_names, posts['source'])
+    by_source_df = by_source_df.rename(columns={'group': 'source', 'theme': 'pattern'})
+    stress_by_source = by_source_df[by_source_df['pattern'] == 'stress_general']
+    print(f"\n   Posts mentioning 'stress' by source:")
+    for row in stress_by_source.itertuples():
+        print(f"      r/{row.source}: {row.count} of {row.posts} ({row.percentage:.1f}%)")
+
+stress_posts = posts.select(['id', 'title', 'text', 'score', 'num_comments',
+                             'coping_mentioned', 'social_support',
+                             'mental_health_explicit', 'leave_quit'], posts['stress_general'])
 print(f"\n   Found {len(stress_posts)} posts mentioning 'stress'")
 
 if len(stress_posts) > 0:
@@ -120,8 +178,8 @@ if len(stress_posts) > 0:
     co_occurrence = {}
     for pattern_name in search_patterns.keys():
         if pattern_name != 'stress_general':
-            co_count = stress_posts[pattern_name].sum()
-            co_pct = (co_count / len(stress_posts)) * 100 if len(stress_posts) > 0 else 0
+            co_count = co_tables['count'].loc['stress_general', pattern_name]
+            co_pct = co_tables['conditional'].loc['stress_general', pattern_name]
             co_occurrence[pattern_name] = {
                 'count': co_count,
                 'percentage': co_pct
@@ -141,14 +199,15 @@ if len(stress_posts) > 0:
 # WHAT DO THEY DO ABOUT STRESS?
 # ============================================
 print("\n4. What coping strategies are mentioned?")
+run.phase("4. Coping strategies")
 
 coping_categories = ['coping_mentioned', 'social_support', 'substance_coping', 
                     'exercise_hobbies', 'leave_quit', 'mental_health_explicit']
 
 coping_data = []
 for cat in coping_categories:
-    count = df[cat].sum()
-    pct = (count / len(df)) * 100
+    count = posts[cat].sum()
+    pct = (count / len(posts)) * 100
     coping_data.append({'strategy': cat, 'count': count, 'percentage': pct})
 
 coping_df = pd.DataFrame(coping_data).sort_values('count', ascending=False)
@@ -161,95 +220,50 @@ for _, row in coping_df.iterrows():
 # EXTRACT QUOTES
 # ============================================
 print("\n5. Extracting quotes about stress and coping...")
+run.phase("5. Extracting quotes")
 
-def extract_context_quote(text, keywords, context_words=50):
+# Each post is segmented once; all quote passes below reuse the index
+sentence_index = SentenceIndex()
+
+def extract_context_quote(text, keywords, context_words=50, post_id=None):
     """Extract quote with context around keywords"""
-    text_lower = text.lower()
-    
-    for keyword in keywords:
-        idx = text_lower.find(keyword)
-        if idx != -1:
-            # Get surrounding context
-            start = max(0, idx - context_words*5)
-            end = min(len(text), idx + context_words*5)
-            
-            snippet = text[start:end].strip()
-            
-            # Clean up
-            if start > 0:
-                snippet = '...' + snippet
-            if end < len(text):
-                snippet = snippet + '...'
-            
-            # Try to get complete sentences
-            sentences = re.split(r'[.!?]+', snippet)
-            if len(sentences) >= 2:
-                return '. '.join(sentences[1:-1]).strip()
-            else:
-                return snippet
-    
-    return None
+    return context_quote(sentence_index.get(post_id, text), keywords, context_words,
+                         mode=matcher.mode)
+
+extract_many = coder.context_quotes if coder is not None else None
 
+# One context quote per matching post; selection, the 50-300 character
+# filter and engagement are computed on whole columns, and full_text is
+# joined only for the selected posts
 quotes_collection = {
-    'stress_and_coping': [],
-    'mental_health': [],
-    'peer_support': [],
-    'leaving_quitting': [],
-    'hopelessness': []
+    # Stress and coping
+    'stress_and_coping': context_quote_candidates(
+        posts.frame, posts['stress_general'] & posts['coping_mentioned'], extract_context_quote,
+        ['stress', 'cope', 'deal with'], extract_many=extract_many),
+    # Mental health
+    'mental_health': context_quote_candidates(
+        posts.frame, posts['mental_health_explicit'] | posts['mental_health_conditions'],
+        extract_context_quote, ['mental health', 'therapy', 'depression', 'anxiety'], extract_many=extract_many),
+    # Peer support
+    'peer_support': context_quote_candidates(
+        posts.frame, posts['social_support'], extract_context_quote,
+        ['support', 'relate', 'you\'re not alone', 'me too'], first_n_posts=30,
+        extract_many=extract_many),
+    # Leaving/quitting
+    'leaving_quitting': context_quote_candidates(
+        posts.frame, posts['leave_quit'], extract_context_quote,
+        ['quit', 'leaving', 'last day'], first_n_posts=30,
+        extract_many=extract_many),
+    # Hopelessness
+    'hopelessness': context_quote_candidates(
+        posts.frame, posts['no_solution'], extract_context_quote,
+        ['nothing helps', 'hopeless', 'no point'], extract_many=extract_many),
 }
 
-# Stress and coping
-for idx, row in df[df['stress_general'] & df['coping_mentioned']].iterrows():
-    quote = extract_context_quote(row['full_text'], ['stress', 'cope', 'deal with'])
-    if quote and 50 < len(quote) < 300:
-        quotes_collection['stress_and_coping'].append({
-            'post_id': row['id'],
-            'quote': quote,
-            'engagement': row['score'] + row['num_comments']
-        })
-
-# Mental health
-for idx, row in df[df['mental_health_explicit'] | df['mental_health_conditions']].iterrows():
-    quote = extract_context_quote(row['full_text'], 
-                                  ['mental health', 'therapy', 'depression', 'anxiety'])
-    if quote and 50 < len(quote) < 300:
-        quotes_collection['mental_health'].append({
-            'post_id': row['id'],
-            'quote': quote,
-            'engagement': row['score'] + row['num_comments']
-        })
-
-# Peer support
-for idx, row in df[df['social_support']].head(30).iterrows():
-    quote = extract_context_quote(row['full_text'], 
-                                  ['support', 'relate', 'you\'re not alone', 'me too'])
-    if quote and 50 < len(quote) < 300:
-        quotes_collection['peer_support'].append({
-            'post_id': row['id'],
-            'quote': quote,
-            'engagement': row['score'] + row['num_comments']
-        })
-
-# Leaving/quitting
-for idx, row in df[df['leave_quit']].head(30).iterrows():
-    quote = extract_context_quote(row['full_text'], ['quit', 'leaving', 'last day'])
-    if quote and 50 < len(quote) < 300:
-        quotes_collection['leaving_quitting'].append({
-            'post_id': row['id'],
-            'quote': quote,
-            'engagement': row['score'] + row['num_comments']
-        })
+if coder is not None:
+    coder.close()
 
-# Hopelessness
-for idx, row in df[df['no_solution']].iterrows():
-    quote = extract_context_quote(row['full_text'], 
-                                  ['nothing helps', 'hopeless', 'no point'])
-    if quote and 50 < len(quote) < 300:
-        quotes_collection['hopelessness'].append({
-            'post_id': row['id'],
-            'quote': quote,
-            'engagement': row['score'] + row['num_comments']
-        })
+run.rows(sum(len(quotes) for quotes in quotes_collection.values()))
 
 print(f"\n   Extracted quotes:")
 for category, quotes in quotes_collection.items():
@@ -259,9 +273,10 @@ for category, quotes in quotes_collection.items():
 # SAVE RESULTS
 # ============================================
 print("\n6. Saving detailed results...")
+run.phase("6. Saving detailed results", rows=len(posts))
 
 # Create comprehensive output
-with pd.ExcelWriter('stress_mental_health_analysis.xlsx', engine='openpyxl') as writer:
+with ExcelReport('stress_mental_health_analysis.xlsx') as report:
     # Sheet 1: Summary statistics
     summary_data = []
     for pattern, data in results.items():
@@ -272,34 +287,56 @@ with pd.ExcelWriter('stress_mental_health_analysis.xlsx', engine='openpyxl') as
             'Percentage': f"{data['percentage']:.1f}%"
         })
     summary_df = pd.DataFrame(summary_data).sort_values('Count', ascending=False)
-    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+    report.add_sheet('Summary', summary_df)
     
     # Sheet 2: Coping strategies
-    coping_df.to_excel(writer, sheet_name='Coping_Strategies', index=False)
+    report.add_sheet('Coping_Strategies', coping_df)
     
     # Sheet 3: Stress posts
-    stress_export = stress_posts[['id', 'title', 'text', 'score', 'num_comments',
-                                  'coping_mentioned', 'social_support', 
-                                  'mental_health_explicit', 'leave_quit']].copy()
-    stress_export.to_excel(writer, sheet_name='Stress_Posts', index=False)
+    report.add_sheet('Stress_Posts', stress_posts)
     
     # Sheet 4-8: Quote collections
+    if QUOTE_RANKING == 'representative':
+        # Ranked together, so TF-IDF weights and centroids come from all collections
+        ranked = rank_quotes(pd.concat([pd.DataFrame(quotes).assign(category=category)
+                                        for category, quotes in quotes_collection.items()],
+                                       ignore_index=True))
     for category, quotes in quotes_collection.items():
         if len(quotes) > 0:
-            quotes_df = pd.DataFrame(quotes)
-            quotes_df = quotes_df.sort_values('engagement', ascending=False)
-            quotes_df.to_excel(writer, sheet_name=f'Quotes_{category[:20]}', index=False)
+            if QUOTE_RANKING == 'representative':
+                quotes_df = ranked[ranked['category'] == category].drop(columns='category')
+            else:
+                quotes_df = pd.DataFrame(quotes)
+                quotes_df = quotes_df.sort_values('engagement', ascending=False)
+            report.add_sheet(f'Quotes_{category[:20]}', quotes_df)
     
-    # Sheet 9: All coded posts
-    export_cols = ['id', 'title', 'text', 'score', 'num_comments'] + list(search_patterns.keys())
-    df[export_cols].to_excel(writer, sheet_name='All_Posts_Coded', index=False)
+    # Theme co-occurrence: counts matrix plus lift/Jaccard for every pair
+    report.add_sheet('Theme_Cooccurrence', co_tables['count'], index=True)
+    report.add_sheet('Theme_Pairs', pairs_df)
+    report.add_sheet('Theme_Pairs_By_Year', pairs_by_year_df.rename(columns={'group': 'year'}))
+    if by_source_df is not None:
+        report.add_sheet('Patterns_By_Source', by_source_df)
+    
+    # Sheet 9: All coded posts (full text in a sidecar if REPORT_SIDECAR is set)
+    export_cols = (['id'] + source_columns + ['title', 'text', 'score', 'num_comments']
+                   + duplicate_columns + list(search_patterns.keys()))
+    report.add_sheet('All_Posts_Coded', posts.select(export_cols), sidecar_columns=['text'])
+
+    # Coded comments, linked to their posts by post_id / parent_id
+    if comments is not None:
+        report.add_sheet('Comment_Patterns', pd.DataFrame(comment_results))
+        comment_cols = (['id', 'post_id', 'parent_id', 'depth'] + [c for c in ['source'] if c in comments]
+                        + ['text', 'score'] + list(search_patterns.keys()))
+        report.add_sheet('All_Comments_Coded', comments[comment_cols], sidecar_columns=['text'])
 
 print(f"   ✓ Saved to: stress_mental_health_analysis.xlsx")
+run.output('stress_mental_health_analysis.xlsx', *report.sidecars)
 
 # ============================================
 # KEYWORD FREQUENCY ANALYSIS
 # ============================================
 print("\n7. Analyzing specific keyword frequencies...")
+run.phase("7. Keyword frequencies", rows=len(posts))
 
 # Count specific terms
 term_counts = {}
@@ -317,14 +354,15 @@ important_terms = {
     'Wellness apps': ['calm', 'headspace', 'betterhelp', 'meditation app']
 }
 
-all_text = ' '.join(df['full_text_lower'].fillna(''))
+# Counted the way the posts were matched: substrings by default ('stress'
+# also inside 'stressed'), whole words with MATCH_MODE=token
+if matcher.mode == 'token':
+    term_totals = TermFrequencyEngine(important_terms).count_texts(posts.lower).group_totals(important_terms)
+else:
+    term_totals = substring_totals(posts.lower, important_terms)
 
 print("\n   Keyword frequency counts:")
-for category, terms in important_terms.items():
-    total = 0
-    for term in terms:
-        count = all_text.count(term)
-        total += count
+for category, total in term_totals.items():
     term_counts[category] = total
     print(f"      {category}: {total} mentions")
 
@@ -351,4 +389,6 @@ print(f"\nFiles created:")
 print(f"  • stress_mental_health_analysis.xlsx - Full analysis")
 print(f"  • Multiple quote collections by theme")
 
-print("\n" + "="*60)
\ No newline at end of file
+print("\n" + "="*60)
+
+run.finish()
@@ -0,0 +1,268 @@
+"""
+Pipeline Benchmark on Synthetic Corpora
+
+Times each analysis stage separately on seeded synthetic r/CNA corpora of
+increasing size (1k to 1M posts by default) and writes the results as JSON,
+so runs of different versions can be compared stage by stage.
+
+Stages:
+    load          read the Parquet corpus (columns used by 02/03) as an Arrow table
+    normalize     build the compact corpus and its lowercased text buffer
+    coding        both codebooks: matching and requires rules
+    cooccurrence  theme matrices, co-occurrence tables and pairs by year
+    quotes        sentence candidates (as in 02) and context quotes (as in 03)
+    export        the coded-post and pair tables through the Excel report writer
+
+Each size also records the process's peak RSS and the bytes held by the
+compact corpus; sizes run in the order given, so the peak RSS of a size is
+that of the largest corpus so far. Generated corpora are kept in --data-dir
+and reused by later runs. With
+--baseline, stages slower than the baseline JSON by more than --tolerance
+are reported and the exit status is 1.
+
+Examples:
+    python code/benchmark_pipeline.py --sizes 1000 10000
+    python code/benchmark_pipeline.py --output bench_new.json --baseline bench_old.json
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from codebook import load_codebook
+from compact_corpus import CompactCorpus
+from cooccurrence import cooccurrence_tables, pair_table, theme_matrix
+from corpus_io import read_corpus_table
+from parallel_coding import ParallelCoder
+from quote_extraction import (context_quote, context_quote_candidates, sentence_candidates,
+                              sentence_frame, sentence_pairs)
+from report_writer import ExcelReport
+from run_manifest import MB, git_commit
+from sentence_index import PostSentences, SentenceIndex
+from synthetic_corpus import GENERATOR_VERSION, SyntheticCorpus
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+STAGES = ['load', 'normalize', 'coding', 'cooccurrence', 'quotes', 'export']
+CODEBOOKS = ['care_work_themes', 'stress_mental_health']
+
+parser = argparse.ArgumentParser(description="Benchmark the analysis stages")
+parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="corpus sizes in posts")
+parser.add_argument('--seed', type=int, default=0, help="generator seed")
+parser.add_argument('--repeat', type=int, default=1, help="runs per size (the fastest is reported)")
+parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help="stages to time")
+parser.add_argument('--match-mode', default=None, help="'substring' or 'token' (default: codebook's)")
+parser.add_argument('--workers', type=int, default=1, help="coding worker processes")
+parser.add_argument('--data-dir', default='benchmark_data', help="where generated corpora are kept")
+parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+parser.add_argument('--baseline', help="earlier results JSON to compare against")
+parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+args = parser.parse_args()
+
+
+def corpus_path(n_posts):
+    """Generated corpus for a size, created on first use"""
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir,
+                        f"synthetic_{n_posts}_seed{args.seed}_v{GENERATOR_VERSION}.parquet")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        SyntheticCorpus(args.seed).write(path + '.tmp', n_posts)
+        os.replace(path + '.tmp', path)
+        print(f"   generated {n_posts:,} posts in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def run_stages(path, codebooks, out_dir):
+    """Run the selected stages once
+
+    Returns {stage: {'seconds', 'rows'}} and the bytes held by the compact
+    corpus at the end (None if it was not built).
+    """
+    timings = {}
+    state = {}
+
+    # Stages build on each other: everything up to the last selected stage
+    # runs, but only the selected ones are reported
+    last = max(STAGES.index(name) for name in args.stages)
+
+    def stage(name, func):
+        if STAGES.index(name) > last:
+            return
+        started = time.perf_counter()
+        rows = func()
+        if name in args.stages:
+            timings[name] = {'seconds': round(time.perf_counter() - started, 4), 'rows': rows}
+
+    def load():
+        state['table'] = read_corpus_table(path, columns=['id', 'title', 'text', 'score',
+                                                          'num_comments', 'created_date', 'year'])
+        return state['table'].num_rows
+
+    def normalize():
+        state['posts'] = CompactCorpus.from_table(state.pop('table'))
+        return len(state['posts'])
+
+    def coding():
+        posts = state['posts']
+        for codebook in codebooks:
+            matcher = codebook.matcher(mode=args.match_mode)
+            if args.workers > 1:
+                with ParallelCoder(matcher, workers=args.workers) as coder:
+                    flags = coder.flag_matrix(posts.lower)
+            else:
+                flags = matcher.flag_matrix(posts.lower)
+            posts.add_flags(codebook.apply_requirements(flags), list(codebook.categories))
+        return len(posts)
+
+    def cooccurrence():
+        posts = state['posts']
+        state['pairs'] = []
+        for codebook in codebooks:
+            names = list(codebook.categories)
+            matrix = theme_matrix(posts.flags.unpack(names))
+            cooccurrence_tables(matrix, names)
+            state['pairs'].append(pair_table(matrix, names, groups=posts['year']))
+        return len(posts)
+
+    def quotes():
+        posts = state['posts']
+        index = SentenceIndex()
+        mode = args.match_mode or codebooks[0].match_mode
+        sentences = pd.concat([
+            sentence_frame(chunk.assign(potential_quotes=[sentence_pairs(PostSentences(text))
+                                                          for text in chunk['full_text']]))
+            for chunk in posts.chunks(['id', 'score', 'num_comments', 'full_text'])],
+            ignore_index=True)
+        found = [
+            sentence_candidates(sentences, posts['wellness_app_abandoned'], 'wellness_app_abandoned',
+                                [['calm', 'headspace', 'app'], ['never', 'don\'t', 'tired', 'time']],
+                                mode=mode),
+            sentence_candidates(sentences, posts['job_search_tech'], 'job_search',
+                                [['indeed', 'job', 'pay']], mode=mode),
+            sentence_candidates(sentences, posts['burnout_exhaustion'], 'burnout',
+                                [['tired', 'exhausted', 'burnout', 'can\'t']],
+                                first_n_posts=50, first_n_sentences=2, mode=mode),
+        ]
+
+        def extract(text, keywords, post_id=None):
+            return context_quote(index.get(post_id, text), keywords, mode=mode)
+
+        for mask, keywords in [
+                (posts['stress_general'] & posts['coping_mentioned'], ['stress', 'cope', 'deal with']),
+                (posts['mental_health_explicit'] | posts['mental_health_conditions'],
+                 ['mental health', 'therapy', 'depression', 'anxiety']),
+                (posts['leave_quit'], ['quit', 'leaving', 'last day']),
+                (posts['no_solution'], ['nothing helps', 'hopeless', 'no point'])]:
+            found.append(context_quote_candidates(posts.frame, mask, extract, keywords))
+        return int(sum(len(frame) for frame in found))
+
+    def export():
+        posts = state['posts']
+        categories = [c for codebook in codebooks for c in codebook.categories]
+        columns = ['id', 'title', 'text', 'score', 'num_comments', 'created_date'] + categories
+        with ExcelReport(os.path.join(out_dir, 'report.xlsx')) as report:
+            for i, pairs in enumerate(state.get('pairs', [])):
+                report.add_sheet(f'Pairs_{i + 1}', pairs)
+            report.add_sheet('All_Coded_Posts', posts.select([c for c in columns if c in posts]),
+                             sidecar_columns=['text'])
+        return len(posts)
+
+    stage('load', load)
+    stage('normalize', normalize)
+    stage('coding', coding)
+    stage('cooccurrence', cooccurrence)
+    stage('quotes', quotes)
+    stage('export', export)
+    return timings, state['posts'].nbytes if 'posts' in state else None
+
+
+# ============================================
+# RUN
+# ============================================
+print("="*60)
+print("PIPELINE BENCHMARK")
+print("="*60)
+
+codebooks = [load_codebook(name) for name in CODEBOOKS]
+for codebook in codebooks:
+    codebook.matcher(mode=args.match_mode)  # compile outside the timed stages
+
+results = {
+    'benchmark': 'pipeline',
+    'created': datetime.now().isoformat(timespec='seconds'),
+    'git_commit': git_commit(),
+    'python': platform.python_version(),
+    'pandas': pd.__version__,
+    'platform': platform.platform(),
+    'cpu_count': os.cpu_count(),
+    'generator_version': GENERATOR_VERSION,
+    'seed': args.seed,
+    'match_mode': args.match_mode,
+    'workers': args.workers,
+    'codebooks': [str(codebook) for codebook in codebooks],
+    'sizes': {},
+}
+
+for n_posts in args.sizes:
+    print(f"\n{n_posts:,} posts")
+    path = corpus_path(n_posts)
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as out_dir:
+            timings, corpus_bytes = run_stages(path, codebooks, out_dir)
+            runs.append(timings)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024  # kilobytes on Linux, bytes on macOS
+    # Fastest run per stage is the least noisy estimate
+    best = {name: min(runs, key=lambda run: run[name]['seconds'])[name] for name in runs[0]}
+    results['sizes'][str(n_posts)] = {
+        'stages': best,
+        'total_seconds': round(sum(t['seconds'] for t in best.values()), 4),
+        'peak_rss_mb': round(peak_rss / MB, 1),
+        'corpus_mb': round(corpus_bytes / MB, 1) if corpus_bytes is not None else None,
+    }
+    for name, timing in best.items():
+        rate = n_posts / timing['seconds'] if timing['seconds'] else float('inf')
+        print(f"   {name:<13} {timing['seconds']:>9.3f}s  {rate:>12,.0f} posts/s")
+    print(f"   {'total':<13} {results['sizes'][str(n_posts)]['total_seconds']:>9.3f}s")
+    print(f"   peak RSS {results['sizes'][str(n_posts)]['peak_rss_mb']:,.0f} MB"
+          + (f", compact corpus {results['sizes'][str(n_posts)]['corpus_mb']:,.0f} MB"
+             if corpus_bytes is not None else ""))
+
+with open(args.output, 'w') as f:
+    json.dump(results, f, indent=2)
+print(f"\n✓ Results saved to: {args.output}")
+
+# ============================================
+# COMPARE WITH BASELINE
+# ============================================
+if args.baseline:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = []
+    for size, result in results['sizes'].items():
+        previous = baseline.get('sizes', {}).get(size)
+        if previous is None:
+            continue
+        for name, timing in result['stages'].items():
+            before = previous['stages'].get(name, {}).get('seconds')
+            if before and timing['seconds'] > before * (1 + args.tolerance):
+                regressions.append((size, name, before, timing['seconds']))
+
+    print(f"\nCompared with {args.baseline} (commit {baseline.get('git_commit')}):")
+    if regressions:
+        for size, name, before, after in regressions:
+            print(f"   REGRESSION {int(size):,} posts / {name}: {before:.3f}s -> {after:.3f}s "
+                  f"({(after / before - 1) * 100:+.0f}%)")
+        exit(1)
+    print(f"   No stage slower by more than {args.tolerance:.0%}")
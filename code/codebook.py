@@ -0,0 +1,174 @@
+"""
+Versioned Codebooks and a Compiled-Matcher Cache
+
+Codebooks live in `code/codebooks/` as YAML (or JSON) files with a name, a
+version, an optional `match_mode` ('substring' or 'token', see
+keyword_matcher) and a `categories` mapping of keywords, descriptions and
+optional `requires` rules. Each codebook is hashed over its categories, name
+and version; the compiled matcher is pickled under that hash, the match mode
+and a hash of the matching code, so a repeated run with an unchanged
+codebook loads the automaton instead of building it again, and many
+codebook variants can sit side by side.
+
+`requires` rules form a dependency graph that is checked for unknown
+categories and cycles when the codebook loads. After matching, the rules are
+applied in topological order to the whole flag matrix, so chained
+requirements resolve in a single pass.
+
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from graphlib import CycleError, TopologicalSorter
+
+import numpy as np
+import pandas as pd
+
+import keyword_matcher
+import term_frequency
+from keyword_matcher import MATCH_MODES, ahocorasick, make_matcher
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - depends on the environment
+    yaml = None
+
+CODEBOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'codebooks')
+MATCHER_CACHE_DIR = os.getenv('MATCHER_CACHE_DIR', '.matcher_cache')
+
+
+class Codebook:
+    """Categories, keywords and dependency rules of one codebook version"""
+
+    def __init__(self, name, version, categories, path=None, match_mode='substring'):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Codebook '{name}': unknown match_mode '{match_mode}'")
+        self.name = name
+        self.version = version
+        self.categories = categories
+        self.path = path
+        self.match_mode = match_mode
+        self.requires = {
+            category: _as_list(info.get('requires'))
+            for category, info in categories.items()
+        }
+        self.order = self._dependency_order()
+
+    def _dependency_order(self):
+        """Categories with requirements, each after everything it requires"""
+        for category, required in self.requires.items():
+            unknown = [r for r in required if r not in self.categories]
+            if unknown:
+                raise ValueError(f"Codebook '{self.name}': {category} requires "
+                                 f"unknown categories {unknown}")
+        graph = {c: required for c, required in self.requires.items() if required}
+        try:
+            order = TopologicalSorter(graph).static_order()
+            return [c for c in order if c in graph]
+        except CycleError as error:
+            raise ValueError(f"Codebook '{self.name}': requires rules form a cycle "
+                             f"{error.args[1]}") from None
+
+    @property
+    def digest(self):
+        """Content hash of the codebook (name, version and categories)"""
+        payload = json.dumps({'name': self.name, 'version': self.version,
+                              'categories': self.categories}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def __str__(self):
+        return f"{self.name} v{self.version} ({self.digest[:12]})"
+
+    def missing(self, names):
+        """Those of `names` that are not categories of this codebook"""
+        return [name for name in names if name not in self.categories]
+
+    def apply_requirements(self, flags):
+        """Clear flags whose required categories are not flagged on the same post
+
+        `flags` is a boolean (posts x categories) array in codebook order, or
+        a DataFrame with one column per category; a resolved copy is returned.
+        """
+        if isinstance(flags, pd.DataFrame):
+            resolved = self.apply_requirements(flags[list(self.categories)].to_numpy())
+            return pd.DataFrame(resolved, index=flags.index, columns=list(self.categories))
+        resolved = np.array(flags, dtype=bool)
+        column = {category: i for i, category in enumerate(self.categories)}
+        # Topological order: a requirement is final before anything needing it
+        for category in self.order:
+            for required in self.requires[category]:
+                resolved[:, column[category]] &= resolved[:, column[required]]
+        return resolved
+
+    def matcher(self, mode=None, cache_dir=MATCHER_CACHE_DIR):
+        """Compiled matcher for this codebook, cached on disk by hash and mode
+
+        `mode` defaults to the codebook's own match_mode.
+        """
+        mode = mode or self.match_mode
+        if not cache_dir:
+            return make_matcher(self.categories, mode)
+        backend = 'ahocorasick' if ahocorasick is not None else 'python'
+        path = os.path.join(cache_dir, f"{self.name}-{self.digest[:16]}-{mode}"
+                                       f"-{backend}-{_matcher_code_digest()[:8]}.pkl")
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                pass  # unreadable cache entry, compile again
+        matcher = make_matcher(self.categories, mode)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        return matcher
+
+
+def _matcher_code_digest():
+    """Hash of the matching code, so cached matchers expire when it changes"""
+    digest = hashlib.sha256()
+    for module in (keyword_matcher, term_frequency):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def load_codebook(path):
+    """Load a codebook from a .yaml/.yml or .json file
+
+    Bare names (no directory or extension) are looked up in CODEBOOK_DIR.
+    """
+    if not os.path.splitext(path)[1] and not os.path.dirname(path):
+        for extension in ('.yaml', '.yml', '.json'):
+            candidate = os.path.join(CODEBOOK_DIR, path + extension)
+            if os.path.exists(candidate):
+                path = candidate
+                break
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+        elif yaml is None:
+            raise ImportError(f"PyYAML is needed to read {path} (pip install pyyaml)")
+        else:
+            data = yaml.safe_load(f)
+
+    for field in ('name', 'version', 'categories'):
+        if field not in data:
+            raise ValueError(f"Codebook {path} is missing '{field}'")
+    for category, info in data['categories'].items():
+        if not info.get('keywords'):
+            raise ValueError(f"Codebook {path}: category {category} has no keywords")
+    return Codebook(data['name'], data['version'], data['categories'], path=path,
+                    match_mode=data.get('match_mode', 'substring'))
@@ -0,0 +1,288 @@
+"""
+Listing Collection Helpers for the Reddit Collector
+
+Lets the collector fetch several subreddit listings at the same time instead
+of one after another. All workers draw from one token-bucket scheduler that
+follows the rate-limit headers Reddit returns (exposed by PRAW as
+`reddit.auth.limits`), and share one thread-safe index of collected ids so a
+post that shows up in several listings is only kept once.
+
+When several subreddits are collected, each one is a shard with its own
+store, checkpoints and scheduler; the shard schedulers draw from one parent
+scheduler that holds the client's overall budget.
+
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Reddit allows 100 OAuth requests per minute per client id
+DEFAULT_REQUESTS_PER_MINUTE = 100
+
+# PRAW fetches listings in pages of up to 100 submissions per request
+LISTING_PAGE_SIZE = 100
+
+
+class RateLimitScheduler:
+    """Token bucket shared by every listing worker
+
+    With a `parent`, a request needs a token from this bucket and then one
+    from the parent, so a shard stays within its own budget and all shards
+    together within the parent's.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=10,
+                 clock=time.monotonic, sleep=time.sleep, parent=None):
+        self.parent = parent
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.requests = 0
+        # Wall-clock seconds during which at least one request was held back
+        # (concurrent waiters are not summed)
+        self.waited = 0.0
+        self._blocked = 0
+        self._blocked_since = None
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        blocked = False
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    if blocked:
+                        self._blocked -= 1
+                        if self._blocked == 0:
+                            self.waited += self._clock() - self._blocked_since
+                    break
+                if not blocked:
+                    blocked = True
+                    self._blocked += 1
+                    if self._blocked == 1:
+                        self._blocked_since = self._clock()
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+        if self.parent is not None:
+            self.parent.acquire()
+
+    def observe(self, limits):
+        """Adjust the bucket to Reddit's X-Ratelimit-Remaining / -Reset values
+
+        `limits` is the dict PRAW keeps in `reddit.auth.limits`:
+        {'remaining': ..., 'reset_timestamp': ..., 'used': ...}. Missing
+        values (before the first response) leave the bucket unchanged. The
+        headers describe the whole client, so with a parent they go to it.
+        The rate they allow is never taken above requests_per_minute.
+        """
+        if self.parent is not None:
+            self.parent.observe(limits)
+            return
+        remaining = limits.get('remaining') if limits else None
+        reset_at = limits.get('reset_timestamp') if limits else None
+        if remaining is None or reset_at is None:
+            return
+        seconds_left = max(reset_at - time.time(), 1.0)
+        with self._lock:
+            self._refill()
+            # Never hold more tokens than the server says are left, and
+            # spread what is left evenly over the rest of the window, within
+            # the configured budget
+            self.tokens = min(self.tokens, float(remaining))
+            self.rate = min(self.max_rate, max(remaining, 1) / seconds_left)
+
+
+def shard_path(template, source, sources):
+    """Per-subreddit file name for a store or log path
+
+    '{source}' in the template is replaced by the lower-cased subreddit;
+    otherwise, when several subreddits are collected, the subreddit is
+    appended to the file name before its extension.
+    """
+    if '{source}' in template:
+        return template.format(source=source.lower())
+    if len(sources) == 1:
+        return template
+    stem, extension = os.path.splitext(template)
+    return f"{stem}_{source.lower()}{extension}"
+
+
+class CollectionWindow:
+    """Half-open [start, end) range of creation dates to collect
+
+    Bounds are datetimes (naive ones are local time, like
+    `datetime.fromtimestamp`) or None for an open side. Posts are tested on
+    their raw `created_utc`, so nothing is converted before it is filtered.
+    """
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+        self.start_utc = start.timestamp() if start is not None else None
+        self.end_utc = end.timestamp() if end is not None else None
+
+    def contains(self, created_utc):
+        if self.start_utc is not None and created_utc < self.start_utc:
+            return False
+        if self.end_utc is not None and created_utc >= self.end_utc:
+            return False
+        return True
+
+    def is_before(self, created_utc):
+        """True once a post is older than the lower bound"""
+        return self.start_utc is not None and created_utc < self.start_utc
+
+    def __str__(self):
+        start = self.start.date() if self.start is not None else '...'
+        end = self.end.date() if self.end is not None else '...'
+        return f"[{start}, {end})"
+
+
+class DedupIndex:
+    """Thread-safe set of post ids shared by the listing workers"""
+
+    def __init__(self, ids=()):
+        self._ids = set(ids)
+        self._lock = threading.Lock()
+
+    def add(self, post_id):
+        """Record post_id and return True if it had not been seen before"""
+        with self._lock:
+            if post_id in self._ids:
+                return False
+            self._ids.add(post_id)
+            return True
+
+    def __contains__(self, post_id):
+        with self._lock:
+            return post_id in self._ids
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+
+def walk_listing(listing, scheduler, limits=None, page_size=LISTING_PAGE_SIZE):
+    """Iterate a PRAW listing, taking one scheduler token per page request"""
+    iterator = iter(listing)
+    fetched = 0
+    while True:
+        if fetched % page_size == 0:
+            scheduler.acquire()
+        try:
+            post = next(iterator)
+        except StopIteration:
+            return
+        fetched += 1
+        if fetched % page_size == 1 and limits is not None:
+            # A new page was just downloaded; pick up its rate-limit headers
+            scheduler.observe(limits())
+        yield post
+
+
+def fetch_listings(jobs, to_record, dedup, scheduler, max_workers=None,
+                   stop_at=None, on_listing_done=None, window=None,
+                   chronological=('new',), on_record=None):
+    """Fetch several listings concurrently
+
+    `jobs` is a list of (name, reddit, make_listing) tuples, where
+    make_listing(reddit) returns a PRAW listing generator. Each post whose id
+    is new to `dedup` is passed to to_record(post), which returns a dict or
+    None to drop the post. Returns the kept records (in job order) and a
+    {name: {'fetched': n, 'kept': n, 'discarded': n, 'stopped_early': bool}}
+    summary, where 'discarded' counts posts outside `window`.
+
+    `stop_at` maps a job name to a set of ids; paging that listing stops at
+    the first post in the set (used to stop `new` at already-stored posts).
+    `on_listing_done(name, records)` is called from the calling thread as
+    each listing finishes, so results can be persisted before the others end.
+
+    Listings named in `chronological` are sorted newest first, so paging
+    them stops as soon as a post falls below the window's lower bound.
+
+    With `on_record`, each kept record is handed to on_record(record) from
+    the worker thread as soon as it is fetched and is not kept in memory;
+    the returned record lists are then empty.
+    """
+    stop_at = stop_at or {}
+
+    def run(job):
+        name, reddit, make_listing = job
+        stop_ids = stop_at.get(name, ())
+        records = []
+        kept = 0
+        fetched = 0
+        discarded = 0
+        stopped_early = False
+        sorted_by_date = name in chronological
+        limits = lambda: getattr(reddit.auth, 'limits', None)
+        for post in walk_listing(make_listing(reddit), scheduler, limits=limits):
+            if post.id in stop_ids:
+                stopped_early = True
+                break
+            fetched += 1
+            if window is not None and not window.contains(post.created_utc):
+                discarded += 1
+                if sorted_by_date and window.is_before(post.created_utc):
+                    stopped_early = True
+                    break  # everything after this is older still
+                continue
+            if not dedup.add(post.id):
+                continue
+            record = to_record(post)
+            if record is None:
+                continue
+            kept += 1
+            if on_record is not None:
+                on_record(record)
+            else:
+                records.append(record)
+        return name, records, {'fetched': fetched, 'kept': kept,
+                               'discarded': discarded, 'stopped_early': stopped_early}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(jobs), 1)) as pool:
+        futures = [pool.submit(run, job) for job in jobs]
+        for future in as_completed(futures):
+            name, job_records, job_stats = future.result()
+            results[name] = (job_records, job_stats)
+            if on_listing_done is not None:
+                on_listing_done(name, job_records)
+
+    records = []
+    stats = {}
+    for name, _, _ in jobs:
+        job_records, stats[name] = results[name]
+        records.extend(job_records)
+    return records, stats
+
+
+def refresh_engagement(reddit, post_ids, scheduler, batch_size=LISTING_PAGE_SIZE):
+    """Re-read score and comment count for known posts
+
+    Uses `reddit.info`, which looks up to 100 submissions per request, so
+    refreshing a week of posts costs a handful of requests. Returns a list of
+    (id, score, num_comments) tuples.
+    """
+    updates = []
+    fullnames = [f"t3_{post_id}" for post_id in post_ids]
+    for start in range(0, len(fullnames), batch_size):
+        scheduler.acquire()
+        for post in reddit.info(fullnames=fullnames[start:start + batch_size]):
+            updates.append((post.id, post.score, post.num_comments))
+        scheduler.observe(getattr(reddit.auth, 'limits', None))
+    return updates
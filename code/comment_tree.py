@@ -0,0 +1,186 @@
+"""
+Comment-Tree Collection with Bounded Concurrency
+
+Fetches the comment trees of selected posts and flattens them into rows
+linked by parent id (the parent comment, or the post itself for top-level
+comments), so the analysis scripts can code replies with the same matcher
+as posts.
+
+A post's first request returns the top of its tree; the rest is hidden
+behind `MoreComments` stubs that each cost another request. Stubs are
+expanded shallowest and largest first, within a per-post budget of depth,
+comments and expansion requests, so a long thread cannot eat the whole rate
+budget and the top-level discussion is kept before deep side threads. Posts
+are processed by a fixed number of worker threads, each with its own PRAW
+client, and every request takes a token from the shared
+RateLimitScheduler. A post whose fetch fails (deleted, not found, a
+transient API error) is reported and skipped; the other trees carry on.
+
+"""
+
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+# Per-post budget defaults
+MAX_DEPTH = 8
+MAX_COMMENTS = 500
+MAX_MORE_REQUESTS = 10
+
+
+class CommentBudget:
+    """Limits on how much of one post's comment tree is collected
+
+    max_depth: deepest level kept (top-level comments are depth 0)
+    max_comments: comments kept per post
+    max_more_requests: MoreComments expansions per post
+    """
+
+    def __init__(self, max_depth=MAX_DEPTH, max_comments=MAX_COMMENTS,
+                 max_more_requests=MAX_MORE_REQUESTS):
+        self.max_depth = max_depth
+        self.max_comments = max_comments
+        self.max_more_requests = max_more_requests
+
+
+def _bare_id(fullname):
+    """'t1_abc' -> 'abc'"""
+    return fullname.split('_', 1)[1] if '_' in fullname else fullname
+
+
+def _is_stub(item):
+    """True for a MoreComments stub (checked by class name: attribute lookups
+    on PRAW comments can trigger a fetch)"""
+    return type(item).__name__ == 'MoreComments'
+
+
+def comment_record(comment, post_id, depth):
+    """Row of the flat comment table"""
+    created = datetime.fromtimestamp(comment.created_utc)
+    return {
+        'id': comment.id,
+        'post_id': post_id,
+        'parent_id': _bare_id(comment.parent_id),
+        'depth': depth,
+        'text': comment.body,
+        'score': comment.score,
+        'created_date': created,
+        'year': created.year,
+    }
+
+
+class _PostTree:
+    """Flattens one post's comments and keeps its expansion queue"""
+
+    def __init__(self, post_id, budget):
+        self.post_id = post_id
+        self.budget = budget
+        self.records = []
+        self.depths = {}
+        self.stubs = []  # heap of (depth, -count, tiebreak, stub)
+        self._tiebreak = itertools.count()
+        self.skipped_stubs = 0
+
+    def _depth_below(self, parent_fullname):
+        """Depth of a child of the given parent; None if the parent was not kept"""
+        if parent_fullname.startswith('t3_'):
+            return 0
+        parent_depth = self.depths.get(_bare_id(parent_fullname))
+        return None if parent_depth is None else parent_depth + 1
+
+    def add(self, items):
+        """Record comments (and their loaded replies) and queue stubs"""
+        pending = deque(items)
+        while pending:
+            item = pending.popleft()
+            depth = self._depth_below(item.parent_id)
+            if depth is None or depth > self.budget.max_depth:
+                continue  # below the depth limit, or an orphan of a dropped parent
+            if _is_stub(item):
+                # Expanded later, shallow and large first
+                heapq.heappush(self.stubs, (depth, -item.count, next(self._tiebreak), item))
+                continue
+            if len(self.records) >= self.budget.max_comments:
+                return
+            self.depths[item.id] = depth
+            self.records.append(comment_record(item, self.post_id, depth))
+            pending.extend(item.replies)
+
+    def next_stub(self, requests_made):
+        """Next stub worth a request, or None when the budget is spent"""
+        if (not self.stubs or requests_made >= self.budget.max_more_requests
+                or len(self.records) >= self.budget.max_comments):
+            self.skipped_stubs += len(self.stubs)
+            self.stubs = []
+            return None
+        return heapq.heappop(self.stubs)[-1]
+
+
+def collect_comments(post_ids, make_reddit, scheduler, budget=None, workers=4,
+                     sort='top', on_post_done=None):
+    """Fetch and flatten the comment trees of several posts concurrently
+
+    Each worker thread creates its own client with make_reddit(). Returns
+    the comment records (in post_ids order) and a stats dict with requests,
+    comments, stubs left unexpanded by the budget, and the ids of posts
+    whose fetch failed ('failed'); those posts contribute no records.
+    `on_post_done(post_id, records)` is called from the calling thread as
+    each post finishes, so results can be stored before the others end.
+    """
+    budget = budget or CommentBudget()
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'reddit'):
+            local.reddit = make_reddit()
+        return local.reddit
+
+    def fetch(post_id):
+        reddit = client()
+        limits = lambda: getattr(reddit.auth, 'limits', None)
+        submission = reddit.submission(id=post_id)
+        submission.comment_sort = sort
+        tree = _PostTree(post_id, budget)
+        requests = 0
+        try:
+            scheduler.acquire()
+            requests += 1
+            tree.add(submission.comments)  # first access downloads the tree
+            scheduler.observe(limits())
+            while True:
+                stub = tree.next_stub(requests - 1)
+                if stub is None:
+                    break
+                scheduler.acquire()
+                requests += 1
+                tree.add(stub.comments())
+                scheduler.observe(limits())
+        except Exception as error:
+            return post_id, None, requests, 0, error
+        return post_id, tree.records, requests, tree.skipped_stubs, None
+
+    results = {}
+    stats = {'posts': len(post_ids), 'requests': 0, 'comments': 0, 'skipped_stubs': 0,
+             'failed': []}
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(post_ids)), 1)) as pool:
+        futures = [pool.submit(fetch, post_id) for post_id in post_ids]
+        for future in as_completed(futures):
+            post_id, records, requests, skipped, error = future.result()
+            stats['requests'] += requests
+            if error is not None:
+                # Not stored, so a later run tries the post again
+                print(f"   Note: comments of post {post_id} not collected "
+                      f"({type(error).__name__}: {error})")
+                stats['failed'].append(post_id)
+                continue
+            results[post_id] = records
+            stats['comments'] += len(records)
+            stats['skipped_stubs'] += skipped
+            if on_post_done is not None:
+                on_post_done(post_id, records)
+
+    records = [record for post_id in post_ids for record in results.get(post_id, [])]
+    return records, stats
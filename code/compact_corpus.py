@@ -0,0 +1,221 @@
+"""
+Memory-Compact Corpus for the Analysis Stages
+
+The analysis scripts used to hold every post four times as Python string
+objects (title, text, full_text and full_text_lower) next to one boolean
+column per theme. CompactCorpus keeps instead:
+
+- the corpus columns in an Arrow-backed frame: strings stay in Arrow
+  buffers, and `year` and `source` are categoricals (integer codes plus a
+  single copy of each label);
+- the normalized text (title and text joined by a space, lowercased) as one
+  Arrow string array, a single character buffer with offsets;
+- theme flags as a bitset, eight posts to a byte per theme.
+
+Python strings are only created for the rows being worked on: the matcher
+and the term counter walk the text buffer a chunk at a time, and `select()`
+builds an ordinary DataFrame (with `full_text` and flag columns when asked
+for) for the rows of a mask, e.g. for one report sheet or quote pass.
+
+"""
+
+import array
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CHUNK_ROWS = 50000
+CATEGORICAL_COLUMNS = ('year', 'source')
+
+_ARROW_STRINGS = {pa.string(): pd.StringDtype('pyarrow'),
+                  pa.large_string(): pd.StringDtype('pyarrow')}
+
+
+def join_text(titles, texts):
+    """full_text of each post: title and text joined by a space (missing as '')"""
+    return [f"{title if isinstance(title, str) else ''} {text if isinstance(text, str) else ''}"
+            for title, text in zip(titles, texts)]
+
+
+class TextColumn:
+    """One string per post, stored in a single Arrow buffer with offsets"""
+
+    def __init__(self, values):
+        if isinstance(values, pa.ChunkedArray):
+            values = values.chunk(0) if values.num_chunks == 1 else values.combine_chunks()
+        if values.type != pa.large_string():
+            values = values.cast(pa.large_string())
+        self.array = values
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Build from an iterable of strings, encoded straight into one buffer"""
+        data = bytearray()
+        offsets = array.array('q', [0])
+        for value in strings:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        return cls(pa.LargeStringArray.from_buffers(len(offsets) - 1, pa.py_buffer(offsets),
+                                                    pa.py_buffer(data)))
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, row):
+        return self.array[row].as_py()
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+    def chunks(self, chunk_rows=CHUNK_ROWS):
+        """Consecutive lists of Python strings, chunk_rows at a time"""
+        for start in range(0, len(self.array), chunk_rows):
+            yield self.array.slice(start, chunk_rows).to_pylist()
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+
+def normalized_text(table, chunk_rows=CHUNK_ROWS):
+    """Lowercased full_text of every post in an Arrow table, as a TextColumn
+
+    Lowercasing is Python's str.lower(), as before, so matching sees exactly
+    the same text.
+    """
+    titles, texts = table.column('title'), table.column('text')
+
+    def lowered():
+        for start in range(0, table.num_rows, chunk_rows):
+            for text in join_text(titles.slice(start, chunk_rows).to_pylist(),
+                                  texts.slice(start, chunk_rows).to_pylist()):
+                yield text.lower()
+
+    return TextColumn.from_strings(lowered())
+
+
+class ThemeFlags:
+    """Post-by-theme boolean flags packed into a bitset, eight posts per byte"""
+
+    def __init__(self, names, bits, n_posts):
+        self.names = list(names)
+        self.bits = bits  # uint8, themes x ceil(n_posts / 8)
+        self.n_posts = n_posts
+        self._row = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def pack(cls, flags, names=None):
+        """From a boolean DataFrame, or a (posts x themes) array and its theme names"""
+        if isinstance(flags, pd.DataFrame):
+            names = list(flags.columns) if names is None else list(names)
+            flags = flags[names].to_numpy()
+        flags = np.asarray(flags, dtype=bool)
+        return cls(names, np.packbits(flags.T, axis=1), flags.shape[0])
+
+    def __contains__(self, name):
+        return name in self._row
+
+    def column(self, name):
+        """Boolean array of one theme"""
+        return np.unpackbits(self.bits[self._row[name]], count=self.n_posts).view(bool)
+
+    def unpack(self, names=None):
+        """Boolean (posts x themes) array of the given themes (default: all)"""
+        rows = [self._row[name] for name in (self.names if names is None else names)]
+        return np.unpackbits(self.bits[rows], axis=1, count=self.n_posts).view(bool).T
+
+    def extend(self, other):
+        """Flags of both sets of themes (for several codebooks on one corpus)"""
+        return ThemeFlags(self.names + other.names, np.vstack([self.bits, other.bits]),
+                          self.n_posts)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+
+class CompactCorpus:
+    """Corpus columns, normalized text buffer and theme flags of a set of posts
+
+    `corpus[name]` is a corpus column or a theme flag as a Series; use
+    select() for a DataFrame of several columns.
+    """
+
+    def __init__(self, frame, lower, flags=None):
+        self.frame = frame
+        self.lower = lower
+        self.flags = flags
+
+    @classmethod
+    def from_table(cls, table, lower=None):
+        """From an Arrow corpus table; `lower` is its normalized text if already built"""
+        if lower is None:
+            lower = normalized_text(table)
+        for name in CATEGORICAL_COLUMNS:
+            if name in table.column_names:
+                table = table.set_column(table.column_names.index(name), name,
+                                         table.column(name).dictionary_encode())
+        frame = table.to_pandas(types_mapper=_ARROW_STRINGS.get)
+        return cls(frame, lower)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, name):
+        return name in self.frame.columns or (self.flags is not None and name in self.flags)
+
+    def __getitem__(self, name):
+        if name in self.frame.columns:
+            return self.frame[name]
+        if self.flags is not None and name in self.flags:
+            return pd.Series(self.flags.column(name), index=self.frame.index, name=name)
+        raise KeyError(name)
+
+    def add_flags(self, flags, names=None):
+        """Pack coded flags (see ThemeFlags.pack) next to any already added"""
+        packed = ThemeFlags.pack(flags, names)
+        self.flags = packed if self.flags is None else self.flags.extend(packed)
+
+    def select(self, columns, mask=None):
+        """DataFrame of corpus columns, theme flags and 'full_text' for the rows of a mask
+
+        full_text is joined only for the selected rows. Without a mask every
+        row is selected.
+        """
+        rows = None if mask is None else np.flatnonzero(np.asarray(mask, dtype=bool))
+        return self._rows(columns, rows)
+
+    def take(self, mask):
+        """CompactCorpus of the rows of a mask, renumbered from 0"""
+        rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+        flags = None
+        if self.flags is not None:
+            flags = ThemeFlags.pack(self.flags.unpack()[rows], self.flags.names)
+        return CompactCorpus(self.frame.iloc[rows].reset_index(drop=True),
+                             TextColumn(self.lower.array.take(rows)), flags)
+
+    def chunks(self, columns, chunk_rows=CHUNK_ROWS):
+        """select() over consecutive blocks of rows (one empty block for no posts)"""
+        for start in range(0, max(len(self), 1), chunk_rows):
+            yield self._rows(columns, np.arange(start, min(start + chunk_rows, len(self))))
+
+    def _rows(self, columns, rows):
+        frame = self.frame if rows is None else self.frame.iloc[rows]
+        data = {}
+        for name in columns:
+            if name == 'full_text':
+                data[name] = join_text(frame['title'], frame['text'])
+            elif name in frame.columns:
+                data[name] = frame[name]
+            else:
+                flags = self[name].to_numpy()
+                data[name] = flags if rows is None else flags[rows]
+        return pd.DataFrame(data, index=frame.index)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the columns, text buffer and flags"""
+        total = int(self.frame.memory_usage(deep=True).sum()) + self.lower.nbytes
+        return total + (self.flags.nbytes if self.flags is not None else 0)
@@ -0,0 +1,94 @@
+"""
+Substring vs Token Matching: Flag Count Differences
+
+Codes the corpus with each codebook in both match modes and reports how the
+flag counts move: per category, how many posts only the substring matcher
+flags (for example 'pay' inside "repay") and how many only the token matcher
+flags (phrases split by punctuation such as "self care" for 'self-care'). A
+per-keyword table shows which keywords account for the difference.
+
+Examples:
+    python code/compare_match_modes.py
+    python code/compare_match_modes.py --codebook care_work_themes --output match_modes.xlsx
+
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from codebook import load_codebook
+from corpus_io import THEMED_CORPUS, read_corpus
+from keyword_matcher import make_matcher
+from report_writer import ExcelReport
+
+parser = argparse.ArgumentParser(description="Compare substring and token matching")
+parser.add_argument('--codebook', action='append',
+                    help="codebook name or path (repeatable; default: both shipped codebooks)")
+parser.add_argument('--corpus', default=THEMED_CORPUS, help="Parquet corpus to code")
+parser.add_argument('--output', help="also write the tables to this .xlsx workbook")
+parser.add_argument('--top', type=int, default=10, help="keywords to list per codebook")
+args = parser.parse_args()
+
+codebook_names = args.codebook or ['care_work_themes', 'stress_mental_health']
+
+df = read_corpus(args.corpus, columns=['id', 'title', 'text'])
+texts = (df['title'].fillna('') + ' ' + df['text'].fillna('')).str.lower()
+print(f"Comparing match modes on {len(df)} posts from {args.corpus}")
+
+category_tables = []
+keyword_tables = []
+
+for name in codebook_names:
+    codebook = load_codebook(name)
+    print(f"\n{codebook}")
+
+    flags = {}
+    for mode in ('substring', 'token'):
+        started = time.perf_counter()
+        matcher = codebook.matcher(mode=mode)
+        flags[mode] = codebook.apply_requirements(matcher.flag_frame(texts))
+        print(f"   {mode:<9} matching: {time.perf_counter() - started:.2f}s")
+
+    substring, token = flags['substring'], flags['token']
+    categories = pd.DataFrame({
+        'codebook': codebook.name,
+        'category': list(codebook.categories),
+        'substring': substring.sum().to_numpy(),
+        'token': token.sum().to_numpy(),
+        'only_substring': (substring & ~token).sum().to_numpy(),
+        'only_token': (token & ~substring).sum().to_numpy(),
+    })
+    categories['change'] = categories['token'] - categories['substring']
+    categories['change_pct'] = (categories['change'] / categories['substring']
+                                .where(categories['substring'] > 0) * 100).round(1)
+    category_tables.append(categories)
+
+    print(f"\n   {'category':<26} {'substring':>9} {'token':>7} {'change':>7}")
+    for _, row in categories.iterrows():
+        print(f"   {row['category']:<26} {row['substring']:>9} {row['token']:>7} {row['change']:>+7}")
+
+    # Posts matched by each keyword on its own, in both modes
+    keywords = sorted({kw for info in codebook.categories.values() for kw in info['keywords']})
+    per_keyword = {kw: {'keywords': [kw]} for kw in keywords}
+    keyword_counts = pd.DataFrame({
+        mode: make_matcher(per_keyword, mode).flag_frame(texts).sum()
+        for mode in ('substring', 'token')
+    })
+    keyword_counts['change'] = keyword_counts['token'] - keyword_counts['substring']
+    keyword_counts = keyword_counts.rename_axis('keyword').reset_index()
+    keyword_counts.insert(0, 'codebook', codebook.name)
+    keyword_counts = keyword_counts.sort_values('change', key=abs, ascending=False)
+    keyword_tables.append(keyword_counts)
+
+    print(f"\n   Keywords with the largest change:")
+    for _, row in keyword_counts.head(args.top).iterrows():
+        if row['change']:
+            print(f"      '{row['keyword']}': {row['substring']} -> {row['token']} posts")
+
+if args.output:
+    with ExcelReport(args.output) as report:
+        report.add_sheet('Categories', pd.concat(category_tables, ignore_index=True))
+        report.add_sheet('Keywords', pd.concat(keyword_tables, ignore_index=True))
+    print(f"\nSaved to: {args.output}")
@@ -0,0 +1,103 @@
+"""
+Theme Co-occurrence Analytics over a Sparse Post-by-Theme Matrix
+
+The coded flags are stored as a sparse (posts x themes) 0/1 matrix X. One
+product, X.T @ X, gives every pairwise co-occurrence count at once (the
+diagonal holds each theme's own count), and lift, Jaccard and conditional
+percentages follow from it element-wise. No Python loop runs per pair of
+themes, so the tables scale to hundreds of themes and millions of posts.
+
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def theme_matrix(flags):
+    """Sparse (posts x themes) matrix from a boolean DataFrame or array"""
+    values = flags.to_numpy() if isinstance(flags, pd.DataFrame) else np.asarray(flags)
+    # Built from the flagged positions, without a dense integer copy
+    rows, cols = np.nonzero(values)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                             shape=values.shape)
+
+
+def cooccurrence_tables(matrix, themes):
+    """Counts, lift, Jaccard and conditional tables for all theme pairs
+
+    Returns a dict of themes x themes DataFrames:
+      'count'       posts flagged with both themes
+      'lift'        observed / expected co-occurrence under independence
+      'jaccard'     |A and B| / |A or B|
+      'conditional' % of posts with the row theme that also have the column theme
+    """
+    n_posts = matrix.shape[0]
+    counts = (matrix.T @ matrix).toarray()
+    totals = np.diag(counts).astype(float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = np.outer(totals, totals) / n_posts if n_posts else np.zeros(counts.shape)
+        lift = np.where(expected > 0, counts / expected, np.nan)
+        union = totals[:, None] + totals[None, :] - counts
+        jaccard = np.where(union > 0, counts / union, np.nan)
+        conditional = np.where(totals[:, None] > 0, counts / totals[:, None] * 100, 0.0)
+
+    def frame(values):
+        return pd.DataFrame(values, index=themes, columns=themes)
+
+    return {
+        'count': frame(counts),
+        'lift': frame(lift),
+        'jaccard': frame(jaccard),
+        'conditional': frame(conditional),
+    }
+
+
+def group_counts(matrix, themes, groups):
+    """Posts flagged per theme within each group (e.g. each source subreddit)
+
+    One sparse product of a (groups x posts) indicator with the flag matrix.
+    Columns: group, theme, posts (in the group), count, percentage.
+    """
+    codes, labels = pd.factorize(np.asarray(groups), sort=True)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int64), (codes, np.arange(len(codes)))),
+        shape=(len(labels), len(codes)))
+    counts = (indicator @ matrix).toarray()
+    sizes = np.bincount(codes, minlength=len(labels))
+    table = pd.DataFrame({
+        'group': np.repeat(labels, len(themes)),
+        'theme': np.tile(np.asarray(themes), len(labels)),
+        'posts': np.repeat(sizes, len(themes)),
+        'count': counts.ravel(),
+    })
+    table['percentage'] = (table['count'] / table['posts'] * 100).round(1)
+    return table
+
+
+def pair_table(matrix, themes, groups=None):
+    """Long-format table of every theme pair (a < b) with count, lift, Jaccard
+
+    With `groups` (one label per post, e.g. the post year), the tables are
+    computed separately for each group and a column for it is added.
+    """
+    if groups is not None:
+        groups = np.asarray(groups)
+        frames = []
+        for label in sorted(pd.unique(groups)):
+            part = pair_table(matrix[np.flatnonzero(groups == label)], themes)
+            part.insert(0, 'group', label)
+            frames.append(part)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    tables = cooccurrence_tables(matrix, themes)
+    rows, cols = np.triu_indices(len(themes), k=1)
+    return pd.DataFrame({
+        'theme_a': np.asarray(themes)[rows],
+        'theme_b': np.asarray(themes)[cols],
+        'count': tables['count'].to_numpy()[rows, cols],
+        'lift': tables['lift'].to_numpy()[rows, cols],
+        'jaccard': tables['jaccard'].to_numpy()[rows, cols],
+        'posts': matrix.shape[0],
+    })
@@ -0,0 +1,128 @@
+"""
+Columnar Corpus Format Shared by the Pipeline Stages
+
+The collector writes the themed corpus as Parquet (or Arrow IPC) with a typed
+schema, and the analysis scripts load it from there instead of re-reading an
+Excel workbook. Reads support column projection and memory mapping, so
+loading only touches the columns a stage actually needs.
+
+Excel is kept as an optional, human-readable report export.
+
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Canonical interchange schema between stages, including the 'engagement'
+# column the collector adds; an empty corpus is written with all of these.
+# Extra columns are kept with their inferred Arrow types.
+CORPUS_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('title', pa.string()),
+    ('text', pa.string()),
+    ('score', pa.int64()),
+    ('num_comments', pa.int64()),
+    ('created_date', pa.timestamp('us')),
+    ('year', pa.int16()),
+    ('url', pa.string()),
+    ('source', pa.string()),
+    ('engagement', pa.int64()),
+])
+
+THEMED_CORPUS = 'themed_posts_for_analysis.parquet'
+
+# Flat comment table (one row per comment, linked to its post and parent
+# comment by id), written by the collector when COLLECT_COMMENTS is set
+COMMENTS_CORPUS = 'comments_for_analysis.parquet'
+
+IPC_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+
+def to_corpus_table(df):
+    """Convert a posts DataFrame to an Arrow table using the corpus schema"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = []
+    for name in table.column_names:
+        if name in CORPUS_SCHEMA.names:
+            fields.append(CORPUS_SCHEMA.field(name))
+        else:
+            fields.append(table.schema.field(name))
+    return table.cast(pa.schema(fields))
+
+
+def write_corpus(df, path=THEMED_CORPUS):
+    """Write posts to Parquet, or Arrow IPC for .arrow/.feather/.ipc paths"""
+    table = to_corpus_table(df)
+    if path.endswith(IPC_EXTENSIONS):
+        # Uncompressed IPC so readers can memory-map it without a copy
+        feather.write_feather(table, path, compression='uncompressed')
+    else:
+        pq.write_table(table, path, compression='zstd')
+    return path
+
+
+def corpus_columns(path=THEMED_CORPUS):
+    """Column names of a corpus file (empty if there is none)"""
+    if not os.path.exists(path):
+        return []
+    if path.endswith(IPC_EXTENSIONS):
+        return feather.read_table(path, memory_map=True).schema.names
+    return pq.read_schema(path).names
+
+
+def read_corpus_table(path=THEMED_CORPUS, columns=None, memory_map=True):
+    """Read the corpus as an Arrow table, optionally projecting columns"""
+    if path.endswith(IPC_EXTENSIONS):
+        return feather.read_table(path, columns=columns, memory_map=memory_map)
+    return pq.read_table(path, columns=columns, memory_map=memory_map)
+
+
+def read_corpus(path=THEMED_CORPUS, columns=None, memory_map=True):
+    """Load the corpus as a DataFrame
+
+    Falls back to the legacy Excel handoff when only the .xlsx file from an
+    older collection run exists next to the requested path.
+    """
+    if not os.path.exists(path):
+        legacy = os.path.splitext(path)[0] + '.xlsx'
+        if os.path.exists(legacy):
+            print(f"   Note: {path} not found, reading legacy {legacy}")
+            return pd.read_excel(legacy, usecols=columns)
+    table = read_corpus_table(path, columns=columns, memory_map=memory_map)
+    return table.to_pandas()
+
+
+
+class CorpusWriter:
+    """Append DataFrame chunks to one Parquet file as separate row groups"""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        table = to_corpus_table(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+        self._writer.write_table(table.cast(self._writer.schema))
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is None:
+            # Nothing was written; still leave a valid, empty corpus file
+            pq.write_table(CORPUS_SCHEMA.empty_table(), self.path)
+        else:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,323 @@
+"""
+Inverted Index and Query Engine over the Collected Corpus
+
+Builds a positional inverted index (term -> post -> token positions) plus
+per-post metadata once, saves it next to the corpus, and answers ad hoc
+questions from it without rescanning any text. Tokens are the same
+lowercase word tokens the term frequency engine uses.
+
+Postings are kept as flat arrays in an Arrow table with one row per term,
+sorted by term: the posts that contain the term, and the token positions in
+each of those posts. The saved index is a directory with two uncompressed
+Arrow IPC files. Loading memory-maps them, so opening an index reads
+almost nothing, and a query touches only the postings of its own terms.
+Each token position takes 4 bytes, plus 8 bytes for each post a term
+appears in. The 32-bit offsets limit one index to 2**31 token positions.
+
+Query syntax:
+    stress                      single term
+    "short staffed"             phrase (consecutive tokens)
+    stress AND quit             both (AND may be left out: `stress quit`)
+    therapy OR counseling       either
+    NOT app                     posts without the term
+    stress NEAR/5 quit          both within 5 tokens of each other
+    a NEAR/5 b NEAR/5 c         c within 5 tokens of the a..b match
+    (stress OR burnout) AND NOT "wellness app"
+
+Year and engagement filters are applied from the post metadata.
+
+"""
+
+import bisect
+import os
+import re
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from corpus_io import read_corpus
+from term_frequency import tokenize
+
+INDEX_VERSION = 2
+
+POSTINGS_FILE = 'postings.arrow'
+POSTS_FILE = 'posts.arrow'
+
+QUERY_TOKEN = re.compile(r'"[^"]*"|\(|\)|NEAR/\d+|[^\s()"]+')
+
+
+def _single_array(column):
+    """The one Arrow array of a column, without copying when it has one chunk"""
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+class _SortedTerms:
+    """Sequence view of the sorted term column, for bisect"""
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, row):
+        return self.terms[row].as_py()
+
+
+class InvertedIndex:
+    """Positional inverted index with per-post metadata for filtering"""
+
+    def __init__(self, postings, ids, years, engagement):
+        self.postings = postings  # Arrow table: term, docs, positions
+        self.ids = ids
+        self.years = years
+        self.engagement = engagement
+        docs = _single_array(postings.column('docs'))
+        positions = _single_array(postings.column('positions')).values
+        self._terms = _SortedTerms(_single_array(postings.column('term')))
+        self._doc_offsets = docs.offsets.to_numpy()
+        self._docs = docs.values.to_numpy()
+        self._position_offsets = positions.offsets.to_numpy()
+        self._positions = positions.values.to_numpy()
+
+    @classmethod
+    def build(cls, df):
+        """Index a posts DataFrame (title, text, score, num_comments, year)"""
+        postings = defaultdict(dict)
+        texts = df['title'].fillna('') + ' ' + df['text'].fillna('')
+        for doc, text in enumerate(texts):
+            positions = defaultdict(list)
+            for position, token in enumerate(tokenize(text)):
+                positions[token].append(position)
+            for token, token_positions in positions.items():
+                postings[token][doc] = token_positions
+        if 'year' in df:
+            years = df['year'].to_numpy()
+        else:
+            years = df['created_date'].dt.year.to_numpy()
+        return cls(cls._postings_table(postings),
+                   df['id'].to_numpy(),
+                   years,
+                   (df['score'] + df['num_comments']).to_numpy())
+
+    @staticmethod
+    def _postings_table(postings):
+        """Arrow table of {term: {doc: positions}}, one row per term in term order"""
+        terms = sorted(postings)
+        doc_counts = np.fromiter((len(postings[term]) for term in terms), np.int32, len(terms))
+        docs = np.fromiter(chain.from_iterable(postings[term] for term in terms), np.int32)
+        position_lists = [positions for term in terms for positions in postings[term].values()]
+        position_counts = np.fromiter(map(len, position_lists), np.int32, len(position_lists))
+        positions = np.fromiter(chain.from_iterable(position_lists), np.int32)
+        doc_offsets = pa.array(np.concatenate([[0], np.cumsum(doc_counts)]), pa.int32())
+        position_offsets = pa.array(np.concatenate([[0], np.cumsum(position_counts)]), pa.int32())
+        return pa.table({
+            'term': pa.array(terms, pa.large_string()),
+            'docs': pa.ListArray.from_arrays(doc_offsets, pa.array(docs)),
+            'positions': pa.ListArray.from_arrays(
+                doc_offsets, pa.ListArray.from_arrays(position_offsets, pa.array(positions))),
+        })
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        """Write the index to a directory of uncompressed Arrow IPC files"""
+        os.makedirs(path, exist_ok=True)
+        posts = pa.table({'id': self.ids, 'year': self.years, 'engagement': self.engagement})
+        feather.write_feather(posts, os.path.join(path, POSTS_FILE),
+                              compression='uncompressed', chunksize=max(len(posts), 1))
+        # Postings last: their modification time marks a complete index
+        postings = self.postings.replace_schema_metadata({'version': str(INDEX_VERSION)})
+        feather.write_feather(postings, os.path.join(path, POSTINGS_FILE),
+                              compression='uncompressed', chunksize=max(len(postings), 1))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a saved index"""
+        postings = feather.read_table(os.path.join(path, POSTINGS_FILE), memory_map=True)
+        if (postings.schema.metadata or {}).get(b'version') != str(INDEX_VERSION).encode():
+            raise ValueError(f"{path} was built by an incompatible index version")
+        posts = feather.read_table(os.path.join(path, POSTS_FILE), memory_map=True)
+        return cls(postings, posts['id'].to_numpy(), posts['year'].to_numpy(),
+                   posts['engagement'].to_numpy())
+
+    # ------------------------------------------------------------------
+    # Matching primitives
+    # ------------------------------------------------------------------
+
+    def term_positions(self, term):
+        """{doc: positions} for a single token, read from that term's postings only"""
+        row = bisect.bisect_left(self._terms, term)
+        if row == len(self._terms) or self._terms[row] != term:
+            return {}
+        first, last = self._doc_offsets[row], self._doc_offsets[row + 1]
+        bounds = self._position_offsets[first:last + 1]
+        flat = self._positions[bounds[0]:bounds[-1]].tolist()
+        ends = (bounds - bounds[0]).tolist()
+        positions = [flat[start:end] for start, end in zip(ends, ends[1:])]
+        return dict(zip(self._docs[first:last].tolist(), positions))
+
+    def phrase_positions(self, phrase):
+        """{doc: start positions} for consecutive tokens"""
+        tokens = tokenize(phrase)
+        if not tokens:
+            return {}
+        if len(tokens) == 1:
+            return self.term_positions(tokens[0])
+        lists = [self.term_positions(token) for token in tokens]
+        # Start from the rarest token's documents
+        docs = set(min(lists, key=len))
+        for postings in lists:
+            docs &= postings.keys()
+        matches = {}
+        for doc in docs:
+            following = [set(postings[doc]) for postings in lists[1:]]
+            starts = tuple(p for p in lists[0][doc]
+                           if all(p + i + 1 in positions for i, positions in enumerate(following)))
+            if starts:
+                matches[doc] = starts
+        return matches
+
+    def phrase_spans(self, phrase):
+        """{doc: ((first, last), ...)} token spans of a term or phrase"""
+        length = len(tokenize(phrase))
+        return {doc: tuple((start, start + length - 1) for start in starts)
+                for doc, starts in self.phrase_positions(phrase).items()}
+
+    @staticmethod
+    def near(left, right, distance):
+        """{doc: spans} where a left and a right span are within `distance` tokens
+
+        The distance between two spans is the number of tokens from the end
+        of one to the start of the other (0 when they overlap). Each
+        qualifying pair is merged into the span covering both, so a chained
+        `a NEAR b NEAR c` measures c against the whole a..b match.
+        """
+        matches = {}
+        for doc in left.keys() & right.keys():
+            left_spans = np.asarray(left[doc])
+            right_spans = np.asarray(right[doc])
+            gaps = np.maximum(right_spans[:, 0][None, :] - left_spans[:, 1][:, None],
+                              left_spans[:, 0][:, None] - right_spans[:, 1][None, :])
+            pairs = np.nonzero(gaps <= distance)
+            if len(pairs[0]):
+                first = np.minimum(left_spans[pairs[0], 0], right_spans[pairs[1], 0])
+                last = np.maximum(left_spans[pairs[0], 1], right_spans[pairs[1], 1])
+                matches[doc] = tuple(sorted(set(zip(first.tolist(), last.tolist()))))
+        return matches
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def search(self, query, years=None, min_engagement=None):
+        """Indices of posts matching a query string and metadata filters"""
+        docs = _QueryParser(self, query).parse()
+        if years is not None or min_engagement is not None:
+            docs = np.fromiter(docs, dtype=np.int64, count=len(docs))
+            keep = np.ones(len(docs), dtype=bool)
+            if years is not None:
+                keep &= np.isin(self.years[docs], list(years))
+            if min_engagement is not None:
+                keep &= self.engagement[docs] >= min_engagement
+            docs = docs[keep]
+        return sorted(docs, key=lambda doc: -self.engagement[doc])
+
+    def search_ids(self, query, **filters):
+        """Post ids matching a query, most engaged first"""
+        return [self.ids[doc] for doc in self.search(query, **filters)]
+
+
+class _QueryParser:
+    """Recursive-descent parser that evaluates a query to a set of docs"""
+
+    def __init__(self, index, query):
+        self.index = index
+        self.tokens = QUERY_TOKEN.findall(query)
+        self.pos = 0
+
+    def parse(self):
+        docs = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in query")
+        return docs
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Query ended unexpectedly")
+        self.pos += 1
+        return token
+
+    def _or(self):
+        docs = self._and()
+        while self._peek() == 'OR':
+            self._next()
+            docs = docs | self._and()
+        return docs
+
+    def _and(self):
+        docs = self._not()
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self._next()
+            docs = docs & self._not()
+        return docs
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self._next()
+            return set(range(len(self.index))) - self._not()
+        return self._near()
+
+    def _near(self):
+        token = self._peek()
+        if token == '(':
+            self._next()
+            docs = self._or()
+            if self._next() != ')':
+                raise ValueError("Missing ')' in query")
+            if self._peek() and self._peek().startswith('NEAR/'):
+                raise ValueError("NEAR needs a term or phrase on each side")
+            return docs
+        spans = self._spans()
+        while self._peek() and self._peek().startswith('NEAR/'):
+            distance = int(self._next().split('/')[1])
+            spans = self.index.near(spans, self._spans(), distance)
+        return set(spans)
+
+    def _spans(self):
+        token = self._next()
+        if token in ('(', ')', 'AND', 'OR', 'NOT') or token.startswith('NEAR/'):
+            raise ValueError(f"Expected a term or phrase, found '{token}'")
+        phrase = token.strip('"')
+        if not tokenize(phrase):
+            raise ValueError(f"Empty phrase {token} in query" if token.startswith('"')
+                             else f"'{token}' has no words to search for")
+        return self.index.phrase_spans(phrase)
+
+
+def load_or_build(corpus_path, index_path=None):
+    """Load the saved index for a corpus, rebuilding it if the corpus changed"""
+    index_path = index_path or os.path.splitext(corpus_path)[0] + '.index'
+    postings_path = os.path.join(index_path, POSTINGS_FILE)
+    if (os.path.exists(postings_path)
+            and os.path.getmtime(postings_path) >= os.path.getmtime(corpus_path)):
+        return InvertedIndex.load(index_path)
+    df = read_corpus(corpus_path, columns=['id', 'title', 'text', 'score',
+                                           'num_comments', 'year'])
+    index = InvertedIndex.build(df)
+    index.save(index_path)
+    return index
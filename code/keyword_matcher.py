@@ -0,0 +1,232 @@
+"""
+Shared Keyword Matchers for the Coding and Deep-Dive Stages
+
+Two matching modes are available for a codebook:
+
+'substring' (KeywordMatcher) builds a single Aho-Corasick automaton from the
+keyword lists of one or more codebooks, so every post is scanned once and all
+category hits come back together. Matching keeps the semantics of the
+original `str.contains(keyword, regex=False)` loops: a category is flagged
+when any of its keywords appears anywhere in the (already lowercased) text,
+so 'pay' also matches "repay" and 'run' matches "brunch". Uses the C
+implementation from `pyahocorasick` when it is installed and falls back to a
+pure Python automaton otherwise.
+
+'token' (TokenMatcher) tokenizes each post once into the same word tokens as
+the term frequency engine and matches whole words only: single-word keywords
+by a set lookup and phrases by comparing n-grams at the positions of their
+first token, once the post is known to contain all of the phrase's words.
+
+"""
+
+import re
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from term_frequency import tokenize
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - depends on the environment
+    ahocorasick = None
+
+MATCH_MODES = ('substring', 'token')
+
+
+class KeywordMatcher:
+    """Single-pass multi-keyword matcher over a codebook of categories"""
+
+    mode = 'substring'
+
+    def __init__(self, codebook):
+        # codebook: {category_name: {'keywords': [...], ...}, ...}
+        # Several codebooks can be matched together by merging the dicts.
+        self.categories = list(codebook.keys())
+        self._index = {name: i for i, name in enumerate(self.categories)}
+
+        # keyword -> indices of every category that lists it
+        keyword_hits = {}
+        for name, info in codebook.items():
+            for keyword in info['keywords']:
+                keyword_hits.setdefault(keyword, set()).add(self._index[name])
+        self.keyword_hits = {kw: frozenset(hits) for kw, hits in keyword_hits.items()}
+
+        self._automaton = None
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, hits in self.keyword_hits.items():
+                self._automaton.add_word(keyword, hits)
+            if self.keyword_hits:
+                self._automaton.make_automaton()
+        else:
+            self._build_python_automaton()
+
+    # ------------------------------------------------------------------
+    # Pure Python fallback
+    # ------------------------------------------------------------------
+
+    def _build_python_automaton(self):
+        """Build goto/fail/output tables for the fallback automaton"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+
+        for keyword, hits in self.keyword_hits.items():
+            state = 0
+            for char in keyword:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(frozenset())
+                state = nxt
+            self._output[state] = self._output[state] | hits
+
+        # Breadth-first pass to set failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                if self._fail[nxt] == nxt:
+                    self._fail[nxt] = 0
+                self._output[nxt] = self._output[nxt] | self._output[self._fail[nxt]]
+
+    def _iter_python(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield output[state]
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+
+    def _iter_hits(self, text):
+        """Yield the category index sets for every keyword occurrence in text"""
+        if self._automaton is None:
+            yield from self._iter_python(text)
+        elif self.keyword_hits:
+            for _, hits in self._automaton.iter(text):
+                yield hits
+
+    def match_indices(self, text):
+        """Return the set of category indices whose keywords occur in text"""
+        found = set()
+        if not isinstance(text, str) or not text:
+            return found
+        total = len(self.categories)
+        for hits in self._iter_hits(text):
+            found |= hits
+            if len(found) == total:
+                break  # every category already flagged
+        return found
+
+    def match(self, text):
+        """Return the set of category names whose keywords occur in text"""
+        return {self.categories[i] for i in self.match_indices(text)}
+
+    def flag_matrix(self, texts):
+        """Boolean (posts x categories) array with one scan per post"""
+        flags = np.zeros((len(texts), len(self.categories)), dtype=bool)
+        for row, text in enumerate(texts):
+            for col in self.match_indices(text):
+                flags[row, col] = True
+        return flags
+
+    def flag_frame(self, texts):
+        """DataFrame of boolean category columns aligned with the texts Series"""
+        return pd.DataFrame(self.flag_matrix(texts), index=texts.index,
+                            columns=self.categories)
+
+
+class TokenMatcher(KeywordMatcher):
+    """Whole-word matcher over the word tokens of each post"""
+
+    mode = 'token'
+
+    def __init__(self, codebook):
+        self.categories = list(codebook.keys())
+        self._index = {name: i for i, name in enumerate(self.categories)}
+
+        # keyword tokens -> indices of every category that lists the keyword
+        keyword_hits = {}
+        for name, info in codebook.items():
+            for keyword in info['keywords']:
+                tokens = tuple(tokenize(keyword))
+                if tokens:
+                    keyword_hits.setdefault(tokens, set()).add(self._index[name])
+        self.keyword_hits = {tokens: frozenset(hits) for tokens, hits in keyword_hits.items()}
+
+        self._unigrams = {tokens[0]: hits for tokens, hits in self.keyword_hits.items()
+                          if len(tokens) == 1}
+        # first token -> [(phrase tokens, hits), ...]
+        self._phrases = {}
+        for tokens, hits in self.keyword_hits.items():
+            if len(tokens) > 1:
+                self._phrases.setdefault(tokens[0], []).append((tokens, hits))
+
+    def match_tokens(self, tokens):
+        """Return the set of category indices matched by a token list"""
+        token_set = set(tokens)
+        found = set()
+        for token in self._unigrams.keys() & token_set:
+            found |= self._unigrams[token]
+        for first in self._phrases.keys() & token_set:
+            for phrase, hits in self._phrases[first]:
+                if hits <= found or not token_set.issuperset(phrase):
+                    continue
+                # n-gram lookup at each position of the phrase's first token
+                n = len(phrase)
+                position = tokens.index(first)
+                while True:
+                    if tuple(tokens[position:position + n]) == phrase:
+                        found |= hits
+                        break
+                    try:
+                        position = tokens.index(first, position + 1)
+                    except ValueError:
+                        break
+        return found
+
+    def match_indices(self, text):
+        """Return the set of category indices whose keywords occur as words in text"""
+        if not isinstance(text, str) or not text:
+            return set()
+        return self.match_tokens(tokenize(text))
+
+
+def make_matcher(codebook, mode='substring'):
+    """KeywordMatcher or TokenMatcher for a {category: {'keywords': ...}} dict"""
+    if mode == 'substring':
+        return KeywordMatcher(codebook)
+    if mode == 'token':
+        return TokenMatcher(codebook)
+    raise ValueError(f"Unknown match mode '{mode}' (expected one of {MATCH_MODES})")
+
+
+def keyword_regex(keywords, mode='substring'):
+    """Regex matching any of the keywords, with the semantics of a match mode
+
+    In token mode each keyword must start and end on a word boundary, and
+    the words of a phrase may be separated by any non-word characters, the
+    same way TokenMatcher compares consecutive tokens.
+    """
+    if mode == 'substring':
+        return '|'.join(re.escape(keyword) for keyword in keywords)
+    if mode == 'token':
+        phrases = (r'\W+'.join(re.escape(t) for t in tokenize(keyword)) for keyword in keywords)
+        return r'\b(?:' + '|'.join(p for p in phrases if p) + r')\b'
+    raise ValueError(f"Unknown match mode '{mode}' (expected one of {MATCH_MODES})")
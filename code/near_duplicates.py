@@ -0,0 +1,230 @@
+"""
+Near-Duplicate Detection with MinHash Signatures and LSH Banding
+
+Reposts, crossposts and copy-pasted rants share nearly all of their wording
+without being identical strings, so they survive exact de-duplication and
+count several times in theme percentages and quote lists.
+
+Each post is reduced to the set of its word shingles (runs of SHINGLE_SIZE
+words, punctuation ignored). A MinHash signature of NUM_PERM values estimates
+the Jaccard similarity of two posts' shingle sets as the share of equal
+values. Signatures are split into BANDS bands, and posts with identical
+values in any band become candidates; candidates are found by sorting band
+keys, never by comparing all pairs, so the work grows roughly linearly with
+the corpus. Candidates whose estimated similarity reaches THRESHOLD are
+joined into clusters (connected components).
+
+One canonical post is marked per cluster: the earliest created, which is
+usually the original the others repeat. A post without near-duplicates is a
+cluster of one and its own canonical post.
+
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from compact_corpus import TextColumn
+from term_frequency import TOKEN_PATTERN
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 16  # 8 values per band: pairs above ~0.7 similarity become candidates
+THRESHOLD = 0.8
+SEED = 1
+
+# Posts hashed per batch
+BATCH_POSTS = 10000
+
+# Signature of a post without words; such posts are never near-duplicates
+EMPTY = np.uint32(0xFFFFFFFF)
+
+_MIX = np.uint64(0x100000001B3)
+_DENSIFY_STEP = np.uint64(0x9E3779B1)
+
+
+class _WordHashes(dict):
+    """64-bit hash of each word, stable across runs (unlike the salted hash())
+
+    A word is a whitespace-separated run with its non-word characters
+    removed; the hash of a word with nothing left is None.
+    """
+
+    def __missing__(self, word):
+        normalized = ''.join(TOKEN_PATTERN.findall(word))
+        value = None
+        if normalized:
+            digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+        self[word] = value
+        return value
+
+
+def _mix(values, seed):
+    """splitmix64 finalizer, so every bit of a shingle hash depends on all its words"""
+    values = values ^ np.uint64(seed)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, computed for batches of posts
+
+    One-permutation hashing: each shingle is hashed once, the hash picks one
+    of num_perm bins and the post keeps the smallest value per bin. Bins a
+    short post leaves empty borrow the next filled bin's value (rotation
+    densification), so equal bins still estimate Jaccard similarity. This
+    costs one hash per shingle rather than num_perm.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=SEED):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self._word_hashes = _WordHashes()
+
+    def signatures(self, texts):
+        """(posts x num_perm) uint32 signatures of lowercased texts; EMPTY rows for posts without words
+
+        `texts` is a TextColumn or a list of strings.
+        """
+        array = texts.array if isinstance(texts, TextColumn) else pa.array(texts, pa.large_string())
+        parts = [self._batch_signatures(array.slice(start, BATCH_POSTS))
+                 for start in range(0, len(array), BATCH_POSTS)]
+        return np.vstack(parts) if parts else np.zeros((0, self.num_perm), dtype=np.uint32)
+
+    def _words(self, texts):
+        """Word hashes of a batch of texts (Arrow strings) and the batch position of the post of each"""
+        split = pc.utf8_split_whitespace(texts)
+        words = pc.list_flatten(split).dictionary_encode()
+        post = pc.list_parent_indices(split).to_numpy()
+        # Only the distinct words of the batch go through Python
+        hashes = [self._word_hashes[word] for word in words.dictionary.to_pylist()]
+        known = np.array([value is not None for value in hashes], dtype=bool)
+        vocabulary = np.array([value or 0 for value in hashes], dtype=np.uint64)
+        indices = words.indices.to_numpy()
+        keep = known[indices]
+        return vocabulary[indices[keep]], post[keep]
+
+    def _shingles(self, texts):
+        """Shingle hashes of a batch and the batch position of the post of each"""
+        values, post = self._words(texts)
+        k = self.shingle_size
+        lengths = np.bincount(post, minlength=len(texts))
+        # A shingle starts at every word with k - 1 more words of its post after
+        # it; a post shorter than k words is one shingle
+        offset = np.arange(len(values)) - (np.cumsum(lengths) - lengths)[post]
+        starts = offset <= np.maximum(lengths - k, 0)[post]
+        padded_values = np.concatenate([values, np.zeros(k - 1, dtype=np.uint64)])
+        padded_post = np.concatenate([post, np.full(k - 1, -1)])
+        combined = values.copy()
+        for i in range(1, k):
+            same_post = padded_post[i:i + len(values)] == post
+            combined = combined * _MIX + np.where(same_post, padded_values[i:i + len(values)], 0)
+        return _mix(combined[starts], self.seed), post[starts]
+
+    def _batch_signatures(self, texts):
+        shingles, post = self._shingles(texts)
+        num_perm = self.num_perm
+        signatures = np.full(len(texts) * num_perm, EMPTY, dtype=np.uint32)
+        bins = (shingles >> np.uint64(32)) % np.uint64(num_perm)
+        np.minimum.at(signatures, post * num_perm + bins.astype(np.int64),
+                      (shingles & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+        return self._densify(signatures.reshape(len(texts), num_perm))
+
+    @staticmethod
+    def _densify(signatures):
+        """Fill each empty bin from the next filled bin to its right (wrapping around)"""
+        n, num_perm = signatures.shape
+        filled = signatures != EMPTY
+        if filled.all():
+            return signatures
+        doubled = np.hstack([signatures, signatures])
+        positions = np.where(np.hstack([filled, filled]), np.arange(2 * num_perm), 2 * num_perm - 1)
+        source = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+        distance = (source - np.arange(num_perm)).astype(np.uint64)
+        values = doubled[np.arange(n)[:, None], source].astype(np.uint64)
+        dense = ((values + distance * _DENSIFY_STEP) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        # Posts without words stay EMPTY throughout
+        dense[~filled.any(axis=1)] = EMPTY
+        return dense
+
+
+def candidate_pairs(signatures, bands=BANDS):
+    """(first, other) index arrays of posts sharing a band with an earlier post
+
+    Posts with identical values in a band form a bucket; each member is
+    paired with the bucket's first post only, so the number of candidates
+    stays linear even when a post was copied many times.
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    has_words = np.flatnonzero(signatures[:, 0] != EMPTY) if n else np.zeros(0, dtype=np.int64)
+    firsts = []
+    others = []
+    for band in range(bands):
+        block = signatures[has_words, band * rows:(band + 1) * rows].astype(np.uint64)
+        key = np.zeros(len(has_words), dtype=np.uint64)
+        for column in range(rows):
+            key = key * _MIX + block[:, column]
+        order = np.argsort(key, kind='stable')
+        ordered = key[order]
+        new_bucket = np.ones(len(order), dtype=bool)
+        new_bucket[1:] = ordered[1:] != ordered[:-1]
+        bucket_start = np.maximum.accumulate(np.where(new_bucket, np.arange(len(order)), 0))
+        firsts.append(has_words[order[bucket_start[~new_bucket]]])
+        others.append(has_words[order[~new_bucket]])
+    if not firsts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.unique(np.stack([np.concatenate(firsts), np.concatenate(others)]), axis=1)
+    return pairs[0], pairs[1]
+
+
+def similar_pairs(signatures, first, other, threshold=THRESHOLD, chunk=1 << 16):
+    """Mask of the candidate pairs whose estimated Jaccard similarity reaches threshold"""
+    keep = np.zeros(len(first), dtype=bool)
+    for start in range(0, len(first), chunk):
+        stop = start + chunk
+        equal = signatures[first[start:stop]] == signatures[other[start:stop]]
+        keep[start:stop] = equal.mean(axis=1) >= threshold
+    return keep
+
+
+def near_duplicate_clusters(ids, created, texts, threshold=THRESHOLD, hasher=None):
+    """Cluster columns for every post, aligned with the inputs
+
+    Returns a DataFrame with dup_canonical (this post is its cluster's
+    canonical post), dup_canonical_id (id of that canonical post) and
+    dup_cluster_size (posts in the cluster). `texts` are the lowercased posts.
+    """
+    hasher = hasher or MinHasher()
+    ids = np.asarray(ids, dtype=object)
+    signatures = hasher.signatures(texts)
+    n = len(signatures)
+    first, other = candidate_pairs(signatures)
+    keep = similar_pairs(signatures, first, other, threshold)
+    graph = sparse.coo_matrix((np.ones(int(keep.sum()), dtype=np.int8), (first[keep], other[keep])),
+                              shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    # Canonical post: earliest created in its cluster (undated last), then first in the corpus
+    created = pd.to_datetime(pd.Series(created)).reset_index(drop=True)
+    created = np.where(created.isna(), np.iinfo(np.int64).max,
+                       created.to_numpy(dtype='datetime64[ns]').astype(np.int64))
+    order = np.lexsort((np.arange(n), created, labels))
+    cluster_starts = np.ones(n, dtype=bool)
+    cluster_starts[1:] = labels[order][1:] != labels[order][:-1]
+    canonical_rows = np.empty(labels.max() + 1 if n else 0, dtype=np.int64)
+    canonical_rows[labels[order][cluster_starts]] = order[cluster_starts]
+    canonical = canonical_rows[labels]
+    return pd.DataFrame({
+        'dup_canonical': canonical == np.arange(n),
+        'dup_canonical_id': ids[canonical] if n else ids,
+        'dup_cluster_size': np.bincount(labels, minlength=labels.max() + 1 if n else 0)[labels],
+    })
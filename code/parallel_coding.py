@@ -0,0 +1,121 @@
+"""
+Process-Pool Parallel Coding over Corpus Chunks
+
+Splits the corpus into fixed-size chunks and runs codebook matching and
+quote extraction for each chunk in a `ProcessPoolExecutor`. The compiled
+matcher is handed to every worker once, through the pool initializer, not
+with each chunk. Chunks are merged back in corpus order, so the flags,
+counts and quote candidates are identical to a serial run. Chunks of a
+TextColumn are cut from its buffer as they are submitted, with at most two
+per worker in flight, so the corpus is never held as Python strings at once.
+
+Workers are started with the 'fork' method. The pipeline scripts run their
+analysis at import time, so start methods that re-import the main script
+('spawn', 'forkserver') would re-run it in every worker; where 'fork' is
+not available the coder falls back to running the chunks serially.
+
+"""
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from compact_corpus import TextColumn
+from quote_extraction import context_quote, sentence_pairs
+from sentence_index import PostSentences
+
+_worker_matcher = None
+
+
+def _init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def _flag_chunk(texts):
+    return _worker_matcher.flag_matrix(texts)
+
+
+def _sentence_pairs_chunk(texts):
+    return [sentence_pairs(PostSentences(text)) if isinstance(text, str) and text else []
+            for text in texts]
+
+
+def _context_quotes_chunk(args):
+    texts, keywords, mode = args
+    return [context_quote(PostSentences(text), keywords, mode=mode) for text in texts]
+
+
+class ParallelCoder:
+    """Runs matching and quote extraction for corpus chunks in worker processes"""
+
+    def __init__(self, matcher, workers=None, chunk_size=2000):
+        self.matcher = matcher
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._pool = None
+        if self.workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+                initargs=(matcher,))
+        else:
+            _init_worker(matcher)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _chunks(self, values):
+        if isinstance(values, TextColumn):
+            return values.chunks(self.chunk_size)
+        values = list(values)
+        return [values[i:i + self.chunk_size] for i in range(0, len(values), self.chunk_size)]
+
+    def _map(self, func, chunks):
+        # Results are collected in submission order, which keeps the merge
+        # deterministic regardless of which worker finishes first
+        if self._pool is None:
+            return [func(chunk) for chunk in chunks]
+        results = []
+        pending = deque()
+        for chunk in chunks:
+            pending.append(self._pool.submit(func, chunk))
+            if len(pending) >= 2 * self.workers:
+                results.append(pending.popleft().result())
+        results.extend(future.result() for future in pending)
+        return results
+
+    def flag_matrix(self, texts):
+        """Boolean (posts x categories) array, as KeywordMatcher.flag_matrix"""
+        parts = self._map(_flag_chunk, self._chunks(texts))
+        if not parts:
+            return np.zeros((0, len(self.matcher.categories)), dtype=bool)
+        return np.vstack(parts)
+
+    def flag_frame(self, texts):
+        """DataFrame of boolean category columns, as KeywordMatcher.flag_frame"""
+        return pd.DataFrame(self.flag_matrix(texts), index=texts.index,
+                            columns=self.matcher.categories)
+
+    def sentence_pairs(self, texts):
+        """Candidate (sentence, lowercase) pairs for every post, in order"""
+        parts = self._map(_sentence_pairs_chunk, self._chunks(texts))
+        return [pairs for part in parts for pairs in part]
+
+    def context_quotes(self, post_ids, texts, keywords):
+        """One keyword-context quote (or None) per post, in order"""
+        chunks = [(chunk, keywords, self.matcher.mode) for chunk in self._chunks(texts)]
+        parts = self._map(_context_quotes_chunk, chunks)
+        return [quote for part in parts for quote in part]
@@ -0,0 +1,256 @@
+"""
+Persistent Post Index for Incremental Collection
+
+SQLite store keyed by submission id that survives between collector runs.
+It remembers when each post was created, the last score and comment count
+we saw, and per-listing checkpoints, so a daily run only has to page through
+the posts that are new since the last run and refresh engagement for posts
+that are still young enough to change.
+
+"""
+
+import heapq
+import sqlite3
+import time
+from datetime import datetime
+
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    text TEXT,
+    score INTEGER,
+    num_comments INTEGER,
+    created_utc REAL,
+    url TEXT,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS posts_created ON posts (created_utc);
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    post_id TEXT,
+    parent_id TEXT,
+    depth INTEGER,
+    text TEXT,
+    score INTEGER,
+    created_utc REAL,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS comments_post ON comments (post_id);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    value TEXT,
+    updated REAL
+);
+"""
+
+POSTS_QUERY = "SELECT id, title, text, score, num_comments, created_utc, url FROM posts"
+# Most engaged first; ties newest first, then by id
+ENGAGEMENT_ORDER = "score + num_comments DESC, created_utc DESC, id"
+COMMENTS_QUERY = ("SELECT id, post_id, parent_id, depth, text, score, created_utc FROM comments "
+                  "ORDER BY post_id, created_utc")
+
+
+class PostStore:
+    """SQLite-backed index of every post the collector has seen"""
+
+    def __init__(self, path='cna_posts.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def known_ids(self):
+        """Set of all stored submission ids"""
+        return {row[0] for row in self.conn.execute("SELECT id FROM posts")}
+
+    def upsert(self, records):
+        """Insert new posts and update text/engagement of known ones"""
+        now = time.time()
+        rows = [(r['id'], r['title'], r['text'], r['score'], r['num_comments'],
+                 r['created_date'].timestamp(), r['url'], now, now)
+                for r in records]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO posts (id, title, text, score, num_comments,
+                                   created_utc, url, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    title = excluded.title,
+                    text = excluded.text,
+                    score = excluded.score,
+                    num_comments = excluded.num_comments,
+                    last_seen = excluded.last_seen
+            """, rows)
+        return len(rows)
+
+    def update_engagement(self, updates):
+        """Apply (id, score, num_comments) tuples from an engagement refresh"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE posts SET score = ?, num_comments = ?, last_seen = ? WHERE id = ?",
+                [(score, comments, now, post_id) for post_id, score, comments in updates])
+
+    def ids_created_since(self, created_utc):
+        """Ids of posts created at or after the given UTC timestamp"""
+        cursor = self.conn.execute(
+            "SELECT id FROM posts WHERE created_utc >= ? ORDER BY created_utc DESC",
+            (created_utc,))
+        return [row[0] for row in cursor]
+
+    def upsert_comments(self, records):
+        """Insert new comments and update text/score of known ones"""
+        now = time.time()
+        rows = [(r['id'], r['post_id'], r['parent_id'], r['depth'], r['text'], r['score'],
+                 r['created_date'].timestamp(), now, now)
+                for r in records]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO comments (id, post_id, parent_id, depth, text, score,
+                                      created_utc, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    text = excluded.text,
+                    score = excluded.score,
+                    last_seen = excluded.last_seen
+            """, rows)
+        return len(rows)
+
+    def comment_counts_seen(self):
+        """{post_id: num_comments when its comments were last fetched}"""
+        cursor = self.conn.execute(
+            "SELECT name, value FROM checkpoints WHERE name LIKE 'comments/%'")
+        return {name.split('/', 1)[1]: int(value) for name, value in cursor}
+
+    def load_comments(self, post_ids=None):
+        """Stored comments as a flat DataFrame, optionally for some posts only"""
+        df = pd.read_sql_query(COMMENTS_QUERY, self.conn)
+        if post_ids is not None:
+            df = df[df['post_id'].isin(set(post_ids))]
+        df['created_date'] = df['created_utc'].map(datetime.fromtimestamp)
+        df['year'] = df['created_date'].map(lambda d: d.year)
+        return df[['id', 'post_id', 'parent_id', 'depth', 'text', 'score',
+                   'created_date', 'year']].reset_index(drop=True)
+
+    def get_checkpoint(self, name):
+        """Return (value, updated) for a checkpoint, or (None, None)"""
+        row = self.conn.execute(
+            "SELECT value, updated FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def set_checkpoint(self, name, value):
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO checkpoints (name, value, updated) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value,
+                                                 updated = excluded.updated
+            """, (name, str(value), time.time()))
+
+    def load_posts(self, start_utc=None, end_utc=None):
+        """Stored posts as a DataFrame with the collector's columns
+
+        With `start_utc` / `end_utc`, only posts created in [start, end).
+        """
+        query, params = _posts_query(start_utc, end_utc)
+        df = pd.read_sql_query(query, self.conn, params=params)
+        return _to_collector_columns(df)
+
+    def iter_posts(self, chunksize=10000, start_utc=None, end_utc=None, by_engagement=False):
+        """Stored posts (optionally created in [start, end)) as DataFrame chunks
+
+        With `by_engagement`, most engaged first (see ENGAGEMENT_ORDER).
+        """
+        query, params = _posts_query(start_utc, end_utc)
+        if by_engagement:
+            query += f" ORDER BY {ENGAGEMENT_ORDER}"
+        for chunk in pd.read_sql_query(query, self.conn, params=params, chunksize=chunksize):
+            yield _to_collector_columns(chunk)
+
+
+def _posts_query(start_utc=None, end_utc=None):
+    """POSTS_QUERY limited to a [start, end) range of created_utc, and its parameters"""
+    conditions = []
+    params = []
+    if start_utc is not None:
+        conditions.append("created_utc >= ?")
+        params.append(start_utc)
+    if end_utc is not None:
+        conditions.append("created_utc < ?")
+        params.append(end_utc)
+    if conditions:
+        return f"{POSTS_QUERY} WHERE {' AND '.join(conditions)}", params
+    return POSTS_QUERY, params
+
+
+def _to_collector_columns(df):
+    df['created_date'] = df['created_utc'].map(datetime.fromtimestamp)
+    df['year'] = df['created_date'].map(lambda d: d.year)
+    return df[['id', 'title', 'text', 'score', 'num_comments',
+               'created_date', 'year', 'url']]
+
+
+def merged_posts(stores, chunksize=10000, stats=None, start_utc=None, end_utc=None,
+                 by_engagement=False):
+    """Posts of several per-subreddit stores as chunks with a 'source' column
+
+    `stores` is a list of (source, PostStore) pairs. A submission id already
+    in an earlier store is dropped, so the first listed source wins;
+    `stats`, if given, gets the number of dropped duplicates. With
+    `start_utc` / `end_utc`, only posts created in [start, end) are read.
+
+    With `by_engagement`, the chunks together are in ENGAGEMENT_ORDER across
+    all stores (each store is read in that order and the streams merged), so
+    a chunked export matches sorting the whole corpus by engagement.
+    """
+    if by_engagement:
+        yield from _merged_by_engagement(stores, chunksize, stats, start_utc, end_utc)
+        return
+    seen = set()
+    for source, store in stores:
+        for chunk in store.iter_posts(chunksize, start_utc, end_utc):
+            duplicate = chunk['id'].isin(seen)
+            if stats is not None:
+                stats['duplicates'] = stats.get('duplicates', 0) + int(duplicate.sum())
+            chunk = chunk[~duplicate].assign(source=source)
+            seen.update(chunk['id'])
+            yield chunk
+
+
+def _merged_by_engagement(stores, chunksize, stats, start_utc, end_utc):
+    def ranked_rows(source, store, skip):
+        for chunk in store.iter_posts(chunksize, start_utc, end_utc, by_engagement=True):
+            duplicate = chunk['id'].isin(skip)
+            if stats is not None:
+                stats['duplicates'] = stats.get('duplicates', 0) + int(duplicate.sum())
+            chunk = chunk[~duplicate].assign(source=source)
+            engagement = chunk['score'] + chunk['num_comments']
+            created = chunk['created_date'].astype('int64')
+            yield from zip(-engagement, -created, chunk['id'], chunk.to_dict('records'))
+
+    # A post's created date is the same in every store, so a duplicate is in
+    # the window for all of them or for none
+    earlier = set()
+    streams = []
+    for source, store in stores:
+        ids = store.known_ids()
+        streams.append(ranked_rows(source, store, ids & earlier))
+        earlier |= ids
+
+    batch = []
+    for *_, record in heapq.merge(*streams):
+        batch.append(record)
+        if len(batch) == chunksize:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
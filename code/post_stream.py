@@ -0,0 +1,144 @@
+"""
+Streaming Helpers for Bounded-Memory Collection
+
+In streaming mode the collector never holds the crawl in memory: every post
+is appended to a JSONL log the moment a listing worker accepts it, and the
+export step walks the stored corpus in chunks. Running statistics (post
+count, date range, year breakdown) and the top-N most engaged posts are kept
+incrementally, the latter in a fixed-size heap.
+
+Posts are ranked most engaged first, ties newest first and then by id, the
+same order as `rank_by_engagement` and the post store's ENGAGEMENT_ORDER, so
+streamed and in-memory exports list tied posts identically.
+
+"""
+
+import heapq
+import itertools
+import json
+import threading
+from collections import Counter
+from datetime import datetime
+from functools import total_ordering
+
+
+class JsonlPostLog:
+    """Append-only, thread-safe JSONL log of collected posts"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Line buffered so every accepted post is on disk if the run crashes
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.start_offset = self._file.tell()
+        self.written = 0
+
+    def write(self, record):
+        line = json.dumps(record, default=_encode, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self.written += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def iter_jsonl(path, start_offset=0):
+    """Yield records from a JSONL post log, starting at a byte offset"""
+    with open(path, encoding='utf-8') as f:
+        f.seek(start_offset)
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record['created_date'] = datetime.fromisoformat(record['created_date'])
+            yield record
+
+
+def batched(records, size):
+    """Group an iterable of records into lists of at most `size`"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rank_by_engagement(frame):
+    """Posts most engaged first; ties newest first, then by id"""
+    return frame.sort_values(['engagement', 'created_date', 'id'], ascending=[False, False, True])
+
+
+@total_ordering
+class _Descending:
+    """Wraps a value so that it sorts in reverse (ids rank ascending in the heap)"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
+def _rank_key(engagement, row):
+    """Heap key that is larger for posts ranked higher by rank_by_engagement"""
+    return (engagement, row['created_date'], _Descending(row['id']))
+
+
+class StreamSummary:
+    """Running corpus statistics plus a top-N engagement heap"""
+
+    def __init__(self, top_n=150, min_text_length=50):
+        self.top_n = top_n
+        self.min_text_length = min_text_length
+        self.count = 0
+        self.year_counts = Counter()
+        self.first_date = None
+        self.last_date = None
+        self._heap = []  # (rank key, sequence, row) min-heap of the best top_n
+        self._sequence = itertools.count()
+
+    def add_frame(self, frame):
+        """Update the statistics with one chunk of posts"""
+        if len(frame) == 0:
+            return
+        self.count += len(frame)
+        self.year_counts.update(frame['year'].tolist())
+        first, last = frame['created_date'].min(), frame['created_date'].max()
+        self.first_date = first if self.first_date is None else min(self.first_date, first)
+        self.last_date = last if self.last_date is None else max(self.last_date, last)
+
+        # Only substantive posts (not just a title) compete for the top-N
+        substantive = frame[frame['text'].fillna('').str.len() > self.min_text_length]
+        engagement = substantive['score'] + substantive['num_comments']
+        for row, value in zip(substantive.to_dict('records'), engagement.tolist()):
+            item = (_rank_key(value, row), next(self._sequence), row)
+            if len(self._heap) < self.top_n:
+                heapq.heappush(self._heap, item)
+            elif item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def top_records(self):
+        """The top-N substantive posts in rank_by_engagement order"""
+        ranked = sorted(self._heap, key=lambda item: item[0], reverse=True)
+        return [dict(row, engagement=key[0]) for key, _, row in ranked]
@@ -0,0 +1,156 @@
+"""
+Batched Quote-Candidate Extraction
+
+Replaces the per-row `iterrows()` loops with frame operations. Posts are
+exploded once into a sentence-level frame; category filters, trigger-word
+tests and length limits are then applied as vectorized masks over all
+sentences at once, and engagement is computed once per post.
+
+Trigger words keep the substring semantics of the original
+`any(word in sent_lower ...)` tests by default; with mode='token' they match
+whole words only, as the token matcher does.
+
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from compact_corpus import join_text
+from keyword_matcher import keyword_regex
+
+QUOTE_COLUMNS = ['post_id', 'category', 'quote', 'score', 'engagement']
+
+
+def sentence_pairs(post, max_length=200):
+    """(sentence, lowercase sentence) pairs of a post that might be good quotes
+
+    `post` is a PostSentences entry from the sentence index.
+    """
+    good_sentences = []
+    for sent, sent_lower in zip(post.sentences, post.sentences_lower):
+        sent = sent.strip()
+        sent_lower = sent_lower.strip()
+        # Keep sentences that are 20-200 chars and contain meaningful content
+        if 20 < len(sent) < max_length and not sent_lower.startswith(('http', 'www')):
+            good_sentences.append((sent, sent_lower))
+    return good_sentences
+
+
+def find_keyword(text_lower, keyword, mode='substring'):
+    """Offset of the first occurrence of keyword in the text, or -1"""
+    if mode == 'substring':
+        return text_lower.find(keyword)
+    match = re.search(keyword_regex([keyword], mode), text_lower)
+    return match.start() if match else -1
+
+
+def context_quote(post, keywords, context_words=50, mode='substring'):
+    """Extract quote with context around the first keyword found in a post"""
+    text, text_lower = post.text, post.lower
+    for keyword in keywords:
+        idx = find_keyword(text_lower, keyword, mode)
+        if idx != -1:
+            # Get surrounding context
+            start = max(0, idx - context_words*5)
+            end = min(len(text), idx + context_words*5)
+
+            snippet = text[start:end].strip()
+
+            # Clean up
+            if start > 0:
+                snippet = '...' + snippet
+            if end < len(text):
+                snippet = snippet + '...'
+
+            # Try to get complete sentences (cut from the cached offsets)
+            sentences = post.window_pieces(start, end)
+            if len(sentences) >= 2:
+                return '. '.join(sentences[1:-1]).strip()
+            else:
+                return snippet
+
+    return None
+
+
+def contains_any(lower, words, mode='substring'):
+    """Vectorized `any(word in text for word in words)` over a Series"""
+    return lower.str.contains(keyword_regex(words, mode), regex=True, na=False)
+
+
+def limit_posts(post_mask, first_n_posts=None):
+    """Restrict a post mask to its first n matching posts (like .head(n))"""
+    if first_n_posts is None:
+        return post_mask
+    return post_mask & (post_mask.cumsum() <= first_n_posts)
+
+
+def sentence_frame(df, pairs_column='potential_quotes'):
+    """One row per candidate sentence, exploded from (sentence, lower) pairs
+
+    Columns: row (index label of the post in df), post_id, position (order
+    of the sentence within its post), quote, quote_lower, score, engagement.
+    """
+    counts = np.array([len(pairs) for pairs in df[pairs_column]], dtype=int)
+    pairs = [pair for pairs in df[pairs_column] for pair in pairs]
+    engagement = df['score'] + df['num_comments']
+    sentences = pd.DataFrame({
+        'row': df.index.repeat(counts),
+        'post_id': df['id'].to_numpy().repeat(counts),
+        'position': np.array([i for n in counts for i in range(n)], dtype=int),
+        'quote': pd.Series([sent for sent, _ in pairs], dtype=object),
+        'quote_lower': pd.Series([lower for _, lower in pairs], dtype=object),
+        'score': df['score'].to_numpy().repeat(counts),
+        'engagement': engagement.to_numpy().repeat(counts),
+    })
+    return sentences
+
+
+def sentence_candidates(sentences, post_mask, category, word_groups,
+                        first_n_posts=None, first_n_sentences=None, mode='substring'):
+    """Sentences from posts in post_mask that match every word group
+
+    `word_groups` is a list of word lists; a sentence must contain at least
+    one word from each group (matched in the given match mode).
+    """
+    post_ok = limit_posts(post_mask, first_n_posts)
+    mask = post_ok.reindex(sentences['row']).to_numpy()
+    if first_n_sentences is not None:
+        mask &= (sentences['position'] < first_n_sentences).to_numpy()
+    selected = sentences[mask]
+    for words in word_groups:
+        selected = selected[contains_any(selected['quote_lower'], words, mode)]
+    selected = selected.assign(category=category)
+    return selected[QUOTE_COLUMNS]
+
+
+def context_quote_candidates(df, post_mask, extract, keywords, first_n_posts=None,
+                             min_length=50, max_length=300, extract_many=None):
+    """Keyword-context quotes for the posts in post_mask
+
+    `extract(text, keywords, post_id=...)` builds one quote per post (or
+    None); only the extraction itself runs per post, the selection, length
+    filter and engagement are computed on whole columns. `extract_many(ids,
+    texts, keywords)`, if given, replaces the per-post loop (for example
+    with ParallelCoder.context_quotes). Without a full_text column in df it
+    is joined from title and text for the selected posts only.
+    """
+    posts = df[limit_posts(post_mask, first_n_posts)]
+    if 'full_text' in posts:
+        texts = posts['full_text']
+    else:
+        texts = join_text(posts['title'], posts['text'])
+    if extract_many is not None:
+        extracted = extract_many(posts['id'], texts, keywords)
+    else:
+        extracted = [extract(text, keywords, post_id=post_id)
+                     for post_id, text in zip(posts['id'], texts)]
+    quotes = pd.Series(extracted, index=posts.index, dtype=object)
+    lengths = quotes.str.len()
+    keep = quotes.notna() & (lengths > min_length) & (lengths < max_length)
+    return pd.DataFrame({
+        'post_id': posts['id'][keep],
+        'quote': quotes[keep],
+        'engagement': (posts['score'] + posts['num_comments'])[keep],
+    }).reset_index(drop=True)
@@ -0,0 +1,194 @@
+"""
+Record-and-Replay Backend for the Reddit Client
+
+Lets the collector run without network or credentials, so the collection
+path can be benchmarked and regression-tested repeatably.
+
+Recording wraps the HTTP requestor PRAW uses (the documented
+`requestor_class` hook of `praw.Reddit`): every raw API response - listing
+pages, `info` lookups, comment trees and the token request - is saved under
+a hash of its method, path, query parameters and form data. Credentials are
+never written: the token request is keyed on its path alone and its token
+is replaced. Replaying serves the saved responses from disk in the order
+they were recorded (repeating the last one for further identical requests),
+optionally after a fixed latency and with simulated `X-Ratelimit-*`
+headers, so rate-limit handling behaves as it would against Reddit.
+
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from prawcore import Requestor
+
+TOKEN_PATH = '/api/v1/access_token'
+KEPT_HEADERS = ('content-type', 'x-ratelimit-remaining', 'x-ratelimit-used',
+                'x-ratelimit-reset')
+
+# Reddit counts requests over 10-minute windows
+RATE_LIMIT_WINDOW = 600
+
+
+class ReplayMissError(LookupError):
+    """A request that is not in the recording"""
+
+
+class Cassette:
+    """Directory of recorded responses, one gzipped JSON file per request key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._recorded = {}
+        self._loaded = {}
+        self._played = {}
+        self.recorded = 0
+        self.replayed = 0
+
+    @staticmethod
+    def describe(method, url, params=None, data=None):
+        """Normalized request: method, path, sorted parameters and form data"""
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query.update({k: str(v) for k, v in (params or {}).items()})
+        if parts.path == TOKEN_PATH:
+            data = None  # grant fields may hold credentials
+        elif isinstance(data, dict):
+            data = sorted((k, str(v)) for k, v in data.items())
+        elif data:
+            data = sorted((k, str(v)) for k, v in data)
+        return {'method': method.upper(), 'path': parts.path,
+                'params': sorted(query.items()), 'data': data or None}
+
+    def _path(self, request):
+        key = hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:24] + '.json.gz')
+
+    def record(self, request, response):
+        """Save a response (appended to this session's responses for the request)"""
+        body = response.text
+        if request['path'] == TOKEN_PATH and response.status_code == 200:
+            payload = response.json()
+            payload['access_token'] = 'replayed-token'
+            payload.pop('refresh_token', None)
+            body = json.dumps(payload)
+        entry = {
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            'body': body,
+        }
+        path = self._path(request)
+        with self._lock:
+            responses = self._recorded.setdefault(path, [])
+            responses.append(entry)
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+                json.dump({'request': request, 'responses': responses}, f)
+            os.replace(path + '.tmp', path)
+            self.recorded += 1
+
+    def play(self, request):
+        """Next recorded response entry for a request"""
+        path = self._path(request)
+        with self._lock:
+            if path not in self._loaded:
+                if not os.path.exists(path):
+                    raise ReplayMissError(f"No recorded response for {request['method']} "
+                                          f"{request['path']} {request['params']}")
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    self._loaded[path] = json.load(f)['responses']
+            responses = self._loaded[path]
+            count = self._played.get(path, 0)
+            self._played[path] = count + 1
+            self.replayed += 1
+            return responses[min(count, len(responses) - 1)]
+
+
+class SimulatedRateLimit:
+    """X-Ratelimit-* headers for a budget of requests per 10-minute window"""
+
+    def __init__(self, requests_per_window, window=RATE_LIMIT_WINDOW, clock=time.time):
+        self.requests_per_window = requests_per_window
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window_start = clock()
+        self._used = 0
+
+    def headers(self):
+        with self._lock:
+            now = self._clock()
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._used = 0
+            self._used += 1
+            return {
+                'x-ratelimit-used': str(self._used),
+                'x-ratelimit-remaining': str(max(self.requests_per_window - self._used, 0)),
+                'x-ratelimit-reset': str(int(self._window_start + self.window - now)),
+            }
+
+
+class RecordingRequestor(Requestor):
+    """Requestor that saves every response it receives to a cassette"""
+
+    def __init__(self, *args, cassette, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        response = super().request(method, url, params=params, data=data, **kwargs)
+        self.cassette.record(Cassette.describe(method, url, params, data), response)
+        return response
+
+
+class ReplayRequestor(Requestor):
+    """Requestor that answers from a cassette and never opens a connection"""
+
+    def __init__(self, *args, cassette, latency=0.0, rate_limit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+        self.latency = latency
+        self.rate_limit = rate_limit
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        entry = self.cassette.play(Cassette.describe(method, url, params, data))
+        if self.latency:
+            time.sleep(self.latency)
+        headers = {k: v for k, v in entry['headers'].items()
+                   if not k.lower().startswith('x-ratelimit')}
+        if self.rate_limit is not None:
+            headers.update(self.rate_limit.headers())
+        response = requests.Response()
+        response.status_code = entry['status']
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.url = url
+        return response
+
+
+def client_options(record_dir=None, replay_dir=None, latency=0.0, rate_limit=None):
+    """Extra `praw.Reddit` keyword arguments for recording or replaying
+
+    `rate_limit` is a number of requests per 10-minute window to simulate
+    in replay. Returns ({}, None) when neither directory is given, otherwise
+    the options and the shared Cassette (for its counters).
+    """
+    if replay_dir:
+        cassette = Cassette(replay_dir)
+        simulated = SimulatedRateLimit(rate_limit) if rate_limit else None
+        return {'requestor_class': ReplayRequestor,
+                'requestor_kwargs': {'cassette': cassette, 'latency': latency,
+                                     'rate_limit': simulated}}, cassette
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+        cassette = Cassette(record_dir)
+        return {'requestor_class': RecordingRequestor,
+                'requestor_kwargs': {'cassette': cassette}}, cassette
+    return {}, None
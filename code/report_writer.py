@@ -0,0 +1,189 @@
+"""
+Streaming Writer for the Multi-Sheet Excel Reports
+
+Writes report workbooks row by row through a constant-memory backend instead
+of building them with `pd.ExcelWriter(engine='openpyxl')`. Each sheet is
+converted and written in fixed-size row chunks, so memory stays bounded by
+the chunk size rather than by the size of the workbook.
+
+Sheets longer than Excel's row limit are split into numbered shards
+('All_Coded_Posts', 'All_Coded_Posts_2', ...). Wide text columns can go to a
+Parquet or CSV sidecar file next to the workbook instead of being embedded
+in it; sidecars are written in background threads while the sheets stream.
+Sheets of one workbook are written one after another, since neither backend
+can write a workbook from several threads.
+
+Uses `xlsxwriter` in constant-memory mode when it is installed and falls back
+to openpyxl's write-only workbook otherwise.
+
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - depends on the environment
+    xlsxwriter = None
+
+EXCEL_MAX_ROWS = 1048576  # including the header row
+SHEET_NAME_LENGTH = 31
+CHUNK_ROWS = 10000
+SIDECAR_FORMATS = ('parquet', 'csv')
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Set REPORT_SIDECAR=parquet (or csv) to move full text columns to sidecars
+REPORT_SIDECAR = os.getenv('REPORT_SIDECAR', '').lower() or None
+
+
+class ExcelReport:
+    """Write-only workbook that streams DataFrames into sheets"""
+
+    def __init__(self, path, sidecar_format=REPORT_SIDECAR, max_rows=EXCEL_MAX_ROWS,
+                 chunk_rows=CHUNK_ROWS):
+        if sidecar_format not in (None,) + SIDECAR_FORMATS:
+            raise ValueError(f"Unknown sidecar format '{sidecar_format}'")
+        self.path = path
+        self.sidecar_format = sidecar_format
+        self.max_rows = max_rows - 1  # data rows per sheet, under the header
+        self.chunk_rows = chunk_rows
+        self.sheets = []
+        self.sidecars = []
+        self._sidecar_jobs = []
+        self._executor = None
+
+        if xlsxwriter is not None:
+            self._workbook = xlsxwriter.Workbook(path, {
+                'constant_memory': True,
+                'default_date_format': DATETIME_FORMAT,
+                'strings_to_urls': False,
+                'strings_to_formulas': False,
+                'strings_to_numbers': False,
+            })
+            self._bold = self._workbook.add_format({'bold': True, 'border': 1,
+                                                    'align': 'center'})
+        else:
+            import openpyxl
+            self._workbook = openpyxl.Workbook(write_only=True)
+
+    # ------------------------------------------------------------------
+    # Sheets
+    # ------------------------------------------------------------------
+
+    def add_sheet(self, name, df, index=False, sidecar_columns=()):
+        """Stream a DataFrame into one sheet, or several shards if it is long
+
+        With a sidecar format set, `sidecar_columns` are left out of the
+        sheet and the full frame is written to '<workbook>_<name>.<format>'.
+        """
+        if self.sidecar_format and any(c in df.columns for c in sidecar_columns):
+            self._write_sidecar(name, df)
+            df = df.drop(columns=[c for c in sidecar_columns if c in df.columns])
+
+        header = list(df.columns)
+        if index:
+            header = [df.index.name] + header
+            df = df.reset_index(drop=False)
+
+        n_rows = len(df)
+        shard_count = max(1, -(-n_rows // self.max_rows))
+        for shard in range(shard_count):
+            sheet_name = _shard_name(name, shard)
+            start = shard * self.max_rows
+            stop = min(n_rows, start + self.max_rows)
+            self._write_rows(sheet_name, header, df, start, stop)
+            self.sheets.append(sheet_name)
+
+    def _write_rows(self, sheet_name, header, df, start, stop):
+        if xlsxwriter is not None:
+            worksheet = self._workbook.add_worksheet(sheet_name)
+            for col, label in enumerate(header):
+                if label is not None:
+                    worksheet.write(0, col, label, self._bold)
+            row = 1
+            for values in _iter_rows(df, start, stop, self.chunk_rows):
+                worksheet.write_row(row, 0, values)
+                row += 1
+        else:
+            worksheet = self._workbook.create_sheet(sheet_name)
+            worksheet.append(header)
+            for values in _iter_rows(df, start, stop, self.chunk_rows):
+                worksheet.append(values)
+
+    # ------------------------------------------------------------------
+    # Sidecars
+    # ------------------------------------------------------------------
+
+    def _write_sidecar(self, name, df):
+        stem = os.path.splitext(self.path)[0]
+        path = f"{stem}_{name}.{self.sidecar_format}"
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2)
+        self._sidecar_jobs.append(self._executor.submit(_save_sidecar, df, path))
+        self.sidecars.append(path)
+
+    # ------------------------------------------------------------------
+    # Closing
+    # ------------------------------------------------------------------
+
+    def close(self):
+        if self._executor is not None:
+            for job in self._sidecar_jobs:
+                job.result()  # surface sidecar errors
+            self._executor.shutdown()
+            self._executor = None
+        if self._workbook is not None:
+            if xlsxwriter is not None:
+                self._workbook.close()
+            else:
+                self._workbook.save(self.path)
+            self._workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _shard_name(name, shard):
+    if shard == 0:
+        return name[:SHEET_NAME_LENGTH]
+    suffix = f"_{shard + 1}"
+    return name[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+
+
+def _cell_values(column):
+    """Python values for one column chunk, with None for missing cells"""
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        column = column.dt.tz_localize(None)  # Excel has no time zones
+    values = column.tolist()
+    missing = column.isna().to_numpy()
+    if missing.any():
+        values = [None if m else v for v, m in zip(values, missing)]
+    return values
+
+
+def _iter_rows(df, start, stop, chunk_rows):
+    """Rows of df[start:stop] as lists, converted one chunk at a time"""
+    for chunk_start in range(start, stop, chunk_rows):
+        chunk = df.iloc[chunk_start:min(stop, chunk_start + chunk_rows)]
+        columns = [_cell_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+        yield from map(list, zip(*columns))
+
+
+def _save_sidecar(df, path):
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False, compression='zstd')
+    return path
+
+
+def write_excel(df, path, sheet_name='Sheet1', **kwargs):
+    """Single-sheet workbook, the streaming counterpart of df.to_excel(path)"""
+    with ExcelReport(path, **kwargs) as report:
+        report.add_sheet(sheet_name, df)
+    return path
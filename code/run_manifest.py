@@ -0,0 +1,164 @@
+"""
+Per-Phase Instrumentation and Run Manifests
+
+Each pipeline script marks its numbered phases with `run.phase(...)`; the
+recorder closes the previous phase and opens the next, so the flat scripts
+need one line per phase rather than an indented block. For every phase it
+records wall time, CPU time of the process and an optional row count. At
+the end it writes a JSON run manifest next to the outputs
+(`<script>_run_manifest.json`) with the settings, versions, process peak RSS
+and output files of the run.
+
+Set TRACE_MEMORY=1 to also record each phase's peak memory traced by
+`tracemalloc` (Python and NumPy allocations; Arrow buffers and worker
+processes are not included). It is off by default because tracing slows
+allocation-heavy phases down severalfold. Set PROFILE_PHASES=1 to capture a
+cProfile of every phase; profiles
+are saved under `run_profiles/` and their top functions are listed in the
+manifest.
+
+"""
+
+import cProfile
+import json
+import os
+import platform
+import pstats
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+TRACE_MEMORY = os.getenv('TRACE_MEMORY', '0') == '1'
+PROFILE_PHASES = os.getenv('PROFILE_PHASES', '0') == '1'
+PROFILE_DIR = 'run_profiles'
+PROFILE_TOP = 10
+
+MB = 1024 * 1024
+
+
+class RunRecorder:
+    """Collects per-phase timings and memory figures for one script run"""
+
+    def __init__(self, script, settings=None, trace_memory=TRACE_MEMORY,
+                 profile=PROFILE_PHASES):
+        self.script = os.path.splitext(os.path.basename(script))[0]
+        self.settings = settings or {}
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.started = datetime.now()
+        self.phases = []
+        self.outputs = []
+        self._current = None
+        self._profiler = None
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def phase(self, name, rows=None):
+        """Finish the current phase (if any) and start timing the next one"""
+        self._finish_phase()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._current = {
+            'name': name,
+            'rows': rows,
+            '_wall': time.perf_counter(),
+            '_cpu': time.process_time(),
+        }
+
+    def rows(self, count):
+        """Row count processed by the current phase"""
+        if self._current is not None:
+            self._current['rows'] = int(count)
+
+    def output(self, *paths):
+        """Register files written by the run"""
+        self.outputs.extend(paths)
+
+    def _finish_phase(self):
+        current = self._current
+        if current is None:
+            return
+        record = {
+            'name': current['name'],
+            'wall_seconds': round(time.perf_counter() - current['_wall'], 4),
+            'cpu_seconds': round(time.process_time() - current['_cpu'], 4),
+            'peak_traced_mb': None,
+            'rows': current['rows'],
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            record['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / MB, 2)
+        if self._profiler is not None:
+            self._profiler.disable()
+            record['profile'] = self._save_profile(len(self.phases) + 1, current['name'])
+            self._profiler = None
+        self.phases.append(record)
+        self._current = None
+
+    def _save_profile(self, number, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = ''.join(c if c.isalnum() else '_' for c in name.lower()).strip('_')
+        path = os.path.join(PROFILE_DIR, f"{self.script}_{number:02d}_{slug}.prof")
+        self._profiler.dump_stats(path)
+        stats = pstats.Stats(self._profiler)
+        top = []
+        for (filename, line, function), (_, calls, _, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP]:
+            top.append({'function': f"{os.path.basename(filename)}:{line}({function})",
+                        'calls': calls, 'cumulative_seconds': round(cumulative, 4)})
+        return {'path': path, 'top': top}
+
+    def finish(self, path=None):
+        """Close the last phase, print a timing table and write the manifest"""
+        self._finish_phase()
+        path = path or f"{self.script}_run_manifest.json"
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak_rss *= 1024  # kilobytes on Linux, bytes on macOS
+        manifest = {
+            'script': self.script,
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._started_wall, 4),
+            'cpu_seconds': round(time.process_time() - self._started_cpu, 4),
+            'peak_rss_mb': round(peak_rss / MB, 1),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'settings': self.settings,
+            'phases': self.phases,
+            'outputs': [{'path': p, 'bytes': os.path.getsize(p)}
+                        for p in self.outputs if os.path.exists(p)],
+        }
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+
+        print(f"\nPhase timings (wall / CPU / peak traced memory):")
+        for record in self.phases:
+            memory = (f"{record['peak_traced_mb']:>8.1f} MB"
+                      if record['peak_traced_mb'] is not None else "       - MB")
+            rows = f"  {record['rows']:,} rows" if record['rows'] is not None else ""
+            print(f"   {record['name']:<34} {record['wall_seconds']:>8.2f}s "
+                  f"{record['cpu_seconds']:>8.2f}s {memory}{rows}")
+        print(f"   Run manifest: {path}")
+        return manifest
+
+
+def git_commit():
+    """Current commit of the repository, if it can be read"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,160 @@
+"""
+Cached Pipeline Runner
+
+Runs the pipeline as stages and skips every stage whose inputs have not
+changed since a previous run:
+
+    collect      01_collect_reddit_posts.py (only with --collect; never cached,
+                 its corpus is the input everything else is keyed on)
+    normalize    lowercased title + text buffer of the corpus, shared by 02 and 03
+    thematic     02_thematic_coding.py (coding, quote extraction, reports)
+    deep_dive    03_deep_dive_search.py (coding, context quotes, report)
+    trends       update_trends.py (never cached, it only codes posts its trend
+                 stores have not counted yet)
+
+A script stage is keyed on the corpus content (and the comment table, for
+the deep dive), its codebook file, the environment settings that change its
+outputs, and the source of the script and of every local module it imports.
+On a hit the stored report files are copied back instead of running the
+script. When a script does run, its
+coding and sentence splitting are cached inside it as well (see
+stage_cache), so tweaking one codebook recodes only that codebook and leaves
+the other analysis, the normalized text and the sentence table untouched.
+
+Examples:
+    python code/run_pipeline.py
+    CODEBOOK=my_variant.yaml python code/run_pipeline.py --stages thematic
+    python code/run_pipeline.py --collect --force
+
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+
+from codebook import load_codebook
+from corpus_io import COMMENTS_CORPUS, THEMED_CORPUS
+from stage_cache import (CODE_DIR, STAGE_CACHE_DIR, StageCache, code_digest, compact_corpus,
+                         corpus_key, file_digest, stage_key)
+
+SCRIPT_STAGES = {
+    'thematic': {
+        'script': '02_thematic_coding.py',
+        'codebook': ('CODEBOOK', 'care_work_themes'),
+        'settings': ['MATCH_MODE', 'NEAR_DUPLICATES', 'QUOTE_RANKING', 'REPORT_SIDECAR'],
+    },
+    'deep_dive': {
+        'script': '03_deep_dive_search.py',
+        'codebook': ('DEEP_DIVE_CODEBOOK', 'stress_mental_health'),
+        'settings': ['MATCH_MODE', 'NEAR_DUPLICATES', 'QUOTE_RANKING', 'REPORT_SIDECAR'],
+        'inputs': [COMMENTS_CORPUS],
+    },
+}
+STAGES = ['collect', 'normalize'] + list(SCRIPT_STAGES) + ['trends']
+
+parser = argparse.ArgumentParser(description="Run the pipeline, reusing cached stage outputs")
+parser.add_argument('--stages', nargs='+', default=STAGES[1:], choices=STAGES,
+                    help="stages to run (default: all but collect)")
+parser.add_argument('--collect', action='store_true', help="collect posts from Reddit first")
+parser.add_argument('--force', action='store_true', help="run the selected stages even if cached")
+parser.add_argument('--cache-dir', default=STAGE_CACHE_DIR or '.stage_cache',
+                    help="stage cache directory")
+args = parser.parse_args()
+
+stages = [name for name in STAGES if name in args.stages or (name == 'collect' and args.collect)]
+
+
+def local_imports(script):
+    """Files of the local modules a script imports, followed recursively"""
+    found = []
+    pending = [os.path.join(CODE_DIR, script)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.append(path)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = os.path.join(CODE_DIR, name.split('.')[0] + '.py')
+                if os.path.exists(module_path):
+                    pending.append(module_path)
+    return sorted(found)
+
+
+def run_script(script, env):
+    """Run a pipeline script; returns the output files listed in its run manifest"""
+    subprocess.run([sys.executable, os.path.join(CODE_DIR, script)], env=env, check=True)
+    manifest_path = f"{os.path.splitext(script)[0]}_run_manifest.json"
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return [output['path'] for output in manifest['outputs']] + [manifest_path]
+
+
+# ============================================
+# RUN STAGES
+# ============================================
+print("="*60)
+print("PIPELINE RUN")
+print("="*60)
+
+cache = StageCache(args.cache_dir)
+env = dict(os.environ, STAGE_CACHE_DIR=args.cache_dir)
+summary = []
+
+for name in stages:
+    print(f"\n[{name}]")
+    started = time.perf_counter()
+    key = None
+
+    if name in ('collect', 'trends'):
+        script = '01_collect_reddit_posts.py' if name == 'collect' else 'update_trends.py'
+        subprocess.run([sys.executable, os.path.join(CODE_DIR, script)], env=env, check=True)
+        status = 'ran'
+
+    elif name == 'normalize':
+        hits = len(cache.hits)
+        posts = compact_corpus(THEMED_CORPUS, columns=['id'], cache=cache)
+        status = 'cached' if len(cache.hits) > hits else 'ran'
+        print(f"   {len(posts)} posts normalized ({status})")
+
+    else:
+        stage = SCRIPT_STAGES[name]
+        variable, default = stage['codebook']
+        codebook = load_codebook(os.getenv(variable, default))
+        key = stage_key(name,
+                        corpus=corpus_key(THEMED_CORPUS),
+                        codebook=file_digest(codebook.path),
+                        settings={s: os.getenv(s) for s in stage['settings']},
+                        inputs={path: file_digest(path) for path in stage.get('inputs', [])
+                                if os.path.exists(path)},
+                        code=code_digest(*local_imports(stage['script'])))
+        restored = None if args.force else cache.restore_files(name, key)
+        if restored is not None:
+            status = 'cached'
+            print(f"   {codebook}: inputs unchanged, restored {len(restored)} files")
+            for path in restored:
+                print(f"      {path}")
+        else:
+            cache.store_files(name, key, run_script(stage['script'], env))
+            status = 'ran'
+
+    summary.append((name, status, time.perf_counter() - started, key))
+
+# ============================================
+# SUMMARY
+# ============================================
+print(f"\nStages (cache: {args.cache_dir}):")
+for name, status, seconds, key in summary:
+    print(f"   {name:<10} {status:<7} {seconds:>8.2f}s  {key[:12] if key else ''}")
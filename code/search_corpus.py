@@ -0,0 +1,47 @@
+"""
+Ad Hoc Search over the Collected Corpus
+
+Answers exploratory questions from the persistent inverted index instead of
+copying the deep-dive script and rescanning every post. The index is built
+on first use and rebuilt whenever the corpus file is newer than it.
+
+Examples:
+    python code/search_corpus.py 'stress NEAR/5 quit'
+    python code/search_corpus.py '"short staffed" AND NOT overtime' --year 2023
+    python code/search_corpus.py '(therapy OR counseling) app' --min-engagement 20
+
+"""
+
+import argparse
+import time
+
+from corpus_io import THEMED_CORPUS, read_corpus
+from inverted_index import load_or_build
+
+parser = argparse.ArgumentParser(description="Search the collected posts")
+parser.add_argument('query', help="query with AND/OR/NOT, \"phrases\" and NEAR/k")
+parser.add_argument('--corpus', default=THEMED_CORPUS, help="Parquet corpus to search")
+parser.add_argument('--year', type=int, action='append', help="only posts from this year (repeatable)")
+parser.add_argument('--min-engagement', type=int, help="only posts with score + comments >= N")
+parser.add_argument('--limit', type=int, default=20, help="number of posts to show")
+args = parser.parse_args()
+
+index = load_or_build(args.corpus)
+
+started = time.perf_counter()
+try:
+    docs = index.search(args.query, years=args.year, min_engagement=args.min_engagement)
+except ValueError as error:
+    print(f"ERROR: {error}")
+    exit(1)
+elapsed = (time.perf_counter() - started) * 1000
+
+print(f"{len(docs)} of {len(index)} posts match ({elapsed:.1f} ms)")
+
+if docs:
+    shown = [index.ids[doc] for doc in docs[:args.limit]]
+    posts = read_corpus(args.corpus, columns=['id', 'title', 'score', 'num_comments', 'year'])
+    posts = posts.set_index('id').loc[shown]
+    for post_id, post in posts.iterrows():
+        engagement = post['score'] + post['num_comments']
+        print(f"  [{post_id}] {post['year']} engagement={engagement}  {post['title'][:80]}")
@@ -0,0 +1,103 @@
+"""
+Sentence Index Shared by the Quote Extractors
+
+Segments each post once per run and caches the result by post id and a
+hash of its text. Segmentation is the same rough `[.!?]+` split the scripts
+have always used; the index stores the delimiter offsets and a lowercase
+view of the post, so quote extractors can take sentences, lowercase
+sentences or any window of the text without splitting it again.
+
+"""
+
+import re
+
+SENTENCE_DELIMITER = re.compile(r'[.!?]+')
+
+
+class PostSentences:
+    """Sentence offsets and lowercase view of one post"""
+
+    def __init__(self, text):
+        self.text = text
+        self.lower = text.lower()
+        # Offsets line up only when lowercasing keeps the length (it does
+        # for nearly all text; a few characters such as 'İ' expand)
+        self._aligned = len(self.lower) == len(text)
+        self.delimiters = [m.span() for m in SENTENCE_DELIMITER.finditer(text)]
+
+        starts = [0] + [end for _, end in self.delimiters]
+        ends = [start for start, _ in self.delimiters] + [len(text)]
+        self.spans = list(zip(starts, ends))
+
+    @property
+    def sentences(self):
+        """Same pieces as re.split(r'[.!?]+', text)"""
+        return [self.text[a:b] for a, b in self.spans]
+
+    @property
+    def sentences_lower(self):
+        if self._aligned:
+            return [self.lower[a:b] for a, b in self.spans]
+        return [piece.lower() for piece in self.sentences]
+
+    def window_pieces(self, start, end):
+        """Pieces of re.split(r'[.!?]+', snippet) for a '...'-marked window
+
+        `snippet` is text[start:end].strip(), with '...' added before it when
+        start > 0 and after it when end < len(text), exactly as the context
+        quote extractor builds it. The pieces are cut from the cached
+        delimiter offsets instead of splitting the snippet again.
+        """
+        text = self.text
+        window = text[start:end]
+        s0 = start + (len(window) - len(window.lstrip()))
+        s1 = max(s0, start + len(window.rstrip()))
+        prefix = start > 0
+        suffix = end < len(text)
+
+        pieces = []
+        pos = s0
+        last_delimiter_end = None
+        if prefix:
+            pieces.append('')  # before the leading '...'
+            last_delimiter_end = s0
+        for a, b in self.delimiters:
+            if b <= s0 or a >= s1:
+                continue
+            a, b = max(a, s0), min(b, s1)
+            if a == last_delimiter_end:
+                # Touches the previous delimiter ('...' + '.'), so one run
+                last_delimiter_end = b
+                pos = b
+                continue
+            pieces.append(text[pos:a])
+            pos = b
+            last_delimiter_end = b
+
+        if suffix:
+            if last_delimiter_end != s1:
+                pieces.append(text[pos:s1])
+            pieces.append('')  # after the trailing '...'
+        else:
+            pieces.append(text[pos:s1])
+        return pieces
+
+
+class SentenceIndex:
+    """Cache of PostSentences keyed by post id and content hash"""
+
+    def __init__(self):
+        self._cache = {}
+        self.segmented = 0
+
+    def get(self, post_id, text):
+        key = (post_id, hash(text))
+        entry = self._cache.get(key)
+        if entry is None or entry.text != text:
+            entry = PostSentences(text)
+            self._cache[key] = entry
+            self.segmented += 1
+        return entry
+
+    def __len__(self):
+        return len(self._cache)
@@ -0,0 +1,251 @@
+"""
+Content-Addressed Stage Cache
+
+Every cached stage output is stored under a key that hashes everything the
+output depends on: the stage name, the content of its input files, its
+parameters and the code that computes it. A re-run with the same inputs
+loads the stored output; changing any of them (a codebook keyword, the match
+mode, the corpus, a helper module) gives a new key, so only the stages that
+depend on the change are computed again. Old entries are never overwritten,
+which lets codebook variants share one cache.
+
+Outputs are kept under STAGE_CACHE_DIR (default `.stage_cache/`), as Parquet
+files for in-process stages (normalization, near-duplicate detection, coding,
+sentence splitting) and
+as copies of output files for whole-script stages run by run_pipeline.py.
+Set STAGE_CACHE_DIR to an empty string to turn caching off.
+
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compact_corpus import CompactCorpus, TextColumn, normalized_text
+from corpus_io import THEMED_CORPUS, read_corpus, read_corpus_table
+from near_duplicates import near_duplicate_clusters
+
+STAGE_CACHE_DIR = os.getenv('STAGE_CACHE_DIR', '.stage_cache')
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Bump when the normalized text columns are built differently
+NORMALIZE_VERSION = 2
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoized per size and modification time"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+
+def code_digest(*modules):
+    """Hash of helper modules in code/, given as module names or file paths"""
+    digest = hashlib.sha256()
+    for module in modules:
+        path = module if module.endswith('.py') else os.path.join(CODE_DIR, module + '.py')
+        digest.update(file_digest(path).encode('ascii'))
+    return digest.hexdigest()
+
+
+def source_digest(*functions):
+    """Hash of the source of functions, e.g. ones defined in a pipeline script"""
+    digest = hashlib.sha256()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_key(stage, **parts):
+    """Cache key of a stage output from its inputs, parameters and code"""
+    payload = json.dumps({'stage': stage, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """Stage outputs stored by key under one cache directory"""
+
+    def __init__(self, root=STAGE_CACHE_DIR):
+        self.root = root
+        self.hits = []
+        self.misses = []
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key[:32])
+
+    def frame(self, stage, key, compute):
+        """DataFrame for the key, loaded from the cache or computed and stored"""
+        if not self.root:
+            return compute()
+        path = self.path(stage, key) + '.parquet'
+        if os.path.exists(path):
+            self.hits.append(stage)
+            return pd.read_parquet(path)
+        self.misses.append(stage)
+        df = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        return df
+
+    def table(self, stage, key, compute):
+        """Arrow table for the key, loaded from the cache or computed and stored"""
+        if not self.root:
+            return compute()
+        path = self.path(stage, key) + '.parquet'
+        if os.path.exists(path):
+            self.hits.append(stage)
+            return pq.read_table(path)
+        self.misses.append(stage)
+        table = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        return table
+
+    def restore_files(self, stage, key):
+        """Copy the stored output files of a stage back; None if not cached"""
+        if not self.root:
+            return None
+        directory = self.path(stage, key)
+        manifest = os.path.join(directory, 'outputs.json')
+        if not os.path.exists(manifest):
+            return None
+        with open(manifest) as f:
+            outputs = json.load(f)
+        for i, target in enumerate(outputs):
+            shutil.copy2(os.path.join(directory, str(i)), target)
+        self.hits.append(stage)
+        return outputs
+
+    def store_files(self, stage, key, outputs):
+        """Keep copies of the output files of a stage under its key"""
+        self.misses.append(stage)
+        if not self.root:
+            return
+        directory = self.path(stage, key)
+        temp_directory = directory + '.tmp'
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(temp_directory)
+        for i, source in enumerate(outputs):
+            shutil.copy2(source, os.path.join(temp_directory, str(i)))
+        with open(os.path.join(temp_directory, 'outputs.json'), 'w') as f:
+            json.dump(list(outputs), f, indent=2)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temp_directory, directory)
+
+
+def corpus_key(path=THEMED_CORPUS):
+    """Content hash of the corpus file (None for a legacy Excel-only corpus)"""
+    return file_digest(path) if os.path.exists(path) else None
+
+
+def compact_corpus(path=THEMED_CORPUS, columns=None, cache=None):
+    """CompactCorpus of the corpus file, with its text normalized once per corpus
+
+    The normalized text buffer is cached by corpus content, so the thematic
+    and deep-dive scripts share one normalization pass; `columns` selects
+    the corpus columns kept next to it.
+    """
+    cache = cache or StageCache()
+    key = corpus_key(path)
+    if key is None:
+        # Legacy Excel-only corpus
+        table = pa.Table.from_pandas(read_corpus(path), preserve_index=False)
+        lower = normalized_text(table)
+        if columns is not None:
+            table = table.select(list(columns))
+        return CompactCorpus.from_table(table, lower)
+
+    def normalize():
+        lower = normalized_text(read_corpus_table(path, columns=['title', 'text']))
+        return pa.table({'full_text_lower': lower.array})
+
+    normalized = cache.table('normalize', stage_key('normalize', corpus=key,
+                                                    version=NORMALIZE_VERSION), normalize)
+    return CompactCorpus.from_table(read_corpus_table(path, columns=columns),
+                                    TextColumn(normalized.column('full_text_lower')))
+
+
+def near_duplicate_table(posts, corpus, cache=None):
+    """Near-duplicate cluster columns of a CompactCorpus, cached per corpus
+
+    See near_duplicates. `posts` needs its id and created_date columns; the
+    frame is aligned with its rows.
+    """
+    cache = cache or StageCache()
+
+    def detect():
+        return near_duplicate_clusters(posts['id'], posts['created_date'], posts.lower)
+
+    if corpus is None:
+        return detect()
+    key = stage_key('near_duplicates', corpus=corpus,
+                    code=code_digest('near_duplicates', 'compact_corpus', 'term_frequency'))
+    return cache.frame('near_duplicates', key, detect)
+
+
+def subset_key(corpus, mask):
+    """Cache key of the posts of a corpus selected by a boolean mask
+
+    None when the corpus itself has no key.
+    """
+    if corpus is None:
+        return None
+    rows = np.packbits(np.asarray(mask, dtype=bool)).tobytes()
+    return stage_key('subset', corpus=corpus, rows=hashlib.sha256(rows).hexdigest())
+
+
+def coded_flags(codebook, matcher, texts, corpus, coder=None, cache=None):
+    """Category flags of a codebook (requires rules applied), cached per corpus
+
+    `texts` are the lowercased posts (a TextColumn or any sequence of
+    strings); returns a boolean DataFrame in codebook order. The key covers
+    the corpus hash, the codebook digest, the match mode and the matching
+    and requires-rule code, so a codebook tweak recodes only that codebook.
+    """
+    cache = cache or StageCache()
+
+    def code():
+        flags = (coder or matcher).flag_matrix(texts)
+        return pd.DataFrame(codebook.apply_requirements(flags), columns=list(codebook.categories))
+
+    if corpus is None:
+        return code()
+    key = stage_key('coding', corpus=corpus, codebook=codebook.digest, mode=matcher.mode,
+                    code=code_digest('keyword_matcher', 'term_frequency', 'codebook',
+                                     'parallel_coding'))
+    return cache.frame('coding', key, code)
+
+
+def sentence_table(compute, corpus, cache=None, helpers=()):
+    """Candidate sentence frame of the corpus (see quote_extraction.sentence_frame)
+
+    Sentence splitting depends only on the corpus text, so the frame is
+    cached per corpus and shared by every codebook variant. The key also
+    covers the source of `compute` and of the script functions it calls
+    (`helpers`), besides the splitting modules.
+    """
+    cache = cache or StageCache()
+    if corpus is None:
+        return compute()
+    key = stage_key('sentences', corpus=corpus,
+                    code=code_digest('quote_extraction', 'sentence_index', 'compact_corpus',
+                                     'parallel_coding'),
+                    functions=source_digest(compute, *helpers))
+    return cache.frame('sentences', key, compute)
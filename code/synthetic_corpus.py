@@ -0,0 +1,158 @@
+"""
+Seeded Synthetic r/CNA Corpus for Benchmarks
+
+Generates posts that look like the collected corpus to the pipeline: the same
+columns and types, long-tailed text lengths (including title-only posts),
+heavy-tailed engagement, dates spread over the collection window, and theme
+keywords from the shipped codebooks inserted into post bodies at roughly the
+rates observed in the preliminary run (see outputs/summary_statistics.md). Filler text is drawn
+from a Zipf-weighted vocabulary of everyday care-work words.
+
+The same seed and size always give the same corpus, so benchmark results are
+comparable between versions. Large corpora are generated and written in
+chunks to keep memory flat.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from codebook import load_codebook
+from corpus_io import CorpusWriter
+
+GENERATOR_VERSION = 1
+CHUNK_POSTS = 20000
+
+FILLER_WORDS = """
+i the to and a my of it in is that was for me on but with at they have so
+just we this be not you are do all up get work like what one when out about
+shift resident residents patient patients nurse nurses cna cnas floor hall
+facility night day today week time people back know going can would there
+if or some their been had because now how really said call told said them
+an still even her his she he after before day off home care aides aide bed
+room lift change shower meal tray vitals chart charting state survey unit
+hospital ltc memory assisted living family families supervisor manager don
+boss coworker coworkers new first last long hours year years month months
+morning evening weekend weekends agency travel certified license class
+training orientation clinical test skills job jobs place places building
+""".split()
+
+# Approximate share of posts mentioning each theme, after the preliminary
+# run; themes not listed there get DEFAULT_THEME_RATE
+THEME_RATES = {
+    'wellness_app_mentioned': 0.016,
+    'wellness_app_abandoned': 0.005,
+    'job_search_tech': 0.31,
+    'scheduling_issues': 0.44,
+    'pay_financial_stress': 0.45,
+    'burnout_exhaustion': 0.21,
+    'peer_support_seeking': 0.30,
+    'employer_program': 0.03,
+    'stress_general': 0.08,
+    'mental_health_explicit': 0.058,
+    'mental_health_conditions': 0.10,
+    'coping_mentioned': 0.225,
+    'exercise_hobbies': 0.187,
+    'leave_quit': 0.31,
+}
+DEFAULT_THEME_RATE = 0.05
+
+PUNCTUATION = ['.', '.', '.', '?', '!', '...']
+
+CODEBOOKS = ('care_work_themes', 'stress_mental_health')
+START = pd.Timestamp('2022-01-01')
+END = pd.Timestamp('2024-10-31')
+
+
+def theme_keywords(codebooks=CODEBOOKS):
+    """(rate, keywords) per category of the given codebooks"""
+    themes = {}
+    for name in codebooks:
+        for category, info in load_codebook(name).categories.items():
+            themes[category] = (THEME_RATES.get(category, DEFAULT_THEME_RATE),
+                                list(info['keywords']))
+    return list(themes.values())
+
+
+class SyntheticCorpus:
+    """Deterministic generator of r/CNA-like posts"""
+
+    def __init__(self, seed=0, codebooks=CODEBOOKS):
+        self.seed = seed
+        self.themes = theme_keywords(codebooks)
+        self.rates = np.array([rate for rate, _ in self.themes])
+        self.vocabulary = np.array(FILLER_WORDS)
+        ranks = np.arange(1, len(self.vocabulary) + 1)
+        self.weights = 1 / ranks ** 1.1
+        self.weights /= self.weights.sum()
+
+    def frame(self, n_posts, offset=0):
+        """DataFrame of posts offset .. offset + n_posts - 1"""
+        rng = np.random.default_rng([self.seed, offset])
+        # Text length in words: log-normal (median ~60), a fifth title-only
+        lengths = np.minimum(rng.lognormal(4.1, 0.9, n_posts).astype(int), 3000)
+        lengths[rng.random(n_posts) < 0.2] = 0
+        title_lengths = rng.integers(3, 13, n_posts)
+
+        # Random draws for the whole chunk at once, consumed post by post
+        filler = rng.choice(self.vocabulary, size=int(lengths.sum() + title_lengths.sum()),
+                            p=self.weights).tolist()
+        mentions = rng.random((n_posts, len(self.themes))) < self.rates
+        n_sentences = int(lengths.sum() // 5 + len(self.themes) * n_posts // 5 + n_posts)
+        sentence_lengths = iter(rng.integers(5, 21, n_sentences).tolist())
+        endings = iter(rng.choice(PUNCTUATION, n_sentences).tolist())
+        picks = iter(rng.random(2 * int(mentions.sum())).tolist())
+
+        titles, texts = [], []
+        position = 0
+        for row in range(n_posts):
+            title = filler[position:position + title_lengths[row]]
+            position += title_lengths[row]
+            words = filler[position:position + lengths[row]]
+            position += lengths[row]
+
+            # Theme keywords go into the body (or the title of title-only posts)
+            target = words if words else title
+            for theme in np.flatnonzero(mentions[row]):
+                keywords = self.themes[theme][1]
+                keyword = keywords[int(next(picks) * len(keywords))]
+                target.insert(int(next(picks) * (len(target) + 1)), keyword)
+
+            title = ' '.join(title)
+            titles.append(title[:1].upper() + title[1:])
+            sentences = []
+            start = 0
+            while start < len(words):
+                end = start + next(sentence_lengths)
+                sentence = ' '.join(words[start:end])
+                sentences.append(sentence[:1].upper() + sentence[1:] + next(endings))
+                start = end
+            texts.append(' '.join(sentences))
+
+        # Engagement: heavy-tailed scores, comments loosely tied to score
+        score = np.floor(rng.pareto(1.3, n_posts) * 5).astype(np.int64)
+        num_comments = np.floor(score * rng.uniform(0.05, 0.6, n_posts)
+                                + rng.poisson(3, n_posts)).astype(np.int64)
+        span = (END - START).total_seconds()
+        created = START + pd.to_timedelta(np.sort(rng.uniform(0, span, n_posts)), unit='s')
+        ids = [np.base_repr(offset + i + 36 ** 5, 36).lower() for i in range(n_posts)]
+
+        df = pd.DataFrame({
+            'id': ids,
+            'title': titles,
+            'text': texts,
+            'score': score,
+            'num_comments': num_comments,
+            'created_date': created.floor('s'),
+            'url': [f"https://reddit.com/r/CNA/comments/{post_id}/" for post_id in ids],
+        })
+        df['year'] = df['created_date'].dt.year
+        df['engagement'] = df['score'] + df['num_comments']
+        return df
+
+    def write(self, path, n_posts, chunk_posts=CHUNK_POSTS):
+        """Generate n_posts in chunks straight into a Parquet corpus file"""
+        with CorpusWriter(path) as writer:
+            for offset in range(0, n_posts, chunk_posts):
+                writer.write(self.frame(min(chunk_posts, n_posts - offset), offset))
+        return path
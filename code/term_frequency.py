@@ -0,0 +1,109 @@
+"""
+Term Frequency Engine for Word Counts
+
+Tokenizes each post once and resolves every target term, single words and
+multi-word phrases alike, in that same pass over the tokens. Counts are
+kept per post, so the engine reports both corpus totals (how often a term is
+used) and document frequencies (how many posts use it) without joining the
+corpus into one large string or scanning it once per term.
+
+Tokens are runs of word characters, which gives the same whole-word matching
+as the word-boundary regexes used before. Phrases match as consecutive tokens.
+
+`substring_totals` keeps plain substring counts ('stress' also inside
+'stressed'), for reports that count the way the substring codebooks match.
+
+"""
+
+import re
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text (empty for missing values)"""
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TermCounts:
+    """Corpus totals and document frequencies for a set of terms"""
+
+    def __init__(self):
+        self.totals = Counter()
+        self.doc_freq = Counter()
+        self.n_docs = 0
+
+    def add(self, post_counts):
+        self.n_docs += 1
+        self.totals.update(post_counts)
+        self.doc_freq.update(post_counts.keys())
+
+    def merge(self, other):
+        """Combine counts from another chunk of the corpus"""
+        self.n_docs += other.n_docs
+        self.totals.update(other.totals)
+        self.doc_freq.update(other.doc_freq)
+        return self
+
+    def group_totals(self, term_groups):
+        """Sum of term totals per group, e.g. {'Stress terms': 42}"""
+        return {group: sum(self.totals[term] for term in terms)
+                for group, terms in term_groups.items()}
+
+
+def substring_totals(texts, term_groups):
+    """Substring occurrences of each group's terms, summed per group
+
+    `texts` is a TextColumn or a list of strings. Each post is counted on its
+    own, so a phrase never matches across two posts.
+    """
+    array = texts.array if hasattr(texts, 'array') else pa.array(texts, pa.large_string())
+    return {group: sum(pc.sum(pc.count_substring(array, term)).as_py() or 0 for term in terms)
+            for group, terms in term_groups.items()}
+
+
+class TermFrequencyEngine:
+    """One-pass counter for a fixed vocabulary of words and phrases"""
+
+    def __init__(self, term_groups):
+        # term_groups: {group_name: [term, ...]}; terms may contain spaces
+        self.term_groups = term_groups
+        self.unigrams = {}  # token -> term
+        self.phrases = {}  # first token -> [(token tuple, term), ...]
+        for terms in term_groups.values():
+            for term in terms:
+                tokens = tuple(tokenize(term))
+                if len(tokens) == 1:
+                    self.unigrams[tokens[0]] = term
+                elif tokens:
+                    self.phrases.setdefault(tokens[0], []).append((tokens, term))
+
+    def count_tokens(self, tokens):
+        """Counter of target-term occurrences in one tokenized post"""
+        counts = Counter()
+        unigrams, phrases = self.unigrams, self.phrases
+        for i, token in enumerate(tokens):
+            if token in unigrams:
+                counts[unigrams[token]] += 1
+            candidates = phrases.get(token)
+            if candidates:
+                for phrase, term in candidates:
+                    if tuple(tokens[i:i + len(phrase)]) == phrase:
+                        counts[term] += 1
+        return counts
+
+    def count_text(self, text):
+        return self.count_tokens(tokenize(text))
+
+    def count_texts(self, texts):
+        """TermCounts over an iterable of post texts"""
+        result = TermCounts()
+        for text in texts:
+            result.add(self.count_text(text))
+        return result
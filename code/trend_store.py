@@ -0,0 +1,196 @@
+"""
+Materialized Theme Trends by Week and Month
+
+SQLite store of pre-aggregated post counts per time bucket and theme for
+one codebook, so trend reports and dashboards read a few hundred rows
+instead of rescanning and recoding the coded corpus. Each bucket keeps the
+number of posts created in it and, per theme, how many of them were
+flagged; weeks start on Monday and buckets are labelled by their first day.
+
+Updates are incremental. The store remembers which post ids it has counted,
+so adding a corpus only codes and counts the posts that are new since the
+last update, and their counts are added to the existing buckets with
+upserts. A post is counted once, in the bucket of its created date. The
+store is tied to the codebook digest and match mode it was built with; when
+either changes, the aggregates start over.
+
+Prevalence, rolling windows and year-over-year changes are computed from
+the aggregates when they are read.
+
+"""
+
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from cooccurrence import group_counts, theme_matrix
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    freq TEXT,
+    bucket TEXT,
+    posts INTEGER,
+    PRIMARY KEY (freq, bucket)
+);
+CREATE TABLE IF NOT EXISTS theme_counts (
+    freq TEXT,
+    bucket TEXT,
+    theme TEXT,
+    count INTEGER,
+    PRIMARY KEY (freq, bucket, theme)
+);
+CREATE TABLE IF NOT EXISTS counted (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Bucket frequency -> pandas period, and buckets per year for year-over-year
+FREQUENCIES = {'week': 'W-SUN', 'month': 'M'}
+BUCKETS_PER_YEAR = {'week': 52, 'month': 12}
+
+
+def bucket_labels(dates, freq):
+    """First day ('YYYY-MM-DD') of the week or month of each date"""
+    periods = pd.to_datetime(pd.Series(dates)).dt.to_period(FREQUENCIES[freq])
+    return periods.dt.start_time.dt.strftime('%Y-%m-%d')
+
+
+class TrendStore:
+    """Bucket-by-theme post counts of one codebook, updated incrementally"""
+
+    def __init__(self, path, codebook, mode):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.themes = list(codebook.categories)
+        self.key = f"{codebook.name} v{codebook.version} {codebook.digest[:12]} {mode}"
+        # Aggregates of another codebook version or match mode are not comparable
+        self.rebuilt = self._meta('codebook') not in (None, self.key)
+        if self.rebuilt:
+            with self.conn:
+                for table in ('buckets', 'theme_counts', 'counted'):
+                    self.conn.execute(f"DELETE FROM {table}")
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('codebook', ?)", (self.key,))
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        """Number of posts counted"""
+        return self.conn.execute("SELECT COUNT(*) FROM counted").fetchone()[0]
+
+    def _meta(self, name):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def updated(self):
+        """UTC timestamp of the last update (None before the first)"""
+        value = self._meta('updated')
+        return float(value) if value is not None else None
+
+    def new_ids(self, ids):
+        """Boolean mask of the ids that have not been counted yet"""
+        ids = pd.Series(ids, dtype=object)
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM incoming")
+            self.conn.executemany("INSERT OR IGNORE INTO incoming VALUES (?)",
+                                  ((post_id,) for post_id in ids))
+            fresh = {row[0] for row in self.conn.execute(
+                "SELECT id FROM incoming WHERE id NOT IN (SELECT id FROM counted)")}
+        return ids.isin(fresh).to_numpy()
+
+    def add(self, ids, dates, flags):
+        """Count new posts: their ids, created dates and (posts x themes) flags
+
+        `flags` is a boolean array or DataFrame in codebook order. Posts
+        without a created date are remembered but not counted in any bucket.
+        """
+        dates = pd.to_datetime(pd.Series(dates)).reset_index(drop=True)
+        dated = dates.notna().to_numpy()
+        matrix = theme_matrix(flags)[np.flatnonzero(dated)]
+        bucket_rows = []
+        count_rows = []
+        for freq in FREQUENCIES:
+            table = group_counts(matrix, self.themes, bucket_labels(dates[dated], freq))
+            sizes = table.drop_duplicates('group')
+            bucket_rows += [(freq, label, int(n))
+                            for label, n in zip(sizes['group'], sizes['posts'])]
+            count_rows += [(freq, label, theme, int(n)) for label, theme, n
+                           in zip(table['group'], table['theme'], table['count'])]
+        # Counts and ids in one transaction, so a post is never counted twice
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO buckets (freq, bucket, posts) VALUES (?, ?, ?)
+                ON CONFLICT (freq, bucket) DO UPDATE SET posts = posts + excluded.posts
+            """, bucket_rows)
+            self.conn.executemany("""
+                INSERT INTO theme_counts (freq, bucket, theme, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (freq, bucket, theme) DO UPDATE SET count = count + excluded.count
+            """, count_rows)
+            self.conn.executemany("INSERT OR IGNORE INTO counted VALUES (?)",
+                                  ((post_id,) for post_id in ids))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)",
+                              (str(time.time()),))
+        return int(dated.sum())
+
+    def counts(self, freq):
+        """Wide table of one frequency: bucket start (index), posts and one column per theme
+
+        Buckets without posts between the first and last are filled with
+        zeros, so rolling windows and year-over-year shifts line up.
+        """
+        buckets = pd.read_sql_query(
+            "SELECT bucket, posts FROM buckets WHERE freq = ? ORDER BY bucket",
+            self.conn, params=(freq,))
+        counts = pd.read_sql_query(
+            "SELECT bucket, theme, count FROM theme_counts WHERE freq = ?",
+            self.conn, params=(freq,))
+        table = counts.pivot(index='bucket', columns='theme', values='count')
+        table = buckets.set_index('bucket').join(table).fillna(0)
+        table = table.reindex(columns=['posts'] + self.themes, fill_value=0).astype(np.int64)
+        table.index = pd.to_datetime(table.index)
+        if len(table):
+            periods = pd.period_range(table.index.min(), table.index.max(),
+                                      freq=FREQUENCIES[freq])
+            table = table.reindex(periods.start_time, fill_value=0)
+        table.index.name = 'bucket'
+        return table
+
+    def trends(self, freq, themes=None, window=None):
+        """Long table of theme prevalence per bucket
+
+        Columns: bucket, theme, posts, count and percentage; with `window`,
+        rolling_percentage over that many buckets (pooled counts, so quiet
+        weeks weigh less); and yoy_change, the percentage minus that of the
+        bucket a year earlier (52 weeks or 12 months), in percentage points.
+        """
+        table = self.counts(freq)
+        posts = table['posts']
+        frames = []
+        for theme in (self.themes if themes is None else themes):
+            count = table[theme]
+            percentage = (count / posts * 100).where(posts > 0)
+            frame = pd.DataFrame({
+                'bucket': table.index,
+                'theme': theme,
+                'posts': posts.to_numpy(),
+                'count': count.to_numpy(),
+                'percentage': percentage.round(1).to_numpy(),
+            })
+            if window:
+                pooled = (count.rolling(window, min_periods=window).sum()
+                          / posts.rolling(window, min_periods=window).sum() * 100)
+                frame['rolling_percentage'] = pooled.round(1).to_numpy()
+            yoy = percentage - percentage.shift(BUCKETS_PER_YEAR[freq])
+            frame['yoy_change'] = yoy.round(1).to_numpy()
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
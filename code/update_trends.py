@@ -0,0 +1,124 @@
+"""
+Incremental Theme Trends over Time
+
+Adds the posts of the themed corpus that have not been counted yet to the
+trend store of each codebook (see trend_store), then reports weekly or
+monthly theme prevalence with a rolling window and the change against the
+same time a year earlier. Only new posts are read in full and coded; the
+report itself is computed from the stored aggregates.
+
+Examples:
+    python code/update_trends.py
+    python code/update_trends.py --freq week --themes burnout_exhaustion leave_quit
+    python code/update_trends.py --export theme_trends.xlsx
+
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from codebook import load_codebook
+from compact_corpus import normalized_text
+from corpus_io import THEMED_CORPUS, read_corpus_table
+from report_writer import ExcelReport
+from trend_store import FREQUENCIES, TrendStore
+
+# One store per codebook; '{codebook}' is replaced by the codebook name
+TREND_STORE = os.getenv('TREND_STORE', '{codebook}_trends.sqlite')
+
+# MATCH_MODE=token matches whole words only (default: the codebook's mode)
+MATCH_MODE = os.getenv('MATCH_MODE') or None
+
+# Rolling window in buckets when --window is not given
+DEFAULT_WINDOWS = {'week': 4, 'month': 3}
+
+parser = argparse.ArgumentParser(description="Update and report theme trends")
+parser.add_argument('--codebook', action='append',
+                    help="codebook name or path (repeatable; default: the 02 and 03 codebooks)")
+parser.add_argument('--corpus', default=THEMED_CORPUS, help="Parquet corpus to add")
+parser.add_argument('--freq', default='month', choices=list(FREQUENCIES), help="bucket size")
+parser.add_argument('--window', type=int, help="rolling window in buckets (default: 4 weeks / 3 months)")
+parser.add_argument('--themes', nargs='+', help="themes to show bucket by bucket")
+parser.add_argument('--last', type=int, default=12, help="buckets to show per theme")
+parser.add_argument('--export', help="also write weekly and monthly trend tables to this .xlsx")
+args = parser.parse_args()
+
+codebook_names = args.codebook or [os.getenv('CODEBOOK', 'care_work_themes'),
+                                   os.getenv('DEEP_DIVE_CODEBOOK', 'stress_mental_health')]
+window = args.window or DEFAULT_WINDOWS[args.freq]
+
+print("="*60)
+print("THEME TRENDS")
+print("="*60)
+
+if not os.path.exists(args.corpus):
+    print(f"ERROR: {args.corpus} not found (run 01_collect_reddit_posts.py first)")
+    exit(1)
+
+# ============================================
+# COUNT NEW POSTS
+# ============================================
+corpus = read_corpus_table(args.corpus, columns=['id', 'created_date'])
+ids = corpus.column('id').to_pylist()
+print(f"\n1. Adding new posts from {args.corpus} ({len(ids)} posts)...")
+
+stores = []
+posts = None
+for name in codebook_names:
+    codebook = load_codebook(name)
+    matcher = codebook.matcher(mode=MATCH_MODE)
+    store = TrendStore(TREND_STORE.replace('{codebook}', codebook.name), codebook, matcher.mode)
+    if store.rebuilt:
+        print(f"   {codebook}: codebook or match mode changed, counting from scratch")
+    new = store.new_ids(ids)
+    if new.any():
+        # Only the new posts are coded
+        if posts is None:
+            posts = read_corpus_table(args.corpus, columns=['id', 'title', 'text', 'created_date'])
+        added = posts.filter(pa.array(new))
+        flags = codebook.apply_requirements(matcher.flag_matrix(normalized_text(added)))
+        store.add(added.column('id').to_pylist(), added.column('created_date').to_pandas(), flags)
+    print(f"   {codebook}: {int(new.sum())} new posts counted, {len(store)} in {store.path}")
+    stores.append((codebook, store))
+
+# ============================================
+# REPORT
+# ============================================
+print(f"\n2. Theme prevalence by {args.freq} ({window}-{args.freq} rolling, change vs a year earlier)")
+
+for codebook, store in stores:
+    trends = store.trends(args.freq, window=window)
+    print(f"\n   {codebook}:")
+    if trends.empty:
+        print("      no dated posts yet")
+        continue
+    latest = trends['bucket'].max()
+    for row in trends[trends['bucket'] == latest].itertuples():
+        rolling = f"{row.rolling_percentage:.1f}%" if not np.isnan(row.rolling_percentage) else "n/a"
+        yoy = f"{row.yoy_change:+.1f} pts" if not np.isnan(row.yoy_change) else "n/a"
+        print(f"      {row.theme:<28} {latest:%Y-%m-%d}: {row.percentage:5.1f}%  "
+              f"(rolling {rolling}, year-over-year {yoy})")
+
+    for theme in args.themes or []:
+        if theme not in store.themes:
+            continue
+        print(f"\n      {theme}, last {args.last} {args.freq}s:")
+        recent = trends[trends['theme'] == theme].tail(args.last)
+        for row in recent.itertuples():
+            share = f"{row.percentage:5.1f}%" if not np.isnan(row.percentage) else "    -"
+            print(f"         {row.bucket:%Y-%m-%d}  {row.count:>6} of {row.posts:<6} {share}")
+
+if args.export:
+    with ExcelReport(args.export) as report:
+        for codebook, store in stores:
+            for freq in FREQUENCIES:
+                freq_window = window if freq == args.freq else DEFAULT_WINDOWS[freq]
+                report.add_sheet(f"{codebook.name[:22]}_{freq}",
+                                 store.trends(freq, window=freq_window))
+    print(f"\n✓ Trend tables saved to: {args.export}")
+
+for _, store in stores:
+    store.close()
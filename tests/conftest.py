@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline scripts import their helper modules from code/ directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code'))
@@ -0,0 +1,176 @@
+"""fetch_listings against a fake listing server: paging, early stops, dedup and pacing"""
+
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from collection import (CollectionWindow, DedupIndex, RateLimitScheduler, fetch_listings,
+                        walk_listing)
+
+
+class FakeListingServer:
+    """Serves listings of fake submissions a page at a time, counting page requests"""
+
+    def __init__(self, listings, page_size=100):
+        self.listings = listings  # name -> list of posts, in listing order
+        self.page_size = page_size
+        self.pages = {name: 0 for name in listings}
+        self.auth = SimpleNamespace(limits={})
+
+    def listing(self, name):
+        def pages():
+            posts = self.listings[name]
+            for start in range(0, len(posts), self.page_size):
+                self.pages[name] += 1
+                yield from posts[start:start + self.page_size]
+        return pages()
+
+    def job(self, name):
+        return (name, self, lambda reddit: reddit.listing(name))
+
+
+class FakeClock:
+    """Clock that only moves when the scheduler sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def posts(prefix, count, newest=1_700_000_000, step=3600):
+    """Newest-first fake submissions, one per `step` seconds"""
+    return [SimpleNamespace(id=f"{prefix}{i}", created_utc=newest - i * step) for i in range(count)]
+
+
+def to_record(post):
+    return {'id': post.id, 'created_utc': post.created_utc}
+
+
+def unlimited():
+    return RateLimitScheduler(requests_per_minute=60000, burst=1000)
+
+
+def test_walk_listing_takes_one_token_per_page():
+    server = FakeListingServer({'new': posts('n', 250)})
+    scheduler = unlimited()
+    walked = list(walk_listing(server.listing('new'), scheduler))
+    assert [post.id for post in walked] == [f"n{i}" for i in range(250)]
+    assert server.pages['new'] == 3
+    assert scheduler.requests == 3
+
+
+def test_fetch_listings_walks_every_page():
+    server = FakeListingServer({'new': posts('n', 230), 'top': posts('t', 120)})
+    records, stats = fetch_listings([server.job('new'), server.job('top')], to_record,
+                                    DedupIndex(), unlimited())
+    assert len(records) == 350
+    assert [r['id'] for r in records[:3]] == ['n0', 'n1', 'n2']
+    assert stats['new'] == {'fetched': 230, 'kept': 230, 'discarded': 0, 'stopped_early': False}
+    assert server.pages == {'new': 3, 'top': 2}
+
+
+def test_stop_at_known_post_stops_paging():
+    server = FakeListingServer({'new': posts('n', 500)})
+    records, stats = fetch_listings([server.job('new')], to_record, DedupIndex(), unlimited(),
+                                    stop_at={'new': {'n150'}})
+    assert [r['id'] for r in records] == [f"n{i}" for i in range(150)]
+    assert stats['new']['stopped_early']
+    assert server.pages['new'] == 2  # pages 3-5 are never requested
+
+
+def test_chronological_listing_stops_below_window():
+    newest = 1_700_000_000
+    server = FakeListingServer({'new': posts('n', 500, newest=newest),
+                                'top': posts('t', 300, newest=newest)})
+    window = CollectionWindow(start=datetime.fromtimestamp(newest - 120 * 3600))
+    records, stats = fetch_listings([server.job('new'), server.job('top')], to_record,
+                                    DedupIndex(), unlimited(), window=window)
+    assert stats['new']['stopped_early']
+    assert stats['new']['kept'] == 121
+    assert server.pages['new'] == 2
+    # 'top' is not sorted by date, so it is walked to the end and filtered
+    assert not stats['top']['stopped_early']
+    assert stats['top']['kept'] == 121 and stats['top']['discarded'] == 179
+    assert all(window.contains(r['created_utc']) for r in records)
+
+
+def test_posts_in_several_listings_are_kept_once():
+    shared = posts('s', 50)
+    server = FakeListingServer({'new': shared + posts('n', 30), 'hot': posts('h', 20) + shared,
+                                'top': shared[::-1]})
+    dedup = DedupIndex(['n0'])  # already stored
+    records, stats = fetch_listings([server.job('new'), server.job('hot'), server.job('top')],
+                                    to_record, dedup, unlimited())
+    ids = [r['id'] for r in records]
+    assert len(ids) == len(set(ids)) == 50 + 29 + 20
+    assert 'n0' not in ids
+    assert sum(s['kept'] for s in stats.values()) == len(ids)
+    assert len(dedup) == 100
+
+
+def test_token_bucket_paces_requests():
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(requests_per_minute=60, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+        scheduler.acquire()
+    # Two from the burst, then one per second
+    assert clock.now == 4.0
+    assert scheduler.requests == 6
+    assert scheduler.waited == 4.0
+
+
+def test_fetch_listings_pacing_with_fake_clock():
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(requests_per_minute=120, burst=1, clock=clock, sleep=clock.sleep)
+    server = FakeListingServer({'new': posts('n', 450)})
+    fetch_listings([server.job('new')], to_record, DedupIndex(), scheduler)
+    # 5 page requests: the first from the burst, the rest half a second apart
+    assert scheduler.requests == 5
+    assert clock.now == 2.0
+
+
+def test_shard_scheduler_draws_from_parent():
+    clock = FakeClock()
+    parent = RateLimitScheduler(requests_per_minute=60, burst=1, clock=clock, sleep=clock.sleep)
+    shards = [RateLimitScheduler(requests_per_minute=6000, burst=100, clock=clock,
+                                 sleep=clock.sleep, parent=parent) for _ in range(2)]
+    for shard in shards * 2:
+        shard.acquire()
+    assert parent.requests == 4
+    assert clock.now == 3.0
+
+
+def test_rate_limit_headers_never_raise_rate_above_budget():
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(requests_per_minute=60, burst=1, clock=clock, sleep=clock.sleep)
+    # A fresh window: 1000 requests left for 600 s would allow 1.67 per second
+    scheduler.observe({'remaining': 1000, 'reset_timestamp': time.time() + 600, 'used': 0})
+    assert scheduler.rate == 1.0
+    for _ in range(4):
+        scheduler.acquire()
+    assert clock.now == 3.0
+    # A nearly spent window slows the bucket below the budget
+    scheduler.observe({'remaining': 60, 'reset_timestamp': time.time() + 600, 'used': 940})
+    assert abs(scheduler.rate - 0.1) < 0.01
+
+
+def test_waited_is_wall_clock_time_not_summed_per_thread():
+    scheduler = RateLimitScheduler(requests_per_minute=1200, burst=1)  # one per 50 ms
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [scheduler.acquire() for _ in range(3)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    assert scheduler.requests == 12
+    assert 0.4 <= scheduler.waited <= elapsed + 0.01
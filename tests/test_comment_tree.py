@@ -0,0 +1,58 @@
+"""collect_comments against a fake client: a failing post does not stop the others"""
+
+from types import SimpleNamespace
+
+from collection import RateLimitScheduler
+from comment_tree import collect_comments
+
+
+class FakeComment(SimpleNamespace):
+    pass
+
+
+class FakeSubmission:
+    def __init__(self, post_id, comments, error=None):
+        self.id = post_id
+        self._comments = comments
+        self._error = error
+        self.comment_sort = None
+
+    @property
+    def comments(self):
+        if self._error is not None:
+            raise self._error
+        return self._comments
+
+
+class FakeReddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.auth = SimpleNamespace(limits={})
+
+    def submission(self, id):
+        return self.submissions[id]
+
+
+def comments_of(post_id, n):
+    return [FakeComment(id=f"{post_id}c{i}", parent_id=f"t3_{post_id}", body=f"reply {i}",
+                        score=i, created_utc=1700000000 + i, replies=[])
+            for i in range(n)]
+
+
+def test_failed_post_is_reported_and_the_others_are_kept(capsys):
+    submissions = {
+        'a': FakeSubmission('a', comments_of('a', 3)),
+        'gone': FakeSubmission('gone', [], error=LookupError('received 404 HTTP response')),
+        'b': FakeSubmission('b', comments_of('b', 2)),
+    }
+    done = []
+    records, stats = collect_comments(['a', 'gone', 'b'], lambda: FakeReddit(submissions),
+                                      RateLimitScheduler(requests_per_minute=6000, burst=100),
+                                      workers=2, on_post_done=lambda post_id, _: done.append(post_id))
+
+    assert [record['post_id'] for record in records] == ['a'] * 3 + ['b'] * 2
+    assert stats['failed'] == ['gone']
+    assert stats['comments'] == 5
+    assert stats['requests'] == 3
+    assert sorted(done) == ['a', 'b']
+    assert 'gone' in capsys.readouterr().out
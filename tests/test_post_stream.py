@@ -0,0 +1,60 @@
+"""Streaming top-N heap against the in-memory engagement ranking"""
+
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from post_stream import StreamSummary, rank_by_engagement
+
+TEXT = "long enough to count as a substantive post, not just a title line here"
+
+
+def tied_posts(n=60, seed=3):
+    """Posts with few distinct engagement values and dates, so most ranks tie"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        created = start + timedelta(days=rng.randrange(3))
+        rows.append({'id': f"p{rng.randrange(10 ** 6):06d}{i}", 'title': 'title',
+                     'text': TEXT if i % 7 else 'short', 'score': rng.randrange(3),
+                     'num_comments': rng.randrange(2), 'created_date': created,
+                     'year': created.year})
+    return pd.DataFrame(rows).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def in_memory_top(posts, top_n):
+    """The in-memory export: substantive posts, ranked, first top_n"""
+    substantive = posts[posts['text'].str.len() > 50].copy()
+    substantive['engagement'] = substantive['score'] + substantive['num_comments']
+    return rank_by_engagement(substantive).head(top_n)
+
+
+def streamed_top(posts, top_n, chunk_rows):
+    summary = StreamSummary(top_n=top_n)
+    for start in range(0, len(posts), chunk_rows):
+        summary.add_frame(posts.iloc[start:start + chunk_rows])
+    return pd.DataFrame(summary.top_records())
+
+
+def test_stream_and_in_memory_top_posts_match_on_ties():
+    posts = tied_posts()
+    expected = in_memory_top(posts, 20)
+    assert expected['engagement'].duplicated().any()  # the data really has ties
+    for chunk_rows in (1, 7, len(posts)):
+        top = streamed_top(posts, 20, chunk_rows)
+        assert top['id'].tolist() == expected['id'].tolist()
+        assert top['engagement'].tolist() == expected['engagement'].tolist()
+
+
+def test_ties_rank_newest_first_then_by_id():
+    posts = pd.DataFrame({
+        'id': ['b', 'a', 'c', 'd'], 'title': 't', 'text': TEXT,
+        'score': [5, 5, 5, 9], 'num_comments': 0,
+        'created_date': [datetime(2024, 1, 1), datetime(2024, 1, 1),
+                         datetime(2024, 1, 2), datetime(2023, 1, 1)],
+        'year': 2024,
+    })
+    assert streamed_top(posts, 3, 1)['id'].tolist() == ['d', 'c', 'a']
+    assert in_memory_top(posts, 3)['id'].tolist() == ['d', 'c', 'a']